@@ -2,10 +2,10 @@
 
 import itertools
 import pathlib
-import re
 import shutil
+import time
 import json
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import control
 import joblib
@@ -13,16 +13,21 @@ import numpy as np
 import pandas
 import pykoop
 import scipy.linalg
+import sklearn.metrics
 from cmcrameri import cm as cmc
 from matplotlib import pyplot as plt
 
+import dataset_store
+import dtw_kmeans
+import episode_embedding
 import obs_syn
 import onesine
+import phase_estimation
+import raw_dataset
+import synthetic_dataset
 import tf_cover
-from tslearn.utils import to_time_series_dataset
 from tslearn.clustering import TimeSeriesKMeans
-from tslearn.barycenters import dtw_barycenter_averaging
-from tslearn.metrics import dtw
+from tslearn.utils import to_time_series_dataset
 
 # Number of training episodes
 N_TRAIN = 18
@@ -65,161 +70,275 @@ if usetex:
 def action_preprocess_experiments(
     raw_dataset_path: pathlib.Path,
     preprocessed_dataset_path: pathlib.Path,
+    n_jobs: int = 1,
+    incremental: bool = False,
+    compact: bool = False,
 ):
-    """Preprocess raw data into pickle containing a dataframe."""
-    preprocessed_dataset_path.parent.mkdir(parents=True, exist_ok=True)
-    gear_ratio = 1 / 100
-    rad_per_deg = 2 * np.pi / 360
-    t_step = 1e-3
-    dfs = []
-    for path in itertools.chain(
-        raw_dataset_path.joinpath("population").iterdir(),
-        raw_dataset_path.joinpath("outliers").iterdir(),
+    """Preprocess one raw data batch into partitions of a dataset store.
+
+    Each unit's episodes are stored in their own partition,
+    ``<preprocessed_dataset_path>/<serial_no>/``, and the partitions are
+    listed in ``partitions.json``. If ``incremental`` is true and the batch
+    was ingested before, only episode files that were added or changed since
+    the last run are parsed, and only the partitions they belong to are
+    rewritten. Ingested files are tracked in ``manifest.json``. If
+    ``compact`` is true, partitions use compact dtypes (see
+    :mod:`dataset_store`). Changing it forces a full re-ingest.
+    """
+    manifest_path = preprocessed_dataset_path.joinpath("manifest.json")
+    listing_path = preprocessed_dataset_path.joinpath(dataset_store.PARTITIONS_FILE)
+    t_step = raw_dataset.T_STEP
+    episodes = raw_dataset.find_episodes(raw_dataset_path)
+    if (
+        incremental
+        and manifest_path.exists()
+        and listing_path.exists()
+        and json.loads(listing_path.read_text())["compact"] == compact
     ):
-        # Skip path that's not a directory
-        if not path.is_dir():
-            continue
-        # Set up regex (e.g., 20221220T101041_001002_noload)
-        pattern = re.compile(r"^(\d\d\d\d\d\d\d\dT\d\d\d\d\d\d)_(\d\d\d\d\d\d)_(.*)$")
-        match = pattern.match(path.stem)
-        # Skip if no match
-        if match is None:
+        manifest = json.loads(manifest_path.read_text())
+    else:
+        manifest = {}
+        # Start over from an empty batch directory
+        shutil.rmtree(preprocessed_dataset_path, ignore_errors=True)
+    preprocessed_dataset_path.mkdir(parents=True, exist_ok=True)
+    to_parse, removed, new_manifest = raw_dataset.diff_manifest(
+        raw_dataset_path,
+        episodes,
+        manifest,
+    )
+    dfs = raw_dataset.load_episodes(to_parse, t_step=t_step, n_jobs=n_jobs)
+    # Group changes by partition. Episodes are sorted by
+    # ``(serial_no, load, episode)`` and parsed results come back in that
+    # order, so concatenating them yields sorted partitions.
+    changed = {}
+    for ep, df in zip(to_parse, dfs):
+        changed.setdefault(ep[0], []).append(df)
+    removed_keys = {}
+    for key in removed:
+        removed_keys.setdefault(key[0], []).append(key)
+    digests = raw_dataset.partition_digests(new_manifest)
+    for serial_no in sorted(set(changed) | set(removed_keys)):
+        partition_path = preprocessed_dataset_path.joinpath(serial_no)
+        if serial_no not in digests:
+            # All of the unit's files were removed
+            shutil.rmtree(partition_path, ignore_errors=True)
             continue
-        # Get metadata
-        timestamp = match[1]
-        serial_no = match[2]
-        load = match[3] == "load"
-        # Parse episodes
-        for file in sorted(path.glob("*.csv")):
-            # Get episode
-            ep = int(str(file)[-7:-4])
-            # Load data
-            array = np.loadtxt(
-                file,
-                delimiter=",",
-                skiprows=1,
+        new_df = None
+        if serial_no in changed:
+            new_df = pandas.concat(changed[serial_no])
+            new_df.attrs["t_step"] = t_step
+        if dataset_store.meta_path(partition_path).exists():
+            dataset_store.upsert(
+                new_df,
+                partition_path,
+                remove=removed_keys.get(serial_no, []),
             )
-            # Select and shift columns to align them in time, due to bug in
-            # data acquisition software
-            joint_posvel_raw = array[:-1, 1:3] * gear_ratio * rad_per_deg
-            joint_trq_raw = array[:-1, [3]] / 100  # Percent to normalized
-            target_joint_posvel_raw = array[1:, 4:6] * gear_ratio * rad_per_deg
-            # Calibrate for initial position offset due to bug in data
-            # acquisition software
-            error_raw = target_joint_posvel_raw - joint_posvel_raw
-            error_offset = np.mean(error_raw[500:1000, :], axis=0)
-            # Apply offset and remove first second of recording where velocity
-            # is zero
-            joint_posvel = joint_posvel_raw[1000:, :] + error_offset
-            error_offset[1] = 0
-            joint_trq = joint_trq_raw[1000:, :]
-            target_joint_posvel = target_joint_posvel_raw[1000:, :]
-            # Create ``DataFrame``
-            df_dict = {
-                "k": np.arange(target_joint_posvel.shape[0]),
-                "t": np.arange(target_joint_posvel.shape[0]) * t_step,
-                "joint_pos": joint_posvel[:, 0],
-                "joint_vel": joint_posvel[:, 1],
-                "joint_trq": joint_trq[:, 0],
-                "target_joint_pos": target_joint_posvel[:, 0],
-                "target_joint_vel": target_joint_posvel[:, 1],
-            }
-            df = pandas.DataFrame(df_dict)
-            df["serial_no"] = serial_no
-            df["load"] = load
-            df["episode"] = ep
-            df["timestamp"] = timestamp
-            dfs.append(df)
-    merged_df = pandas.concat(dfs)
-    merged_df.attrs["t_step"] = t_step
-    merged_df.sort_values(
-        by=["serial_no", "load", "episode", "k"],
-        inplace=True,
-    )
-    joblib.dump(merged_df, preprocessed_dataset_path)
+        else:
+            dataset_store.write(new_df, partition_path, compact=compact)
+    # Only rewrite the listing if the batch changed, since downstream tasks
+    # depend on it
+    listing = {"compact": compact, "partitions": digests}
+    if not listing_path.exists() or json.loads(listing_path.read_text()) != listing:
+        listing_path.write_text(json.dumps(listing))
+    manifest_path.write_text(json.dumps(new_manifest))
+
+def action_generate_synthetic_dataset(
+    batch_path: pathlib.Path,
+    synthetic_path: pathlib.Path,
+    config: Dict[str, Any],
+):
+    """Generate a synthetic raw data batch for scaling benchmarks.
+
+    The configuration and the parameters drawn for each unit are saved in
+    ``synthetic_path``.
+    """
+    shutil.rmtree(batch_path, ignore_errors=True)
+    units = synthetic_dataset.generate_batch(batch_path, **config)
+    synthetic_path.write_text(json.dumps({"config": config, "units": units}, indent=4))
+
+
+def action_benchmark_csv_reader(
+    raw_dataset_path: pathlib.Path,
+    benchmark_path: pathlib.Path,
+    max_files: int = 100,
+    n_repeats: int = 3,
+):
+    """Benchmark raw CSV parsing throughput of each CSV engine.
+
+    Each engine reads the same files, after a warm-up pass so that all of
+    them read from the page cache. ``baseline`` is the previous reader, which
+    parsed every column with ``numpy.loadtxt``. The best of ``n_repeats``
+    passes is reported in MB/s and files/s, along with the largest difference
+    between each engine's output and the baseline.
+    """
+    benchmark_path.parent.mkdir(parents=True, exist_ok=True)
+    files = [ep[-1] for ep in raw_dataset.find_episodes(raw_dataset_path)]
+    files = files[:max_files]
+    n_bytes = sum(file.stat().st_size for file in files)
+    for file in files:
+        file.read_bytes()
+    readers = {
+        "baseline": lambda file: np.loadtxt(file, delimiter=",", skiprows=1)[
+            :, raw_dataset.RAW_COLUMNS
+        ],
+        "loadtxt": lambda file: raw_dataset.read_raw(file, engine="loadtxt"),
+        "pandas": lambda file: raw_dataset.read_raw(file, engine="pandas"),
+    }
+    results = {"n_files": len(files), "megabytes": n_bytes / 1e6, "engines": {}}
+    arrays = {}
+    for engine, reader in readers.items():
+        best = np.inf
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            arrays[engine] = [reader(file) for file in files]
+            best = min(best, time.perf_counter() - start)
+        max_diff = max(
+            (
+                float(np.max(np.abs(a - b), initial=0))
+                for a, b in zip(arrays[engine], arrays["baseline"])
+            ),
+            default=0,
+        )
+        results["engines"][engine] = {
+            "seconds": best,
+            "megabytes_per_second": n_bytes / 1e6 / best,
+            "files_per_second": len(files) / best,
+            "max_abs_difference": max_diff,
+        }
+    baseline_seconds = results["engines"]["baseline"]["seconds"]
+    for engine_results in results["engines"].values():
+        engine_results["speedup"] = baseline_seconds / engine_results["seconds"]
+    benchmark_path.write_text(json.dumps(results, indent=4))
+
 
 def action_one_step_DTW_K_means_clustering(
     dataset_path: pathlib.Path,
     clusters_path: pathlib.Path,
     cluster_preds_path: pathlib.Path,
     cluster_split_info: pathlib.Path,
+    clustering_report_path: pathlib.Path,
     k: int,
     features_to_cluster: list,  # List of features to cluster, e.g. ['joint_pos', 'joint_vel']
-    
+    solver: str = "pruned",
+    dtw_band: Optional[Dict[str, Any]] = None,
+    paa_factor: int = 10,
+    minibatch_size: int = 64,
+    distances_dir: Optional[pathlib.Path] = None,
+    n_jobs: int = 1,
+    batches: Optional[List[str]] = None,
 ):
     cluster_split_info.parent.mkdir(parents=True, exist_ok=True)
     max_iter=3
     t_step = 1e-3
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     time_series = ['joint_pos', 'joint_vel', 'joint_trq', 'target_joint_pos', 
                    'target_joint_vel']
-    serial_nos = np.unique(dataset['serial_no'])
+    serial_nos = np.unique(dataset.episodes['serial_no'])
     test_dataset_serial_no=np.random.choice(np.setdiff1d(serial_nos,['000000']), 2, replace=False)
     train_dataset_serial_no=np.setdiff1d(serial_nos, test_dataset_serial_no)
-    episodes=np.unique(dataset['episode'])
+    episodes=np.unique(dataset.episodes['episode'])
     test_episodes=np.random.choice(episodes, 2, replace=False)
     train_episodes=np.setdiff1d(episodes, test_episodes)
     
-    gp_dataset = dataset[(dataset['serial_no'].isin(train_dataset_serial_no)) & 
-                     (dataset['episode'].isin(train_episodes))].groupby(by=["serial_no", "load", "episode"])
-    #gp_dataset = dataset.groupby(by=["serial_no", "load", "episode"])
-    gp_info=np.array(list(gp_dataset.groups.keys()))
+    gp_keys, ts_data = dataset.to_tensor(time_series,
+                                         serial_no=train_dataset_serial_no,
+                                         episode=train_episodes)
+    gp_info=np.array(gp_keys)
     wh_data = []
     n_wh_data = []
     other_center_parts = []
     for cluster_base in features_to_cluster:
         ocp=list(set(time_series) - set(cluster_base))
         other_center_parts.append(ocp)
-        ts_data=[]
-        for part in cluster_base:
-            x=[]
-            for i, dataset_ep in gp_dataset:
-                x.append(dataset_ep[part].to_list())
-            ts_data.append(to_time_series_dataset(x))
-        wh_data.append(np.concatenate(ts_data,2))
-        n_ts_data=[]
-        for part in ocp:
-            x=[]
-            for i, dataset_ep in gp_dataset:
-                x.append(dataset_ep[part].to_list())
-            ts_data.append(to_time_series_dataset(x))
-        n_wh_data.append(np.concatenate(n_ts_data,2))
+        wh_data.append(ts_data[:,:,[time_series.index(part) for part in cluster_base]])
+        n_wh_data.append(ts_data[:,:,[time_series.index(part) for part in ocp]])
     
-
-    km = TimeSeriesKMeans(n_clusters=k, verbose=True, max_iter=max_iter, 
-                          metric='dtw', random_state=0, n_jobs=4)
+    # Clusterings are independent jobs. The cores are split between them and
+    # the DTW computations within each one
+    n_cores = joblib.effective_n_jobs(n_jobs)
+    n_outer = min(len(features_to_cluster), n_cores)
+    n_inner = max(1, n_cores // n_outer)
+    # The embeddings only depend on the velocity error, whatever the features,
+    # so they are computed and clustered once for all clusterings
+    embedding_model = None
+    if solver == "embedding":
+        embeddings = episode_embedding.embed(
+            ts_data[:, :, time_series.index("joint_vel")],
+            ts_data[:, :, time_series.index("target_joint_vel")],
+            t_step,
+        )
+        embedding_mean, embedding_std = episode_embedding.standardization(embeddings)
+        embedding_model = episode_embedding.KMeans(n_clusters=k, random_state=0).fit(
+            episode_embedding.standardize(embeddings, embedding_mean, embedding_std)
+        )
+    distances_paths = [None] * len(features_to_cluster)
+    if solver == "kmedoids":
+        distances_paths = [
+            dtw_kmeans.distances_path(distances_dir, cluster_base, dtw_band, batches)
+            for cluster_base in features_to_cluster
+        ]
+    results = joblib.Parallel(n_jobs=n_outer)(
+        joblib.delayed(_cluster_episodes)(
+            i,
+            cluster_base,
+            wh_data[i],
+            other_center_parts[i],
+            n_wh_data[i],
+            k,
+            solver,
+            dtw_band,
+            paa_factor,
+            minibatch_size,
+            gp_keys,
+            distances_paths[i],
+            max_iter,
+            embedding_model,
+            n_inner,
+        )
+        for i, cluster_base in enumerate(features_to_cluster)
+    )
+    report = []
     y_preds_dict={"serial_no":[], "load":[], "episode":[], "clustering_no":[],
-                  "center_no":[]}
+                  "center_no":[], "distance":[], "fitted":[]}
     centers_dict={'k':[], 't':[], 'joint_pos':[], 'joint_vel':[], 'joint_trq':[], 
                   'target_joint_pos':[], 'target_joint_vel':[], 'clustering_no':[],
                   'center_no':[]}
-    for i, cluster_base in enumerate(zip(features_to_cluster, wh_data)):
-        
-        y_pred=km.fit_predict(cluster_base[1])
+    for i, (y_pred, y_dist, centers, cluster_report) in enumerate(results):
+        cluster_report["n_jobs"] = n_inner
+        report.append(cluster_report)
 
         y_preds_dict["serial_no"].extend(gp_info[:,0])
         y_preds_dict["load"].extend(gp_info[:,1])
         y_preds_dict["episode"].extend(gp_info[:,2])
         y_preds_dict['clustering_no'].extend([i]*y_pred.shape[0])
-        y_preds_dict['center_no'].extend(y_pred.shape)
-
-        for center_num in range(k):
-            size=km.cluster_centers_[center_num].shape[0]
-            k=np.arange(0,size)
-            centers_dict['k'].extend(k)
-            t=k/t_step
+        y_preds_dict['center_no'].extend(y_pred)
+        # Reference for the drift of episodes assigned later
+        y_preds_dict['distance'].extend(y_dist)
+        y_preds_dict['fitted'].extend([True]*y_pred.shape[0])
+
+        for center_num, (center, other) in enumerate(centers):
+            size=center.shape[0]
+            steps=np.arange(0,size)
+            centers_dict['k'].extend(steps)
+            t=steps*t_step
             centers_dict['t'].extend(t)
             centers_dict['clustering_no'].extend([i]*size)
             centers_dict['center_no'].extend([center_num]*size)
-            for j, center_part_name in enumerate(cluster_base[0]):
-                centers_dict[center_part_name].extend(km.cluster_centers_[center_num][:,j])
+            for j, center_part_name in enumerate(features_to_cluster[i]):
+                centers_dict[center_part_name].extend(center[:,j])
             for p, center_name in enumerate(other_center_parts[i]):
-                cl_mems = np.where(y_pred == center_num)[0]
-                centers_dict[center_name].extend(dtw_barycenter_averaging(
-                    n_wh_data[i][cl_mems][:,:,p], max_iter=max_iter)[:,0])
+                centers_dict[center_name].extend(other[:,p])
                 
     df = pandas.DataFrame(centers_dict)
     df.attrs["t_step"] = t_step
+    # Needed to assign new episodes the way they were clustered
+    df.attrs["solver"] = solver
+    if solver == "embedding":
+        df.attrs["embedding"] = {
+            "mean": embedding_mean.tolist(),
+            "std": embedding_std.tolist(),
+            "cluster_centers": embedding_model.cluster_centers_.tolist(),
+        }
     joblib.dump(df, clusters_path)
     
     df = pandas.DataFrame(y_preds_dict)
@@ -238,11 +357,453 @@ def action_one_step_DTW_K_means_clustering(
     
     with cluster_split_info.open('w') as f:
         json.dump(split_info, f)
+
+    with clustering_report_path.open('w') as f:
+        json.dump(report, f, indent=4)
     
 
+def action_assign_new_episodes(
+    dataset_path: pathlib.Path,
+    clusters_path: pathlib.Path,
+    cluster_preds_path: pathlib.Path,
+    cluster_split_info_path: pathlib.Path,
+    assignment_report_path: pathlib.Path,
+    features_to_cluster: list,
+    dtw_band: Optional[Dict[str, Any]] = None,
+    drift_threshold: float = 1.5,
+    n_jobs: int = 1,
+    batches: Optional[List[str]] = None,
+):
+    """Assign episodes that arrived after clustering to the stored centers.
+
+    Training episodes (those not held out by the cluster split) that are not
+    yet in the cluster predictions are assigned to their nearest center with
+    pruned DTW and appended to the predictions. Drift is the RMS DTW distance
+    of all assigned episodes to their centers, relative to that of the
+    episodes the centers were fit on. A refit is recommended in the report
+    once it exceeds ``drift_threshold``.
+
+    Clusters found by the ``embedding`` solver are instead assigned by
+    embedding the new episodes and predicting with the stored k-means, so the
+    labels match those of the fit. No drift is reported for them.
+    """
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    clusters = joblib.load(clusters_path)
+    cluster_preds = joblib.load(cluster_preds_path)
+    with cluster_split_info_path.open('r') as f:
+        test_split = json.load(f)["test"]
+    # Prediction keys are stored as strings
+    assigned = set(
+        cluster_preds[["serial_no", "load", "episode"]]
+        .astype(str)
+        .itertuples(index=False, name=None)
+    )
+    test_serial_nos = set(map(str, test_split["serial_numbers"]))
+    test_episodes = set(map(int, test_split["episodes"]))
+    new_codes = [
+        code
+        for code, (serial_no, load, episode) in enumerate(dataset.index.keys())
+        if serial_no not in test_serial_nos
+        and episode not in test_episodes
+        and (str(serial_no), str(load), str(episode)) not in assigned
+    ]
+    solver = clusters.attrs.get("solver", "pruned")
+    channels = {part for features in features_to_cluster for part in features}
+    if solver == "embedding":
+        channels |= {"joint_vel", "target_joint_vel"}
+    channels = sorted(channels)
+    keys, X = dataset.to_tensor(channels, codes=new_codes)
+    info = np.array(keys)
+    embedding_labels = None
+    if solver == "embedding" and new_codes:
+        # The embedding clusters do not depend on the features, so the new
+        # episodes are embedded and labelled once
+        start = time.perf_counter()
+        embedding = clusters.attrs["embedding"]
+        km = episode_embedding.KMeans(n_clusters=len(embedding["cluster_centers"]))
+        km.cluster_centers_ = np.array(embedding["cluster_centers"])
+        embedding_labels = km.predict(episode_embedding.standardize(
+            episode_embedding.embed(
+                X[:, :, channels.index("joint_vel")],
+                X[:, :, channels.index("target_joint_vel")],
+                clusters.attrs["t_step"],
+            ),
+            np.array(embedding["mean"]),
+            np.array(embedding["std"]),
+        ))
+        embedding_seconds = time.perf_counter() - start
+    report = []
+    new_preds = []
+    for cl_no, features in enumerate(features_to_cluster):
+        preds = cluster_preds.loc[cluster_preds["clustering_no"] == cl_no]
+        centers_df = clusters.loc[clusters["clustering_no"] == cl_no]
+        centers = to_time_series_dataset([
+            center[features].to_numpy()
+            for _, center in centers_df.groupby("center_no", sort=True)
+        ])
+        entry = {
+            "clustering_no": cl_no,
+            "features": list(features),
+            "n_new": len(new_codes),
+        }
+        if new_codes:
+            if embedding_labels is not None:
+                labels = embedding_labels
+                dists = np.full(labels.shape[0], np.nan)
+                entry["seconds"] = embedding_seconds
+            else:
+                start = time.perf_counter()
+                labels, dists, n_dtw = dtw_kmeans.pruned_assignment(
+                    X[:, :, [channels.index(part) for part in features]],
+                    centers,
+                    metric_params=dtw_band,
+                    n_jobs=n_jobs,
+                )
+                entry.update({
+                    "seconds": time.perf_counter() - start,
+                    "n_dtw": n_dtw,
+                })
+            entry["cluster_sizes"] = np.bincount(
+                labels, minlength=centers.shape[0]
+            ).tolist()
+            new_preds.append(pandas.DataFrame({
+                "serial_no": info[:, 0],
+                "load": info[:, 1],
+                "episode": info[:, 2],
+                "clustering_no": cl_no,
+                "center_no": labels,
+                "distance": dists,
+                "fitted": False,
+            }))
+            preds = pandas.concat([preds, new_preds[-1]], ignore_index=True)
+        fitted = preds["fitted"].to_numpy(dtype=bool)
+        distances = preds["distance"].to_numpy(dtype=float)
+        drift = None
+        # Embedding clusters have no DTW distances to compare with
+        if np.any(~fitted) and np.all(np.isfinite(distances[fitted])):
+            drift = float(np.sqrt(
+                np.mean(distances[~fitted]**2) / np.mean(distances[fitted]**2)
+            ))
+        entry.update({
+            "n_assigned": int(np.sum(~fitted)),
+            "drift": drift,
+            "refit_recommended": drift is not None and drift > drift_threshold,
+        })
+        report.append(entry)
+    if new_preds:
+        cluster_preds = pandas.concat([cluster_preds, *new_preds], ignore_index=True)
+        joblib.dump(cluster_preds, cluster_preds_path)
+    assignment_report_path.write_text(json.dumps(report, indent=4))
+
+
+def action_compute_dtw_distances(
+    dataset_path: pathlib.Path,
+    distances_path: pathlib.Path,
+    features: List[str],
+    dtw_band: Optional[Dict[str, Any]] = None,
+    n_jobs: int = 1,
+    batches: Optional[List[str]] = None,
+):
+    """Compute the pairwise DTW distances of every episode.
+
+    The matrix is stored as a ``.npy`` file, with the episode key of each row
+    in a JSON file next to it.
+    """
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    keys, X = dataset.to_tensor(features)
+    dtw_kmeans.pairwise_dtw(X, distances_path, dtw_band, n_jobs=n_jobs)
+    rows = {
+        "features": list(features),
+        "dtw_band": dtw_band,
+        "batches": batches,
+        "keys": [[str(sn), bool(ld), int(ep)] for sn, ld, ep in keys],
+    }
+    distances_path.with_suffix(".json").write_text(json.dumps(rows, indent=4))
+
+
+def action_benchmark_multiresolution_clustering(
+    dataset_path: pathlib.Path,
+    benchmark_path: pathlib.Path,
+    k: int,
+    features_to_cluster: list,
+    paa_factor: int = 10,
+    dtw_band: Optional[Dict[str, Any]] = None,
+    batches: Optional[List[str]] = None,
+    max_iter: int = 3,
+):
+    """Compare multi-resolution and full-resolution DTW k-means.
+
+    Every episode of the dataset is clustered on each feature set, and the
+    wall time and label agreement of both solvers are written to a JSON file.
+    """
+    benchmark_path.parent.mkdir(parents=True, exist_ok=True)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    results = []
+    for features in features_to_cluster:
+        _, X = dataset.to_tensor(features)
+        start = time.perf_counter()
+        full = dtw_kmeans.PrunedTimeSeriesKMeans(
+            n_clusters=k,
+            max_iter=max_iter,
+            metric="dtw",
+            metric_params=dtw_band,
+            random_state=0,
+            n_jobs=-1,
+        ).fit(X)
+        full_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        multires = dtw_kmeans.MultiResolutionKMeans(
+            n_clusters=k,
+            paa_factor=paa_factor,
+            max_iter=max_iter,
+            metric_params=dtw_band,
+            random_state=0,
+            n_jobs=-1,
+        ).fit(X)
+        multires_seconds = time.perf_counter() - start
+        results.append({
+            "features": list(features),
+            "n_series": X.shape[0],
+            "paa_factor": paa_factor,
+            "full_seconds": full_seconds,
+            "multires_seconds": multires_seconds,
+            "speedup": full_seconds / multires_seconds,
+            "label_agreement": dtw_kmeans.label_agreement(
+                full.labels_, multires.labels_
+            ),
+            "n_ambiguous": multires.n_ambiguous_,
+        })
+    benchmark_path.write_text(json.dumps(results, indent=4))
+
+
+def action_sweep_clustering_k(
+    dataset_path: pathlib.Path,
+    distances_dir: pathlib.Path,
+    sweep_path: pathlib.Path,
+    k_values: List[int],
+    features_to_cluster: list,
+    solver: str = "pruned",
+    dtw_band: Optional[Dict[str, Any]] = None,
+    batches: Optional[List[str]] = None,
+    max_iter: int = 3,
+):
+    """Cluster every episode for a range of numbers of clusters.
+
+    The cached pairwise DTW distances of each feature set are shared by every
+    number of clusters. They give the k-means++ seeding, the first assignment,
+    and the silhouette without computing DTW again. The inertia, silhouette,
+    and cluster sizes of each number of clusters are written to a JSON file.
+    """
+    sweep_path.parent.mkdir(parents=True, exist_ok=True)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    results = []
+    for features in features_to_cluster:
+        keys, X = dataset.to_tensor(features)
+        path = dtw_kmeans.distances_path(distances_dir, features, dtw_band, batches)
+        rows = _distance_rows(path, keys)
+        distances = np.load(path, mmap_mode="r")[np.ix_(rows, rows)]
+        for k in k_values:
+            start = time.perf_counter()
+            if solver == "kmedoids":
+                km = dtw_kmeans.KMedoids(n_clusters=k, random_state=0)
+                km.fit(distances)
+            elif solver == "pruned":
+                km = dtw_kmeans.PrunedTimeSeriesKMeans(
+                    n_clusters=k,
+                    max_iter=max_iter,
+                    metric="dtw",
+                    metric_params=dtw_band,
+                    random_state=0,
+                    n_jobs=-1,
+                )
+                km.fit(X, distances=distances)
+            else:
+                raise ValueError(f"Unknown clustering solver '{solver}'.")
+            results.append({
+                "features": list(features),
+                "k": k,
+                "n_series": X.shape[0],
+                "n_iter": int(km.n_iter_),
+                "inertia": float(km.inertia_),
+                "silhouette": float(sklearn.metrics.silhouette_score(
+                    distances, km.labels_, metric="precomputed"
+                )),
+                "cluster_sizes": np.bincount(km.labels_, minlength=k).tolist(),
+                "seconds": time.perf_counter() - start,
+            })
+    sweep_path.write_text(json.dumps(results, indent=4))
+
+
+def action_benchmark_embedding_clustering(
+    dataset_path: pathlib.Path,
+    benchmark_path: pathlib.Path,
+    k: int,
+    features_to_cluster: list,
+    dtw_band: Optional[Dict[str, Any]] = None,
+    batches: Optional[List[str]] = None,
+    max_iter: int = 3,
+):
+    """Compare embedding k-means with DTW k-means.
+
+    Every episode of the dataset is clustered on each feature set with DTW
+    k-means, and on the embedding of its velocity error with Euclidean
+    k-means. The wall time of both, including embedding the episodes, and
+    their label agreement are written to a JSON file.
+    """
+    benchmark_path.parent.mkdir(parents=True, exist_ok=True)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    _, V = dataset.to_tensor(["joint_vel", "target_joint_vel"])
+    results = []
+    for features in features_to_cluster:
+        _, X = dataset.to_tensor(features)
+        start = time.perf_counter()
+        dtw = dtw_kmeans.PrunedTimeSeriesKMeans(
+            n_clusters=k,
+            max_iter=max_iter,
+            metric="dtw",
+            metric_params=dtw_band,
+            random_state=0,
+            n_jobs=-1,
+        ).fit(X)
+        dtw_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        embeddings = episode_embedding.embed(
+            V[:, :, 0], V[:, :, 1], dataset.attrs["t_step"]
+        )
+        embedding = episode_embedding.KMeans(n_clusters=k, random_state=0).fit(
+            episode_embedding.standardize(embeddings)
+        )
+        embedding_seconds = time.perf_counter() - start
+        results.append({
+            "features": list(features),
+            "n_series": X.shape[0],
+            "dtw_seconds": dtw_seconds,
+            "embedding_seconds": embedding_seconds,
+            "speedup": dtw_seconds / embedding_seconds,
+            "label_agreement": dtw_kmeans.label_agreement(
+                dtw.labels_, embedding.labels_
+            ),
+        })
+    benchmark_path.write_text(json.dumps(results, indent=4))
+
+
+def action_benchmark_minibatch_clustering(
+    dataset_path: pathlib.Path,
+    benchmark_path: pathlib.Path,
+    k: int,
+    features_to_cluster: list,
+    minibatch_size: int = 64,
+    dtw_band: Optional[Dict[str, Any]] = None,
+    batches: Optional[List[str]] = None,
+    max_iter: int = 3,
+):
+    """Compare mini-batch and full-batch DTW k-means.
+
+    Every episode of the dataset is clustered on each feature set. The wall
+    time, the inertia, i.e., the mean squared DTW distance of each episode to
+    its final center, and the label agreement of both solvers are written to a
+    JSON file.
+    """
+    benchmark_path.parent.mkdir(parents=True, exist_ok=True)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
+    results = []
+    for features in features_to_cluster:
+        _, X = dataset.to_tensor(features)
+        start = time.perf_counter()
+        full = dtw_kmeans.PrunedTimeSeriesKMeans(
+            n_clusters=k,
+            max_iter=max_iter,
+            metric="dtw",
+            metric_params=dtw_band,
+            random_state=0,
+            n_jobs=-1,
+        ).fit(X)
+        full_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        minibatch = dtw_kmeans.MiniBatchKMeans(
+            n_clusters=k,
+            batch_size=minibatch_size,
+            metric_params=dtw_band,
+            random_state=0,
+            n_jobs=-1,
+        ).fit(X)
+        minibatch_seconds = time.perf_counter() - start
+        # The full-batch inertia is that of the centers before their last
+        # update, so both are evaluated with the final centers
+        full_inertia = np.mean(dtw_kmeans.center_distances(
+            X, full.cluster_centers_, full.labels_, dtw_band, n_jobs=-1
+        )**2)
+        results.append({
+            "features": list(features),
+            "n_series": X.shape[0],
+            "minibatch_size": minibatch_size,
+            "full_seconds": full_seconds,
+            "minibatch_seconds": minibatch_seconds,
+            "speedup": full_seconds / minibatch_seconds,
+            "full_inertia": float(full_inertia),
+            "minibatch_inertia": float(minibatch.inertia_),
+            "inertia_ratio": float(minibatch.inertia_ / full_inertia),
+            "label_agreement": dtw_kmeans.label_agreement(
+                full.labels_, minibatch.labels_
+            ),
+            "n_steps": minibatch.n_iter_,
+        })
+    benchmark_path.write_text(json.dumps(results, indent=4))
+
+
+def action_benchmark_phase_estimation(
+    dataset_path: pathlib.Path,
+    benchmark_path: pathlib.Path,
+    batches: Optional[List[str]] = None,
+):
+    """Compare the closed-form phase estimator with the grid search.
+
+    The phase of every qualifying constant-velocity segment of the dataset is
+    estimated with both methods of :func:`phase_estimation.estimate_phase`.
+    Their wall time and the largest circular difference between their phases,
+    which is bounded by the grid spacing, are written to a JSON file.
+    """
+    benchmark_path.parent.mkdir(parents=True, exist_ok=True)
+    n_phase_samples = 1000
+    segments = []
+    for _, _, segment in _iter_segments(
+        dataset_path,
+        "store",
+        batches,
+        ["joint_pos", "joint_vel", "target_joint_vel"],
+        min_length=600,
+        min_vel=3,
+        trim=100,
+    ):
+        vel_err = segment["joint_vel"] - segment["target_joint_vel"]
+        segments.append((segment["joint_pos"], vel_err / np.max(np.abs(vel_err))))
+    results = {
+        "n_segments": len(segments),
+        "n_samples": sum(pos.shape[0] for pos, _ in segments),
+        "n_phase_samples": n_phase_samples,
+    }
+    optimal_phases = {}
+    for method in ["grid", "closed_form"]:
+        start = time.perf_counter()
+        optimal_phases[method] = np.array([
+            phase_estimation.estimate_phase(pos, err, method, n_phase_samples)[0]
+            for pos, err in segments
+        ])
+        results[f"{method}_seconds"] = time.perf_counter() - start
+    results["speedup"] = results["grid_seconds"] / results["closed_form_seconds"]
+    results["grid_spacing"] = 2 * np.pi / (n_phase_samples - 1)
+    results["max_phase_difference"] = float(np.max(
+        phase_estimation.phase_difference(
+            optimal_phases["grid"], optimal_phases["closed_form"]
+        ),
+        initial=0,
+    ))
+    benchmark_path.write_text(json.dumps(results, indent=4))
+
 def action_compute_cluster_phase(
     clusters_path: pathlib.Path,
     clusters_phase_path: pathlib.Path,
+    method: str = "grid",
 ):
     clusters_phase_path.parent.mkdir(parents=True, exist_ok=True)
     clusters = joblib.load(clusters_path)
@@ -251,54 +812,26 @@ def action_compute_cluster_phase(
     min_vel = 3
     trim = 100
     df_lst = []
-    for i, cluster_ep in clusters.groupby(by=["clustering_no","center_no"]):
-        tvel = cluster_ep["target_joint_vel"].to_numpy()
-        vel = cluster_ep["joint_vel"].to_numpy()
-        tpos = cluster_ep["target_joint_pos"].to_numpy()
-        pos = cluster_ep["joint_pos"].to_numpy()
-        # Find points where velocity changes
-        vel_changes = np.ravel(np.argwhere(np.diff(tvel, prepend=0) != 0))
-        # Split into constant-velocity segments
-        X = np.vstack(
-            [
-                pos,
-                vel,
-                tpos,
-                tvel,
-            ]
-        ).T
-        const_vel_segments = np.split(X, vel_changes)
-        # Find first segment of required length and speed
-        for segment in const_vel_segments:
-            X_const_vel = segment[trim:-trim, :]
-            if segment.shape[0] > min_length:
-                if np.all(segment[:, 3] > min_vel):
-                    direction = "forward"
-                elif np.all(segment[:, 3] < -1 * min_vel):
-                    direction = "reverse"
-                else:
-                    continue
-                # Compute normalized velocity error in that segment
-                vel_err = X_const_vel[:, 1] - X_const_vel[:, 3]
-                norm_vel_err = vel_err / np.max(np.abs(vel_err))
-                # Create array of phases to test
-                phases = np.linspace(0, 2 * np.pi, n_phase_samples)
-                # Compute inner product of error and shifted signal for each phase
-                inner_products = (
-                    np.array(
-                        [
-                            np.sum(norm_vel_err * np.sin(100 * X_const_vel[:, 0] + p))
-                            for p in phases
-                        ]
-                    )
-                    / norm_vel_err.shape[0]
-                )
-                # Find best phase
-                # There are two phases that will work (+ve and -ve correlations)
-                optimal_phase = phases[np.argmax(inner_products)]
-                df_lst.append(
-                    i + (direction, optimal_phase, phases, inner_products),
-                )
+    for i, direction, segment in _iter_center_segments(
+        clusters,
+        ["joint_pos", "joint_vel", "target_joint_vel"],
+        min_length=min_length,
+        min_vel=min_vel,
+        trim=trim,
+    ):
+        # Compute normalized velocity error in that segment
+        vel_err = segment["joint_vel"] - segment["target_joint_vel"]
+        norm_vel_err = vel_err / np.max(np.abs(vel_err))
+        # Find best phase and inner product of error and shifted signal
+        optimal_phase, phases, inner_products = phase_estimation.estimate_phase(
+            segment["joint_pos"],
+            norm_vel_err,
+            method,
+            n_phase_samples,
+        )
+        df_lst.append(
+            i + (direction, optimal_phase, phases, inner_products),
+        )
     df = pandas.DataFrame(
         df_lst,
         columns=[
@@ -320,66 +853,57 @@ def action_compute_cluster_phase(
 def action_compute_phase(
     dataset_path: pathlib.Path,
     phase_path: pathlib.Path,
+    source: str = "store",
+    batches: Optional[List[str]] = None,
+    method: str = "grid",
+    n_jobs: int = 1,
 ):
-    """Compute phase offset."""
+    """Compute phase offset.
+
+    Qualifying constant-velocity segments are read from the segment table
+    of the selected batches of a partitioned dataset store
+    (``source="store"``), or found while streaming the raw batch directories
+    in ``dataset_path`` (``source="raw"``). The phase of each segment is the
+    best of a grid of trial phases (``method="grid"``) or is solved for
+    directly (``method="closed_form"``), see :mod:`phase_estimation`.
+    Episodes are estimated in parallel by ``n_jobs`` worker processes, which
+    receive the position and velocity error arrays of their segments.
+    """
     phase_path.parent.mkdir(parents=True, exist_ok=True)
-    # Load dataset
-    dataset = joblib.load(dataset_path)
     # Settings
     n_phase_samples = 1000
     min_length = 600
     min_vel = 3
     trim = 100
-    # Iterate over episodes
-    df_lst = []
-    for i, dataset_ep in dataset.groupby(by=["serial_no", "load", "episode"]):
-        tvel = dataset_ep["target_joint_vel"].to_numpy()
-        vel = dataset_ep["joint_vel"].to_numpy()
-        tpos = dataset_ep["target_joint_pos"].to_numpy()
-        pos = dataset_ep["joint_pos"].to_numpy()
-        # Find points where velocity changes
-        vel_changes = np.ravel(np.argwhere(np.diff(tvel, prepend=0) != 0))
-        # Split into constant-velocity segments
-        X = np.vstack(
+    # Group qualifying constant-velocity segments by episode, and only ship
+    # their arrays to the workers
+    segments = _iter_segments(
+        dataset_path,
+        source,
+        batches,
+        ["joint_pos", "joint_vel", "target_joint_vel"],
+        min_length=min_length,
+        min_vel=min_vel,
+        trim=trim,
+    )
+    # Results are gathered in submission order
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_episode_phases)(
+            i,
             [
-                pos,
-                vel,
-                tpos,
-                tvel,
-            ]
-        ).T
-        const_vel_segments = np.split(X, vel_changes)
-        # Find first segment of required length and speed
-        for segment in const_vel_segments:
-            X_const_vel = segment[trim:-trim, :]
-            if segment.shape[0] > min_length:
-                if np.all(segment[:, 3] > min_vel):
-                    direction = "forward"
-                elif np.all(segment[:, 3] < -1 * min_vel):
-                    direction = "reverse"
-                else:
-                    continue
-                # Compute normalized velocity error in that segment
-                vel_err = X_const_vel[:, 1] - X_const_vel[:, 3]
-                norm_vel_err = vel_err / np.max(np.abs(vel_err))
-                # Create array of phases to test
-                phases = np.linspace(0, 2 * np.pi, n_phase_samples)
-                # Compute inner product of error and shifted signal for each phase
-                inner_products = (
-                    np.array(
-                        [
-                            np.sum(norm_vel_err * np.sin(100 * X_const_vel[:, 0] + p))
-                            for p in phases
-                        ]
-                    )
-                    / norm_vel_err.shape[0]
-                )
-                # Find best phase
-                # There are two phases that will work (+ve and -ve correlations)
-                optimal_phase = phases[np.argmax(inner_products)]
-                df_lst.append(
-                    i + (direction, optimal_phase, phases, inner_products),
+                (
+                    direction,
+                    segment["joint_pos"],
+                    segment["joint_vel"] - segment["target_joint_vel"],
                 )
+                for _, direction, segment in episode_segments
+            ],
+            method,
+            n_phase_samples,
+        )
+        for i, episode_segments in itertools.groupby(segments, key=lambda s: s[0])
+    )
+    df_lst = [row for episode_rows in results for row in episode_rows]
     df = pandas.DataFrame(
         df_lst,
         columns=[
@@ -395,16 +919,118 @@ def action_compute_phase(
     df.sort_values(
         by=["serial_no", "load", "episode"],
         inplace=True,
+        kind="stable",
     )
     joblib.dump(df, phase_path)
 
+def action_compute_cluster_frequency(
+    clusters_path: pathlib.Path,
+    cluster_frequency_path: pathlib.Path,
+):
+    """Compute the lifting function frequency and phase of each center.
+
+    See :func:`action_compute_frequency`. Barycenters average out the ripple
+    of their members, so the estimates are only meaningful when the centers
+    are episodes, i.e., with the ``"kmedoids"`` and ``"embedding"`` solvers.
+    """
+    cluster_frequency_path.parent.mkdir(parents=True, exist_ok=True)
+    clusters = joblib.load(clusters_path)
+    segments = _iter_center_segments(
+        clusters,
+        ["joint_pos", "joint_vel", "target_joint_vel"],
+        min_length=600,
+        min_vel=3,
+        trim=100,
+    )
+    df_lst = [
+        _ripple_frequency(
+            i,
+            [
+                (segment["joint_pos"], segment["joint_vel"] - segment["target_joint_vel"])
+                for _, _, segment in center_segments
+            ],
+        )
+        for i, center_segments in itertools.groupby(segments, key=lambda s: s[0])
+    ]
+    df = pandas.DataFrame(
+        df_lst,
+        columns=[
+            "clustering_no",
+            "center_no",
+            "n_segments",
+            "frequency",
+            "optimal_phase",
+        ],
+    )
+    df.sort_values(
+        by=["clustering_no", "center_no"],
+        inplace=True,
+    )
+    joblib.dump(df, cluster_frequency_path)
+
+
+def action_compute_frequency(
+    dataset_path: pathlib.Path,
+    frequency_path: pathlib.Path,
+    source: str = "store",
+    batches: Optional[List[str]] = None,
+    n_jobs: int = 1,
+):
+    """Compute the lifting function frequency and phase of each unit.
+
+    Unlike :func:`action_compute_phase`, which assumes the ripple frequency of
+    the 100:1 gear ratio, the frequency is estimated together with the phase
+    from all constant-velocity segments of each serial number and load, see
+    :func:`phase_estimation.estimate_frequency_and_phase`. Units are
+    estimated in parallel by ``n_jobs`` worker processes.
+    """
+    frequency_path.parent.mkdir(parents=True, exist_ok=True)
+    segments = _iter_segments(
+        dataset_path,
+        source,
+        batches,
+        ["joint_pos", "joint_vel", "target_joint_vel"],
+        min_length=600,
+        min_vel=3,
+        trim=100,
+    )
+    # Segments are streamed in key order, so each unit's are contiguous
+    df_lst = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_ripple_frequency)(
+            i,
+            [
+                (segment["joint_pos"], segment["joint_vel"] - segment["target_joint_vel"])
+                for _, _, segment in unit_segments
+            ],
+        )
+        for i, unit_segments in itertools.groupby(segments, key=lambda s: s[0][:2])
+    )
+    df = pandas.DataFrame(
+        df_lst,
+        columns=["serial_no", "load", "n_segments", "frequency", "optimal_phase"],
+    )
+    df.sort_values(
+        by=["serial_no", "load"],
+        inplace=True,
+    )
+    joblib.dump(df, frequency_path)
+
+
 def action_cluster_id_models(
     clusters_path: pathlib.Path,
     cluster_phase_path: pathlib.Path,
     cluster_models_path: pathlib.Path,
     koopman: str,
+    cluster_frequency_path: Optional[pathlib.Path] = None,
 ):
-    
+    """Identify linear and Koopman models of the cluster centers.
+
+    The sine lifting function uses the frequency of the 100:1 gear ratio, or
+    the frequency and phase estimated for each center by
+    :func:`action_compute_cluster_frequency` if ``cluster_frequency_path`` is
+    given. Centers without an estimate keep the nominal frequency and the
+    phase in ``cluster_phase_path``.
+    """
     cluster_models_path.parent.mkdir(parents=True, exist_ok=True)
     clusters = joblib.load(clusters_path)
     n_inputs = 2
@@ -423,16 +1049,30 @@ def action_cluster_id_models(
             ]
         ]
         if koopman == "koopman":
-            # Get optimal phase shift
-            cluster_phase = joblib.load(cluster_phase_path)
-            phi_all = cluster_phase.loc[(cluster_phase["clustering_no"] == i[0]) & (cluster_phase["center_no"] == i[1])]
-            optimal_phi = _circular_mean(phi_all["optimal_phase"].to_numpy())
+            f = phase_estimation.FREQUENCY
+            optimal_phi = None
+            if cluster_frequency_path is not None:
+                # Get estimated frequency and phase shift, unless the center
+                # had no qualifying segment
+                cluster_frequency = joblib.load(cluster_frequency_path)
+                center = cluster_frequency.loc[
+                    (cluster_frequency["clustering_no"] == i[0])
+                    & (cluster_frequency["center_no"] == i[1])
+                ]
+                if not center.empty:
+                    f = center["frequency"].item()
+                    optimal_phi = center["optimal_phase"].item()
+            if optimal_phi is None:
+                # Get optimal phase shift
+                cluster_phase = joblib.load(cluster_phase_path)
+                phi_all = cluster_phase.loc[(cluster_phase["clustering_no"] == i[0]) & (cluster_phase["center_no"] == i[1])]
+                optimal_phi = _circular_mean(phi_all["optimal_phase"].to_numpy())
             # Set lifting functions
             lf = [
                 (
                     "sin",
                     onesine.OneSineLiftingFn(
-                        f=100,
+                        f=f,
                         i=0,
                         phi=optimal_phi,
                     ),
@@ -479,16 +1119,35 @@ def action_id_models(
     phase_path: pathlib.Path,
     models_path: pathlib.Path,
     koopman: str,
+    batches: Optional[List[str]] = None,
+    frequency_path: Optional[pathlib.Path] = None,
 ):
-    """Identify linear and Koopman models."""
+    """Identify linear and Koopman models.
+
+    The sine lifting function uses the frequency of the 100:1 gear ratio, or
+    the frequency and phase estimated for each unit by
+    :func:`action_compute_frequency` if ``frequency_path`` is given. Units
+    without an estimate keep the nominal frequency and the phase in
+    ``phase_path``.
+    """
     models_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     n_inputs = 2
     episode_feature = True
     t_step = dataset.attrs["t_step"]
 
     df_lst = []
-    for i, dataset_ep in dataset.groupby(by=["serial_no", "load"]):
+    for i, dataset_ep in dataset.groupby(
+        by=["serial_no", "load"],
+        columns=[
+            "episode",
+            "joint_pos",
+            "joint_vel",
+            "joint_trq",
+            "target_joint_pos",
+            "target_joint_vel",
+        ],
+    ):
         X = dataset_ep[
             [
                 "episode",
@@ -501,16 +1160,29 @@ def action_id_models(
         ]
         X_train = X.loc[X["episode"] < N_TRAIN].to_numpy()
         if koopman == "koopman":
-            # Get optimal phase shift
-            phase = joblib.load(phase_path)
-            phi_all = phase.loc[(phase["serial_no"] == i[0]) & (phase["load"] == i[1])]
-            optimal_phi = _circular_mean(phi_all["optimal_phase"].to_numpy())
+            f = phase_estimation.FREQUENCY
+            optimal_phi = None
+            if frequency_path is not None:
+                # Get estimated frequency and phase shift, unless the unit had
+                # no qualifying segment
+                frequency = joblib.load(frequency_path)
+                unit = frequency.loc[
+                    (frequency["serial_no"] == i[0]) & (frequency["load"] == i[1])
+                ]
+                if not unit.empty:
+                    f = unit["frequency"].item()
+                    optimal_phi = unit["optimal_phase"].item()
+            if optimal_phi is None:
+                # Get optimal phase shift
+                phase = joblib.load(phase_path)
+                phi_all = phase.loc[(phase["serial_no"] == i[0]) & (phase["load"] == i[1])]
+                optimal_phi = _circular_mean(phi_all["optimal_phase"].to_numpy())
             # Set lifting functions
             lf = [
                 (
                     "sin",
                     onesine.OneSineLiftingFn(
-                        f=100,
+                        f=f,
                         i=0,
                         phi=optimal_phi,
                     ),
@@ -1259,15 +1931,28 @@ def action_synthesize_cluster_observer_test_phase(
     clustering_feats: list,
     K: int,
     koopman: str,
+    dtw_band: Optional[Dict[str, Any]] = None,
+    streaming_min_samples: int = 0,
+    batches: Optional[List[str]] = None,
 ):
     # Load dataset to test cluster observer
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     cluster_models = joblib.load(cluster_models_path)
     t_step = cluster_models.attrs["t_step"]
     cluster_centers = joblib.load(cluster_centers_path)
     cluster_observer = joblib.load(cluster_observer_path)
     with cluster_split_info_path.open('r') as f:
         cluster_split_info = json.load(f)
+    # Classify test episodes online, holding the centers as arrays
+    classifiers = []
+    for cl_no, cl_feats in enumerate(clustering_feats):
+        centers = cluster_centers.loc[(cluster_centers["clustering_no"]==cl_no)]
+        classifiers.append(dtw_kmeans.StreamingClassifier(
+            [center[cl_feats].to_numpy()
+             for _, center in centers.groupby("center_no", sort=True)],
+            metric_params=dtw_band,
+            min_samples=streaming_min_samples,
+        ))
         
     #10 random test episodes from train serial numbers
     serial_nos=list(np.random.choice(cluster_split_info["train"]["serial_numbers"],5, replace=False))
@@ -1275,17 +1960,20 @@ def action_synthesize_cluster_observer_test_phase(
     episodes=list(np.random.choice(cluster_split_info["test"]["episodes"],5))
     episodes+=list(np.random.choice(20,5, replace=False))
     loads=np.random.choice([True, False],10)
-    for test_no, serial_no, epiosde, load in enumerate(zip(serial_nos, episodes, loads)):
+    for test_no, (serial_no, epiosde, load) in enumerate(zip(serial_nos, episodes, loads)):
         for cl_no, cl_feats in enumerate(clustering_feats):
-            centers = cluster_centers.loc[(cluster_centers["clustering_no"]==cl_no)]
-            new_data = dataset.loc[
-                (dataset["serial_no"] == serial_no) &
-                (dataset["episode"] == epiosde) &
-                (dataset["load"] == load)
-            ]
-            distances = [dtw(new_data[cl_feats], centers.loc[(centers["center_no"]==k)]
-                             [cl_feats]) for k in K]
-            assigned_cluster = np.argmin(distances)
+            new_data = dataset.select(
+                serial_no=serial_no,
+                load=load,
+                episode=epiosde,
+            )
+            # Stream samples until one center is left, as the observer would
+            classifier = classifiers[cl_no].reset()
+            for sample in new_data[cl_feats].to_numpy():
+                classifier.update(sample)
+                if classifier.decided_:
+                    break
+            assigned_cluster = classifier.label_
             
             kp = cluster_models.loc[
                 (cluster_models["clustering_no"] == cl_no) & 
@@ -1435,10 +2123,11 @@ def action_synthesize_observer(
     err_plot_path: pathlib.Path,
     fft_plot_path: pathlib.Path,
     koopman: str,
+    batches: Optional[List[str]] = None,
 ):
     """Synthesize observer."""
     observer_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     models = joblib.load(models_path)
     uncertainty = joblib.load(uncertainty_path)
     t_step = models.attrs["t_step"]
@@ -1644,9 +2333,7 @@ def action_synthesize_observer(
     results["P"] = (P_0.A, P_0.B, P_0.C, P_0.D, t_step)
     results["synthesis_info"] = info
     # Load dataset to test observer
-    dataset_sn_noload = dataset.loc[
-        (dataset["serial_no"] == nom_sn) & (~dataset["load"])
-    ]
+    dataset_sn_noload = dataset.select(serial_no=nom_sn, load=False)
     X = dataset_sn_noload[
         [
             "episode",
@@ -1787,57 +2474,59 @@ def action_synthesize_observer(
 def action_plot_fft(
     dataset_path: pathlib.Path,
     error_fft_path: pathlib.Path,
+    source: str = "store",
+    batches: Optional[List[str]] = None,
 ):
-    """Plot error FFT."""
+    """Plot error FFT.
+
+    The segment is read from the selected batches of a partitioned dataset
+    store (``source="store"``) or parsed directly from the raw batch
+    directories in ``dataset_path`` (``source="raw"``).
+    """
     error_fft_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
     # Settings
-    t_step = dataset.attrs["t_step"]
+    if source == "store":
+        t_step = dataset_store.PartitionedStore(dataset_path, batches).attrs["t_step"]
+    else:
+        t_step = raw_dataset.T_STEP
     min_length = 600
     min_vel = 3
     trim = 100
-    dataset_ep = dataset.loc[
-        (dataset["serial_no"] == "009017")
-        & (~dataset["load"])
-        & (dataset["episode"] == 0)
-    ]
-    tvel = dataset_ep["target_joint_vel"].to_numpy()
-    vel = dataset_ep["joint_vel"].to_numpy()
-    # Find points where velocity changes
-    vel_changes = np.ravel(np.argwhere(np.diff(tvel, prepend=0) != 0))
-    # Split into constant-velocity segments
-    X = np.vstack(
-        [
-            vel,
-            tvel,
-        ]
-    ).T
-    const_vel_segments = np.split(X, vel_changes)
-    # Find first segment of required length and speed
-    for segment in const_vel_segments:
-        X_const_vel = segment[trim:-trim, :]
-        if segment.shape[0] > min_length:
-            if np.all(segment[:, 1] > min_vel):
-                # Compute normalized velocity error in that segment
-                vel_err = X_const_vel[:, 1] - X_const_vel[:, 0]
-                f, pos_err_spec = scipy.signal.welch(
-                    vel_err,
-                    fs=(1 / t_step),
-                    nperseg=512,
-                )
-                fig, ax = plt.subplots(
-                    constrained_layout=True,
-                    figsize=(LW, LW),
-                )
-                ax.semilogy(f, pos_err_spec, color=OKABE_ITO["blue"])
-                ax.set_yticks([10**i for i in range(-9, -3)])
-                ax.set_xticks(np.arange(0, 550, 50))
-                ax.set_xlabel(r"$f$ (Hz)")
-                ax.set_ylabel(
-                    r"$S_{\dot{\theta}^\mathrm{e}\dot{\theta}^\mathrm{e}}(f)$ "
-                    r"($\mathrm{rad}^2/\mathrm{s}^2/\mathrm{Hz}$)"
-                )
-                break
+    # Find first forward segment of required length and speed
+    for _, direction, segment in _iter_segments(
+        dataset_path,
+        source,
+        batches,
+        ["joint_vel", "target_joint_vel"],
+        min_length=min_length,
+        min_vel=min_vel,
+        trim=trim,
+        serial_no="009017",
+        load=False,
+        episode=0,
+    ):
+        if direction != "forward":
+            continue
+        # Compute normalized velocity error in that segment
+        vel_err = segment["target_joint_vel"] - segment["joint_vel"]
+        f, pos_err_spec = scipy.signal.welch(
+            vel_err,
+            fs=(1 / t_step),
+            nperseg=512,
+        )
+        fig, ax = plt.subplots(
+            constrained_layout=True,
+            figsize=(LW, LW),
+        )
+        ax.semilogy(f, pos_err_spec, color=OKABE_ITO["blue"])
+        ax.set_yticks([10**i for i in range(-9, -3)])
+        ax.set_xticks(np.arange(0, 550, 50))
+        ax.set_xlabel(r"$f$ (Hz)")
+        ax.set_ylabel(
+            r"$S_{\dot{\theta}^\mathrm{e}\dot{\theta}^\mathrm{e}}(f)$ "
+            r"($\mathrm{rad}^2/\mathrm{s}^2/\mathrm{Hz}$)"
+        )
+        break
     fig.savefig(
         error_fft_path,
         **SAVEFIG_KW,
@@ -1852,17 +2541,18 @@ def action_plot_model_predictions(
     pred_traj_path: pathlib.Path,
     pred_err_path: pathlib.Path,
     pred_fft_path: pathlib.Path,
+    batches: Optional[List[str]] = None,
 ):
     """Plot model predictions."""
     pred_ref_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     models_linear = joblib.load(models_linear_path)
     models_koopman = joblib.load(models_koopman_path)
 
     sn = "009017"
     t_step = dataset.attrs["t_step"]
 
-    dataset_sn_noload = dataset.loc[(dataset["serial_no"] == sn) & (~dataset["load"])]
+    dataset_sn_noload = dataset.select(serial_no=sn, load=False)
     X = dataset_sn_noload[
         [
             "episode",
@@ -2121,10 +2811,11 @@ def action_plot_model_tfs(
     tfs_msv_koopman_path: pathlib.Path,
     tfs_mimo_linear_path: pathlib.Path,
     tfs_mimo_koopman_path: pathlib.Path,
+    batches: Optional[List[str]] = None,
 ):
     """Plot model transfer functions."""
     tfs_msv_linear_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     models_linear = joblib.load(models_linear_path)
     models_koopman = joblib.load(models_koopman_path)
     t_step = dataset.attrs["t_step"]
@@ -2268,10 +2959,11 @@ def action_plot_observer(
     obs_offnom_noload_traj_path: pathlib.Path,
     obs_offnom_noload_err_path: pathlib.Path,
     obs_offnom_noload_psd_path: pathlib.Path,
+    batches: Optional[List[str]] = None,
 ):
     """Plot observer."""
     obs_weights_linear_path.parent.mkdir(parents=True, exist_ok=True)
-    dataset = joblib.load(dataset_path)
+    dataset = dataset_store.PartitionedStore(dataset_path, batches)
     uncertainty_linear = joblib.load(uncertainty_linear_path)
     # Currently unused but may be used later
     # uncertainty_koopman = joblib.load(uncertainty_koopman_path)
@@ -2300,18 +2992,18 @@ def action_plot_observer(
 
     # Nominal, no load
     nom_sn = uncertainty_linear["nominal_serial_no"]
-    X_valid_noload = dataset.loc[
-        (dataset["serial_no"] == nom_sn)
-        & (dataset["episode"] == N_TRAIN)
-        & (~dataset["load"]),
-        [
+    X_valid_noload = dataset.episode(
+        nom_sn,
+        False,
+        N_TRAIN,
+        columns=[
             "joint_pos",
             "joint_vel",
             "joint_trq",
             "target_joint_pos",
             "target_joint_vel",
         ],
-    ].to_numpy()
+    ).to_numpy()
     t = np.arange(X_valid_noload.shape[0]) * t_step
     x0 = np.array([[0], [0], [0]])
     X_obs_linear_noload = _simulate_linear(
@@ -2351,18 +3043,18 @@ def action_plot_observer(
 
     # Nominal, load
     nom_sn = uncertainty_linear["nominal_serial_no"]
-    X_valid_load = dataset.loc[
-        (dataset["serial_no"] == nom_sn)
-        & (dataset["episode"] == N_TRAIN)
-        & (dataset["load"]),
-        [
+    X_valid_load = dataset.episode(
+        nom_sn,
+        True,
+        N_TRAIN,
+        columns=[
             "joint_pos",
             "joint_vel",
             "joint_trq",
             "target_joint_pos",
             "target_joint_vel",
         ],
-    ].to_numpy()
+    ).to_numpy()
     t = np.arange(X_valid_load.shape[0]) * t_step
     x0 = np.array([[0], [0], [0]])
     X_obs_linear_load = _simulate_linear(
@@ -2402,18 +3094,18 @@ def action_plot_observer(
     nom_sn = uncertainty_linear["nominal_serial_no"]
     offnom_sn = "011011"
     assert nom_sn != offnom_sn
-    X_valid_noload = dataset.loc[
-        (dataset["serial_no"] == offnom_sn)
-        & (dataset["episode"] == N_TRAIN)
-        & (~dataset["load"]),
-        [
+    X_valid_noload = dataset.episode(
+        offnom_sn,
+        False,
+        N_TRAIN,
+        columns=[
             "joint_pos",
             "joint_vel",
             "joint_trq",
             "target_joint_pos",
             "target_joint_vel",
         ],
-    ].to_numpy()
+    ).to_numpy()
     t = np.arange(X_valid_noload.shape[0]) * t_step
     x0 = np.array([[0], [0], [0]])
     X_obs_linear_noload = _simulate_linear(
@@ -3825,3 +4517,455 @@ def _simulate_koopman(
             # Update controller
             Xc[:, k] = K.A @ Xc[:, k - 1] + K.B @ err
     return X.T
+
+
+def _iter_segments(
+    dataset_path: pathlib.Path,
+    source: str,
+    batches: Optional[List[str]],
+    columns: List[str],
+    min_length: int,
+    min_vel: float,
+    trim: int,
+    **kwargs,
+) -> Iterator[Tuple[Tuple[str, bool, int], str, Dict[str, np.ndarray]]]:
+    """Stream qualifying constant-velocity segments.
+
+    Segments come from the ingest-time segment table of a partitioned store,
+    or are found on the fly when parsing raw batch directories.
+
+    Parameters
+    ----------
+    dataset_path : pathlib.Path
+        Partitioned dataset store or raw dataset directory.
+    source : str
+        ``"store"`` or ``"raw"``.
+    batches : Optional[List[str]]
+        Batches to read. Reads all batches if ``None``.
+    columns : List[str]
+        Columns to read.
+    min_length : int
+        Only return segments longer than this many samples.
+    min_vel : float
+        Only return segments whose target speed exceeds this (rad/s).
+    trim : int
+        Number of samples to drop at each end of a segment.
+    **kwargs
+        Key filters passed to the underlying ``iter_episodes``.
+
+    Yields
+    ------
+    Tuple[Tuple[str, bool, int], str, Dict[str, np.ndarray]] :
+        Episode key, segment direction, and trimmed segment arrays.
+    """
+    if source == "store":
+        dataset = dataset_store.PartitionedStore(dataset_path, batches)
+        yield from dataset.iter_segments(
+            columns=columns,
+            min_length=min_length,
+            min_vel=min_vel,
+            trim=trim,
+            **kwargs,
+        )
+        return
+    episode_columns = columns + [
+        name for name in ["target_joint_vel"] if name not in columns
+    ]
+    for key, arrays in _iter_episodes(
+        dataset_path,
+        source,
+        batches,
+        episode_columns,
+        **kwargs,
+    ):
+        tvel = arrays["target_joint_vel"]
+        for start, stop in zip(*dataset_store.find_segments(tvel)):
+            if stop - start > min_length and np.abs(tvel[start]) > min_vel:
+                direction = "forward" if tvel[start] > 0 else "reverse"
+                segment = {
+                    name: arrays[name][start + trim : stop - trim] for name in columns
+                }
+                yield key, direction, segment
+
+
+def _iter_center_segments(
+    clusters: pandas.DataFrame,
+    columns: List[str],
+    min_length: int,
+    min_vel: float,
+    trim: int,
+) -> Iterator[Tuple[Tuple[int, int], str, Dict[str, np.ndarray]]]:
+    """Iterate over qualifying constant-velocity segments of cluster centers.
+
+    Parameters
+    ----------
+    clusters : pandas.DataFrame
+        Cluster centers, with one episode per clustering and center number.
+    columns : List[str]
+        Columns to return.
+    min_length : int
+        Only return segments longer than this many samples.
+    min_vel : float
+        Only return segments whose target speed exceeds this (rad/s).
+    trim : int
+        Number of samples to drop at each end of a segment.
+
+    Yields
+    ------
+    Tuple[Tuple[int, int], str, Dict[str, np.ndarray]] :
+        Clustering and center number, segment direction, and trimmed segment
+        arrays.
+    """
+    for i, cluster_ep in clusters.groupby(by=["clustering_no", "center_no"]):
+        tvel = cluster_ep["target_joint_vel"].to_numpy()
+        arrays = {name: cluster_ep[name].to_numpy() for name in columns}
+        for start, stop in zip(*dataset_store.find_segments(tvel)):
+            if stop - start > min_length and np.abs(tvel[start]) > min_vel:
+                direction = "forward" if tvel[start] > 0 else "reverse"
+                segment = {
+                    name: array[start + trim : stop - trim]
+                    for name, array in arrays.items()
+                }
+                yield i, direction, segment
+
+def _iter_episodes(
+    dataset_path: pathlib.Path,
+    source: str,
+    batches: Optional[List[str]],
+    columns: List[str],
+    **kwargs,
+) -> Iterator[Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]]]:
+    """Stream episodes from a partitioned store or from raw batch directories.
+
+    Parameters
+    ----------
+    dataset_path : pathlib.Path
+        Partitioned dataset store or raw dataset directory.
+    source : str
+        ``"store"`` or ``"raw"``.
+    batches : Optional[List[str]]
+        Batches to read. Reads all batches if ``None``.
+    columns : List[str]
+        Columns to read.
+    **kwargs
+        Key filters passed to the underlying ``iter_episodes``.
+
+    Returns
+    -------
+    Iterator[Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]]] :
+        Episode keys and arrays, in key order within each batch.
+    """
+    if source == "store":
+        dataset = dataset_store.PartitionedStore(dataset_path, batches)
+        return dataset.iter_episodes(columns=columns, **kwargs)
+    elif source == "raw":
+        if batches is None:
+            batches = raw_dataset.find_batches(dataset_path)
+        return itertools.chain.from_iterable(
+            raw_dataset.iter_episodes(
+                dataset_path.joinpath(batch),
+                columns=columns,
+                **kwargs,
+            )
+            for batch in batches
+        )
+    else:
+        raise ValueError(f"Unknown episode source '{source}'.")
+
+
+def _cluster_episodes(
+    clustering_no: int,
+    features: List[str],
+    X: np.ndarray,
+    other_features: List[str],
+    X_other: np.ndarray,
+    k: int,
+    solver: str,
+    dtw_band: Optional[Dict[str, Any]],
+    paa_factor: int,
+    minibatch_size: int,
+    keys: List[Tuple[str, bool, int]],
+    distances_path: Optional[pathlib.Path],
+    max_iter: int,
+    embedding_model: Optional[episode_embedding.KMeans],
+    n_jobs: int,
+) -> Tuple[np.ndarray, np.ndarray, List[Tuple[np.ndarray, np.ndarray]], Dict[str, Any]]:
+    """Cluster episodes on one feature set and compute the centers.
+
+    Parameters
+    ----------
+    clustering_no : int
+        Index of the feature set.
+    features : List[str]
+        Clustered features.
+    X : np.ndarray
+        Clustered channels, with shape ``(n_episodes, max_length,
+        len(features))``.
+    other_features : List[str]
+        Remaining features.
+    X_other : np.ndarray
+        Remaining channels, with shape ``(n_episodes, max_length,
+        len(other_features))``.
+    k : int
+        Number of clusters.
+    solver : str
+        Clustering solver, see ``action_one_step_DTW_K_means_clustering``.
+    dtw_band : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of ``dtw_kmeans.dtw``.
+    paa_factor : int
+        Downsampling factor of the ``multires`` solver.
+    minibatch_size : int
+        Batch size of the ``minibatch`` solver.
+    keys : List[Tuple[str, bool, int]]
+        ``(serial_no, load, episode)`` of each episode.
+    distances_path : Optional[pathlib.Path]
+        Cached distance matrix, used by the ``kmedoids`` solver.
+    max_iter : int
+        Maximum number of k-means and DBA iterations.
+    embedding_model : Optional[episode_embedding.KMeans]
+        K-means fitted on the standardized velocity error embeddings of the
+        episodes, used by the ``embedding`` solver.
+    n_jobs : int
+        Number of cores for the DTW computations.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, List[Tuple[np.ndarray, np.ndarray]], Dict[str, Any]] :
+        Label of each episode, DTW distance of each episode to its center,
+        clustered and remaining channels of each center, and report entry.
+
+    Raises
+    ------
+    ValueError
+        If the solver is unknown.
+    """
+    # ``pruned`` and ``tslearn`` produce identical clusters for unconstrained
+    # DTW, but ``pruned`` skips exact DTW distances that cannot change an
+    # assignment. With a band, only ``pruned`` uses it for the barycenters,
+    # so their clusters differ. ``multires``
+    # clusters downsampled episodes and only refines them at full resolution.
+    # ``minibatch`` updates the centers from random batches of episodes.
+    # ``kmedoids`` uses the cached distance matrix at ``distances_path``.
+    # ``embedding`` clusters feature vectors of the velocity error instead of
+    # time series
+    if solver == "pruned":
+        km = dtw_kmeans.PrunedTimeSeriesKMeans(n_clusters=k, verbose=True,
+                                               max_iter=max_iter, metric='dtw',
+                                               metric_params=dtw_band,
+                                               random_state=0, n_jobs=n_jobs)
+    elif solver == "tslearn":
+        km = TimeSeriesKMeans(n_clusters=k, verbose=True, max_iter=max_iter, 
+                              metric='dtw', metric_params=dtw_band,
+                              random_state=0, n_jobs=n_jobs)
+    elif solver == "multires":
+        km = dtw_kmeans.MultiResolutionKMeans(n_clusters=k, verbose=True,
+                                              paa_factor=paa_factor,
+                                              max_iter=max_iter,
+                                              metric_params=dtw_band,
+                                              random_state=0, n_jobs=n_jobs)
+    elif solver == "minibatch":
+        km = dtw_kmeans.MiniBatchKMeans(n_clusters=k, verbose=True,
+                                        batch_size=minibatch_size,
+                                        metric_params=dtw_band,
+                                        random_state=0, n_jobs=n_jobs)
+    elif solver == "kmedoids":
+        km = dtw_kmeans.KMedoids(n_clusters=k, random_state=0)
+    elif solver == "embedding":
+        km = embedding_model
+    else:
+        raise ValueError(f"Unknown clustering solver '{solver}'.")
+
+    start = time.perf_counter()
+    if solver == "kmedoids":
+        rows = _distance_rows(distances_path, keys)
+        distances = np.load(distances_path, mmap_mode="r")[np.ix_(rows, rows)]
+        y_pred = km.fit_predict(distances)
+        y_dist = distances[np.arange(y_pred.shape[0]), km.medoid_indices_[y_pred]]
+    elif solver == "embedding":
+        y_pred = km.labels_
+        # No DTW distances, so there is no reference for assigned episodes
+        y_dist = np.full(y_pred.shape[0], np.nan)
+    else:
+        y_pred = km.fit_predict(X)
+        y_dist = dtw_kmeans.center_distances(X, km.cluster_centers_, y_pred,
+                                             dtw_band, n_jobs)
+    report = {
+        "clustering_no": clustering_no,
+        "features": list(features),
+        "solver": solver,
+        "n_series": int(y_pred.shape[0]),
+        "n_iter": int(km.n_iter_),
+        # The coarse inertia of ``multires`` is that of the downsampled
+        # episodes, so its inertia is evaluated with the refined centers
+        "inertia": float(
+            np.mean(y_dist**2) if solver == "multires" else km.inertia_
+        ),
+        "seconds": time.perf_counter() - start,
+    }
+    if solver == "pruned":
+        report.update({
+            "n_pairs": km.n_pairs_,
+            "n_dtw": km.n_dtw_,
+            "pruned_fraction": 1 - km.n_dtw_ / km.n_pairs_,
+        })
+    elif solver == "multires":
+        report.update({
+            "coarse_inertia": float(km.coarse_inertia_),
+            "n_ambiguous": km.n_ambiguous_,
+        })
+
+    if solver in ["kmedoids", "embedding"]:
+        # Centers are the medoid, or most central, episodes themselves
+        centers = []
+        if solver == "kmedoids":
+            representatives = km.medoid_indices_
+        else:
+            representatives = km.representative_indices_
+        for episode in representatives:
+            size = dtw_kmeans.ts_lengths(X[[episode]])[0]
+            centers.append((X[episode, :size], X_other[episode, :size]))
+        return y_pred, y_dist, centers, report
+
+    # Barycenters of the other channels of each cluster are independent,
+    # so they are computed in parallel
+    jobs = [
+        (center_num, p)
+        for center_num in range(k)
+        for p in range(len(other_features))
+    ]
+    start = time.perf_counter()
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_timed_barycenter)(
+            X_other[y_pred == center_num][:,:,p], max_iter, dtw_band)
+        for center_num, p in jobs
+    )
+    barycenters = {job: barycenter for job, (barycenter, _) in zip(jobs, results)}
+    report["barycenter_seconds"] = time.perf_counter() - start
+    report["barycenter_jobs"] = [
+        {
+            "center_no": center_num,
+            "channel": other_features[p],
+            "seconds": seconds,
+        }
+        for (center_num, p), (_, seconds) in zip(jobs, results)
+    ]
+    centers = [
+        (
+            km.cluster_centers_[center_num],
+            np.column_stack([
+                barycenters[center_num, p][:,0] for p in range(len(other_features))
+            ]),
+        )
+        for center_num in range(k)
+    ]
+    return y_pred, y_dist, centers, report
+
+
+def _episode_phases(
+    key: Tuple[str, bool, int],
+    segments: List[Tuple[str, np.ndarray, np.ndarray]],
+    method: str,
+    n_phase_samples: int,
+) -> List[Tuple]:
+    """Estimate the phase of each constant-velocity segment of an episode.
+
+    Parameters
+    ----------
+    key : Tuple[str, bool, int]
+        Serial number, load, and episode number.
+    segments : List[Tuple[str, np.ndarray, np.ndarray]]
+        Direction, joint positions, and velocity errors of each segment.
+    method : str
+        Phase estimation method of :func:`phase_estimation.estimate_phase`.
+    n_phase_samples : int
+        Number of phases at which the inner product curve is returned.
+
+    Returns
+    -------
+    List[Tuple] :
+        Episode key, direction, optimal phase, phases, and inner products of
+        each segment.
+    """
+    rows = []
+    for direction, pos, vel_err in segments:
+        norm_vel_err = vel_err / np.max(np.abs(vel_err))
+        rows.append(
+            key
+            + (direction,)
+            + phase_estimation.estimate_phase(pos, norm_vel_err, method, n_phase_samples)
+        )
+    return rows
+
+def _ripple_frequency(
+    key: Tuple,
+    segments: List[Tuple[np.ndarray, np.ndarray]],
+) -> Tuple:
+    """Estimate the frequency and phase of the ripple of one unit or center.
+
+    Parameters
+    ----------
+    key : Tuple
+        Key of the unit or center.
+    segments : List[Tuple[np.ndarray, np.ndarray]]
+        Joint positions and velocity errors of each constant-velocity segment.
+
+    Returns
+    -------
+    Tuple :
+        Key, number of segments, frequency, and optimal phase.
+    """
+    positions = [pos for pos, _ in segments]
+    norm_vel_errs = [vel_err / np.max(np.abs(vel_err)) for _, vel_err in segments]
+    f, phi = phase_estimation.estimate_frequency_and_phase(positions, norm_vel_errs)
+    return key + (len(segments), f, phi)
+
+def _timed_barycenter(
+    X: np.ndarray,
+    max_iter: int,
+    dtw_band: Optional[Dict[str, Any]],
+) -> Tuple[np.ndarray, float]:
+    """Compute a DTW barycenter and the time it took.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Time series dataset.
+    max_iter : int
+        Maximum number of DBA iterations.
+    dtw_band : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of ``dtw_kmeans.dtw``.
+
+    Returns
+    -------
+    Tuple[np.ndarray, float] :
+        Barycenter and wall time (s).
+    """
+    start = time.perf_counter()
+    barycenter = dtw_kmeans.dtw_barycenter_averaging(
+        X, max_iter=max_iter, metric_params=dtw_band
+    )
+    return barycenter, time.perf_counter() - start
+
+
+def _distance_rows(
+    distances_path: pathlib.Path,
+    keys: List[Tuple[str, bool, int]],
+) -> np.ndarray:
+    """Find the rows of episodes in a cached distance matrix.
+
+    Parameters
+    ----------
+    distances_path : pathlib.Path
+        Distance matrix written by ``action_compute_dtw_distances``.
+    keys : List[Tuple[str, bool, int]]
+        ``(serial_no, load, episode)`` of each episode.
+
+    Returns
+    -------
+    np.ndarray :
+        Row of each episode.
+    """
+    rows = json.loads(distances_path.with_suffix(".json").read_text())
+    index = {tuple(key): row for row, key in enumerate(rows["keys"])}
+    return np.array([index[(str(sn), bool(ld), int(ep))] for sn, ld, ep in keys])
+
@@ -0,0 +1,1233 @@
+"""Columnar, memory-mappable storage for the preprocessed dataset.
+
+A store is a directory laid out as::
+
+    <store>/
+        meta.json              # attrs, column dtypes, and episode key table
+        columns/<name>.npy     # one contiguous array per numeric column
+        columns/_episode.npy   # per-row code into the episode key table
+        segments/<name>.npy    # constant-velocity segment table
+
+Rows are sorted by ``(serial_no, load, episode, k)``, so every episode, and
+every prefix of that key, occupies a contiguous run of rows. The row range of
+each episode and the byte offset of each column's data are recorded in
+``meta.json`` at ingest time and exposed through :class:`EpisodeIndex`.
+Columns are opened with ``numpy.load(..., mmap_mode="r")``, so slicing one
+episode only reads the pages belonging to that episode.
+
+Constant-velocity segments of the target velocity are found once at ingest
+time. The segment table stores the episode code, the first and one past the
+last sample of each segment within its episode, and the segment's target
+velocity, so phase and spectral estimates can jump straight to qualifying
+segments.
+
+Compact stores (``write(..., compact=True)``) roughly halve the size of the
+store and of the dataframes read from it. ``k`` is stored as ``int32``, ``t``
+is dropped and recomputed as ``k * t_step`` on read, ``serial_no`` and
+``timestamp`` are read back as categoricals, and each float column is stored
+as ``float32`` if its largest round-trip error is at most ``COMPACT_ATOL``.
+That error is recorded for every float column under ``compact_error`` in
+``meta.json``, so accuracy relative to the float64 store can be audited. For
+joint positions of tens of radians it is a few microradians, which shifts the
+``sin(100 * theta)`` lifting function by well under a milliradian.
+
+A partitioned store holds one store per batch and unit::
+
+    <store>/<batch>/partitions.json    # partitions of the batch
+    <store>/<batch>/<serial_no>/       # store of one unit's episodes
+
+:class:`PartitionedStore` opens only the selected partitions and exposes them
+through the same API as :class:`DatasetStore`.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas
+
+# Columns identifying an episode, in sort order, plus recording metadata
+KEY_COLUMNS = ["serial_no", "load", "episode", "timestamp"]
+# Columns forming the episode key, in sort order
+INDEX_COLUMNS = ["serial_no", "load", "episode"]
+# Key columns stored as codes into a list of categories
+CATEGORICAL_COLUMNS = ["serial_no", "timestamp"]
+# Name of the per-row episode code column
+EPISODE_CODE = "_episode"
+# Name of the file listing the partitions of a batch
+PARTITIONS_FILE = "partitions.json"
+# Largest absolute round-off accepted when storing a float column as
+# ``float32`` in a compact store (rad, rad/s, or normalized torque)
+COMPACT_ATOL = 1e-5
+
+
+def meta_path(store_path: pathlib.Path) -> pathlib.Path:
+    """Path to the metadata file of a store.
+
+    Useful as a ``doit`` target or file dependency, since it is rewritten
+    every time the store is.
+
+    Parameters
+    ----------
+    store_path : pathlib.Path
+        Store directory.
+
+    Returns
+    -------
+    pathlib.Path :
+        Path to ``meta.json``.
+    """
+    return store_path.joinpath("meta.json")
+
+
+def partitions_path(store_path: pathlib.Path, batch: str) -> pathlib.Path:
+    """Path to the partition listing of a batch in a partitioned store.
+
+    The listing is only rewritten when the contents of the batch change, so
+    it is the file dependency to use for tasks reading the batch.
+
+    Parameters
+    ----------
+    store_path : pathlib.Path
+        Partitioned store directory.
+    batch : str
+        Batch name.
+
+    Returns
+    -------
+    pathlib.Path :
+        Path to ``<batch>/partitions.json``.
+    """
+    return store_path.joinpath(batch, PARTITIONS_FILE)
+
+
+class partitions_unchanged:
+    """``doit`` ``uptodate`` check ignoring batches added since the last run.
+
+    A task is up to date if the partition listings of the batches it read
+    when it last ran are unchanged and still selected, so adding batches does
+    not make it stale. Named like the checks of ``doit.tools``.
+
+    Parameters
+    ----------
+    store_path : pathlib.Path
+        Partitioned store directory.
+    batches : List[str]
+        Batches the task reads.
+    """
+
+    def __init__(self, store_path: pathlib.Path, batches: List[str]):
+        self.store_path = store_path
+        self.batches = batches
+
+    def configure_task(self, task):
+        task.value_savers.append(lambda: {"_partitions": self._digests()})
+
+    def __call__(self, task, values) -> bool:
+        last = values.get("_partitions")
+        if last is None:
+            return False
+        digests = self._digests()
+        return all(digests.get(batch) == digest for batch, digest in last.items())
+
+    def _digests(self) -> Dict[str, Optional[str]]:
+        """Hash the partition listing of each selected batch."""
+        digests = {}
+        for batch in self.batches:
+            path = partitions_path(self.store_path, batch)
+            digests[batch] = (
+                hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else None
+            )
+        return digests
+
+
+def find_segments(
+    target_joint_vel: np.ndarray,
+    episode_starts: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find constant-velocity segments of a target velocity signal.
+
+    A segment starts wherever the target velocity changes and at the first
+    row of every episode. The result matches splitting each episode with
+    ``np.split(x, np.argwhere(np.diff(tvel, prepend=0) != 0).ravel())`` and
+    dropping empty segments.
+
+    Parameters
+    ----------
+    target_joint_vel : np.ndarray
+        Target velocity of one episode, or of concatenated episodes.
+    episode_starts : Optional[np.ndarray]
+        First row of each episode. Treated as one episode if ``None``.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray] :
+        First row and one past the last row of each segment.
+    """
+    n_rows = target_joint_vel.shape[0]
+    if n_rows == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    changes = np.flatnonzero(np.diff(target_joint_vel) != 0) + 1
+    bounds = np.union1d(changes, [0] if episode_starts is None else episode_starts)
+    bounds = np.append(bounds, n_rows).astype(int)
+    return bounds[:-1], bounds[1:]
+
+
+def write(
+    df: pandas.DataFrame,
+    store_path: pathlib.Path,
+    compact: bool = False,
+) -> None:
+    """Write a preprocessed dataset dataframe to a columnar store.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataset sorted by ``(serial_no, load, episode, k)``. Its ``attrs``
+        must be JSON-serializable.
+    store_path : pathlib.Path
+        Store directory. Existing columns are overwritten.
+    compact : bool
+        Store compact dtypes, as described in the module docstring.
+
+    Raises
+    ------
+    ValueError
+        If the dataset is not sorted by episode key.
+    """
+    columns_path = store_path.joinpath("columns")
+    columns_path.mkdir(parents=True, exist_ok=True)
+    # Find episode boundaries
+    keys = df[KEY_COLUMNS].reset_index(drop=True)
+    new_episode = (keys != keys.shift()).any(axis=1).to_numpy()
+    episode_code = np.cumsum(new_episode, dtype=np.int32) - 1
+    episodes = keys.loc[new_episode].reset_index(drop=True)
+    starts = np.flatnonzero(new_episode)
+    lengths = np.diff(np.append(starts, keys.shape[0]))
+    sort_keys = list(episodes[INDEX_COLUMNS].itertuples(index=False))
+    if any(a >= b for a, b in zip(sort_keys[:-1], sort_keys[1:])):
+        raise ValueError(
+            "Dataset must be sorted by `(serial_no, load, episode, k)` with "
+            "contiguous episodes."
+        )
+    # Encode episode key table
+    categories = {}
+    episode_table = {}
+    for name in KEY_COLUMNS:
+        if name in CATEGORICAL_COLUMNS:
+            codes, uniques = pandas.factorize(episodes[name], sort=True)
+            categories[name] = [str(u) for u in uniques]
+            episode_table[name] = codes.tolist()
+        else:
+            episode_table[name] = episodes[name].tolist()
+    episode_table["start"] = starts.tolist()
+    episode_table["length"] = lengths.tolist()
+    # Write numeric columns
+    dtypes = {}
+    data_offsets = {}
+    derived = []
+    compact_error = {}
+    for name in df.columns:
+        if name in KEY_COLUMNS:
+            continue
+        array = df[name].to_numpy()
+        if compact:
+            if (
+                name == "t"
+                and "k" in df.columns
+                and np.array_equal(array, df["k"].to_numpy() * df.attrs["t_step"])
+            ):
+                derived.append(name)
+                continue
+            if np.issubdtype(array.dtype, np.integer):
+                if np.all(np.abs(array) < 2**31):
+                    array = array.astype(np.int32)
+            elif array.dtype == np.float64:
+                array_32 = array.astype(np.float32)
+                error = float(np.max(np.abs(array_32 - array), initial=0))
+                compact_error[name] = error
+                if error <= COMPACT_ATOL:
+                    array = array_32
+        array = np.ascontiguousarray(array)
+        data_offsets[name] = _save(columns_path.joinpath(f"{name}.npy"), array)
+        dtypes[name] = array.dtype.str
+    _save(columns_path.joinpath(f"{EPISODE_CODE}.npy"), episode_code)
+    # Write segment table
+    if "target_joint_vel" in df.columns:
+        segments_path = store_path.joinpath("segments")
+        segments_path.mkdir(parents=True, exist_ok=True)
+        tvel = df["target_joint_vel"].to_numpy()
+        seg_starts, seg_stops = find_segments(tvel, starts)
+        seg_codes = episode_code[seg_starts]
+        _save(segments_path.joinpath("code.npy"), seg_codes)
+        _save(segments_path.joinpath("start.npy"), seg_starts - starts[seg_codes])
+        _save(segments_path.joinpath("stop.npy"), seg_stops - starts[seg_codes])
+        _save(segments_path.joinpath("target_joint_vel.npy"), tvel[seg_starts])
+    meta = {
+        "n_rows": int(df.shape[0]),
+        "column_order": list(df.columns),
+        "dtypes": dtypes,
+        "data_offsets": data_offsets,
+        "compact": compact,
+        "compact_error": compact_error,
+        "derived": derived,
+        "attrs": dict(df.attrs),
+        "categories": categories,
+        "episodes": episode_table,
+    }
+    # Write metadata last so a partially written store is never up to date
+    meta_path(store_path).write_text(json.dumps(meta))
+
+
+def upsert(
+    df: Optional[pandas.DataFrame],
+    store_path: pathlib.Path,
+    remove: List[Tuple[str, bool, int]] = (),
+) -> None:
+    """Insert or replace episodes in an existing store.
+
+    Episodes in ``df`` replace stored episodes with the same key, and the
+    episodes in ``remove`` are deleted. All other episodes are copied from the
+    existing columns, so only new or changed episodes need to be parsed.
+
+    Parameters
+    ----------
+    df : Optional[pandas.DataFrame]
+        New episodes, each contiguous. ``None`` if there are none.
+    store_path : pathlib.Path
+        Existing store directory.
+    remove : List[Tuple[str, bool, int]]
+        ``(serial_no, load, episode)`` keys to delete.
+    """
+    store = DatasetStore(store_path)
+    drop = set(remove)
+    if df is not None:
+        drop |= set(
+            df[INDEX_COLUMNS]
+            .drop_duplicates()
+            .itertuples(index=False, name=None)
+        )
+    keep = np.array(
+        [
+            code
+            for code, key in enumerate(store.index.keys())
+            if key not in drop
+        ],
+        dtype=int,
+    )
+    frames = [store._read(keep, None)]
+    attrs = dict(store.attrs)
+    if df is not None:
+        frames.append(df)
+        attrs.update(df.attrs)
+    merged_df = _sort_episodes(pandas.concat(frames))
+    merged_df.attrs = attrs
+    compact = store.compact
+    del store
+    write(merged_df, store_path, compact=compact)
+
+
+class EpisodeIndex:
+    """Lookup from episode keys to contiguous row ranges of a store.
+
+    Any prefix of ``(serial_no, load, episode)`` maps to one contiguous row
+    range, so selecting a unit, a unit's no-load episodes, or a single
+    episode never requires scanning the key columns.
+
+    Attributes
+    ----------
+    episodes : pandas.DataFrame
+        Episode key table with columns ``serial_no``, ``load``, ``episode``,
+        and ``timestamp``, sorted by key. Its index is the episode code.
+    starts : np.ndarray
+        First row of each episode.
+    stops : np.ndarray
+        One past the last row of each episode.
+    """
+
+    def __init__(
+        self,
+        episodes: pandas.DataFrame,
+        starts: np.ndarray,
+        lengths: np.ndarray,
+        dtypes: Dict[str, str],
+        data_offsets: Dict[str, int],
+    ) -> None:
+        """Instantiate :class:`EpisodeIndex`.
+
+        Parameters
+        ----------
+        episodes : pandas.DataFrame
+            Episode key table, sorted by key.
+        starts : np.ndarray
+            First row of each episode.
+        lengths : np.ndarray
+            Number of rows in each episode.
+        dtypes : Dict[str, str]
+            Dtype string of each numeric column.
+        data_offsets : Dict[str, int]
+            Byte offset of the first row in each column file.
+        """
+        self.episodes = episodes
+        self.starts = np.asarray(starts, dtype=int)
+        self.stops = self.starts + np.asarray(lengths, dtype=int)
+        self._itemsizes = {name: np.dtype(dt).itemsize for name, dt in dtypes.items()}
+        self._data_offsets = data_offsets
+        # Map every key prefix to its range of episode codes
+        self._prefixes = {}
+        for code, key in enumerate(self.keys()):
+            for n in range(1, len(INDEX_COLUMNS) + 1):
+                first, _ = self._prefixes.get(key[:n], (code, code))
+                self._prefixes[key[:n]] = (first, code + 1)
+
+    def __len__(self) -> int:
+        return self.episodes.shape[0]
+
+    def keys(self) -> List[Tuple[str, bool, int]]:
+        """Episode keys, in sort order.
+
+        Returns
+        -------
+        List[Tuple[str, bool, int]] :
+            ``(serial_no, load, episode)`` of every episode.
+        """
+        return list(
+            zip(
+                self.episodes["serial_no"].tolist(),
+                self.episodes["load"].tolist(),
+                self.episodes["episode"].tolist(),
+            )
+        )
+
+    def codes(
+        self,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+    ) -> np.ndarray:
+        """Episode codes matching a key filter.
+
+        Each filter may be a scalar, a list of accepted values, or ``None``
+        to accept everything.
+
+        Parameters
+        ----------
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+
+        Returns
+        -------
+        np.ndarray :
+            Sorted episode codes.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in zip(INDEX_COLUMNS, [serial_no, load, episode]):
+            if value is None:
+                continue
+            if np.ndim(value) == 0:
+                value = [value]
+            mask &= self.episodes[name].isin(list(value)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def prefix_codes(self, *key: Any) -> np.ndarray:
+        """Episode codes of an episode or of all episodes sharing a key prefix.
+
+        Parameters
+        ----------
+        *key : Any
+            ``serial_no``, optionally followed by ``load`` and ``episode``.
+
+        Returns
+        -------
+        np.ndarray :
+            Contiguous range of episode codes.
+
+        Raises
+        ------
+        KeyError
+            If no episode matches the key.
+        """
+        first, last = self._prefixes[tuple(key)]
+        return np.arange(first, last)
+
+    def rows(self, *key: Any) -> Tuple[int, int]:
+        """Row range of an episode or of all episodes sharing a key prefix.
+
+        Parameters
+        ----------
+        *key : Any
+            ``serial_no``, optionally followed by ``load`` and ``episode``.
+
+        Returns
+        -------
+        Tuple[int, int] :
+            First row and one past the last row.
+
+        Raises
+        ------
+        KeyError
+            If no episode matches the key.
+        """
+        first, last = self._prefixes[tuple(key)]
+        return int(self.starts[first]), int(self.stops[last - 1])
+
+    def length(self, *key: Any) -> int:
+        """Number of rows of an episode or of a key prefix.
+
+        Parameters
+        ----------
+        *key : Any
+            ``serial_no``, optionally followed by ``load`` and ``episode``.
+
+        Returns
+        -------
+        int :
+            Number of rows.
+        """
+        start, stop = self.rows(*key)
+        return stop - start
+
+    def offset(self, column: str, *key: Any) -> int:
+        """Byte offset of an episode's first row in a column file.
+
+        Allows reading an episode with ``numpy.memmap`` or ``numpy.fromfile``
+        without parsing the ``.npy`` header.
+
+        Parameters
+        ----------
+        column : str
+            Numeric column name.
+        *key : Any
+            ``serial_no``, optionally followed by ``load`` and ``episode``.
+
+        Returns
+        -------
+        int :
+            Byte offset from the start of ``columns/<column>.npy``.
+        """
+        start, _ = self.rows(*key)
+        return self._data_offsets[column] + start * self._itemsizes[column]
+
+    def groups(
+        self,
+        by: List[str],
+        codes: Optional[np.ndarray] = None,
+    ) -> Iterator[Tuple[Tuple[Any, ...], np.ndarray]]:
+        """Group episodes by a prefix of the episode key.
+
+        Parameters
+        ----------
+        by : List[str]
+            Prefix of ``["serial_no", "load", "episode"]``.
+        codes : Optional[np.ndarray]
+            Sorted episode codes to group. Groups all episodes if ``None``.
+
+        Yields
+        ------
+        Tuple[Tuple[Any, ...], np.ndarray] :
+            Group key and the episode codes in that group.
+
+        Raises
+        ------
+        ValueError
+            If ``by`` is not a prefix of the episode key.
+        """
+        if list(by) != INDEX_COLUMNS[: len(by)]:
+            raise ValueError(f"`by` must be a prefix of {INDEX_COLUMNS}.")
+        if codes is None:
+            codes = np.arange(len(self))
+        keys = self.keys()
+        group_keys = [keys[code][: len(by)] for code in codes]
+        first = 0
+        for i in range(1, len(group_keys) + 1):
+            if i == len(group_keys) or group_keys[i] != group_keys[first]:
+                yield group_keys[first], codes[first:i]
+                first = i
+
+
+class DatasetStore:
+    """Read-only view of a columnar dataset store.
+
+    Attributes
+    ----------
+    attrs : Dict[str, Any]
+        Dataset attributes (e.g., ``t_step``).
+    columns : List[str]
+        All columns of the dataset, in their original order.
+    episodes : pandas.DataFrame
+        Episode key table with columns ``serial_no``, ``load``, ``episode``,
+        and ``timestamp``, sorted by key. Its index is the episode code.
+    index : EpisodeIndex
+        Episode index built at ingest time.
+    compact : bool
+        True if the store uses compact dtypes.
+    """
+
+    def __init__(self, store_path: pathlib.Path) -> None:
+        """Open a store without reading any column data.
+
+        Parameters
+        ----------
+        store_path : pathlib.Path
+            Store directory.
+        """
+        self.store_path = store_path
+        self._meta = json.loads(meta_path(store_path).read_text())
+        self._arrays = {}
+        self._segments = None
+        self.attrs = self._meta["attrs"]
+        self.columns = self._meta["column_order"]
+        self.compact = self._meta.get("compact", False)
+        self._derived = self._meta.get("derived", [])
+        self._categories = {}
+        self._category_codes = {}
+        episodes = {}
+        for name in KEY_COLUMNS:
+            values = np.array(self._meta["episodes"][name])
+            if name in CATEGORICAL_COLUMNS:
+                categories = np.array(self._meta["categories"][name], dtype=object)
+                self._categories[name] = categories
+                self._category_codes[name] = values.astype(int)
+                values = categories[values.astype(int)] if values.size else values
+            episodes[name] = values
+        self.episodes = pandas.DataFrame(episodes, columns=KEY_COLUMNS)
+        self.episodes["load"] = self.episodes["load"].astype(bool)
+        self.episodes["episode"] = self.episodes["episode"].astype(int)
+        self.index = EpisodeIndex(
+            self.episodes,
+            self._meta["episodes"]["start"],
+            self._meta["episodes"]["length"],
+            self._meta["dtypes"],
+            self._meta["data_offsets"],
+        )
+
+    def __len__(self) -> int:
+        return self._meta["n_rows"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-mapped numeric column.
+
+        Parameters
+        ----------
+        name : str
+            Column name.
+
+        Returns
+        -------
+        np.ndarray :
+            Read-only memory-mapped array covering every row.
+        """
+        if name not in self._arrays:
+            self._arrays[name] = np.load(
+                self.store_path.joinpath("columns", f"{name}.npy"),
+                mmap_mode="r",
+            )
+        return self._arrays[name]
+
+    def episode(
+        self,
+        serial_no: str,
+        load: bool,
+        episode: int,
+        columns: Optional[List[str]] = None,
+    ) -> pandas.DataFrame:
+        """Read one episode.
+
+        Parameters
+        ----------
+        serial_no : str
+            Serial number.
+        load : bool
+            Load flag.
+        episode : int
+            Episode number.
+        columns : Optional[List[str]]
+            Columns to read. Reads all columns if ``None``.
+
+        Returns
+        -------
+        pandas.DataFrame :
+            Episode dataframe.
+
+        Raises
+        ------
+        KeyError
+            If the episode is not in the store.
+        """
+        return self._read(self.index.prefix_codes(serial_no, load, episode), columns)
+
+    def select(
+        self,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+        columns: Optional[List[str]] = None,
+    ) -> pandas.DataFrame:
+        """Read all episodes matching a key filter.
+
+        Each filter may be a scalar, a list of accepted values, or ``None``
+        to accept everything.
+
+        Parameters
+        ----------
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+        columns : Optional[List[str]]
+            Columns to read. Reads all columns if ``None``.
+
+        Returns
+        -------
+        pandas.DataFrame :
+            Matching rows, sorted by ``(serial_no, load, episode, k)``.
+        """
+        codes = self.index.codes(serial_no=serial_no, load=load, episode=episode)
+        return self._read(codes, columns)
+
+    def groupby(
+        self,
+        by: List[str],
+        columns: Optional[List[str]] = None,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+    ) -> Iterator[Tuple[Tuple[Any, ...], pandas.DataFrame]]:
+        """Iterate over groups of episodes, reading one group at a time.
+
+        Equivalent to ``select(...).groupby(by=by)`` without materializing
+        the whole selection or scanning the key columns.
+
+        Parameters
+        ----------
+        by : List[str]
+            Prefix of ``["serial_no", "load", "episode"]``.
+        columns : Optional[List[str]]
+            Columns to read. Reads all columns if ``None``.
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+
+        Yields
+        ------
+        Tuple[Tuple[Any, ...], pandas.DataFrame] :
+            Group key and group dataframe.
+        """
+        codes = self.index.codes(serial_no=serial_no, load=load, episode=episode)
+        for key, group_codes in self.index.groups(by, codes):
+            yield key, self._read(group_codes, columns)
+
+    def iter_episodes(
+        self,
+        columns: Optional[List[str]] = None,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+    ) -> Iterator[Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]]]:
+        """Iterate over episodes as NumPy arrays, without building dataframes.
+
+        Arrays are views into the memory-mapped columns, so only the pages of
+        the current episode are read.
+
+        Parameters
+        ----------
+        columns : Optional[List[str]]
+            Numeric columns to read. Reads all of them if ``None``.
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+
+        Yields
+        ------
+        Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]] :
+            ``(serial_no, load, episode)`` and the episode's columns, in key
+            order.
+        """
+        if columns is None:
+            columns = [name for name in self.columns if name not in KEY_COLUMNS]
+        keys = self.index.keys()
+        for code in self.index.codes(serial_no=serial_no, load=load, episode=episode):
+            yield keys[code], self._arrays_of(code, columns)
+
+    def to_tensor(
+        self,
+        columns: List[str],
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+        codes: Optional[np.ndarray] = None,
+    ) -> Tuple[List[Tuple[str, bool, int]], np.ndarray]:
+        """Read episodes into one NaN-padded ``float64`` array.
+
+        The array is allocated once from the episode lengths in the index,
+        and each episode's columns are copied straight from the memory-mapped
+        column slices.
+
+        Parameters
+        ----------
+        columns : List[str]
+            Numeric columns to read, as channels.
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+        codes : Optional[np.ndarray]
+            Sorted episode codes to read, instead of a key filter.
+
+        Returns
+        -------
+        Tuple[List[Tuple[str, bool, int]], np.ndarray] :
+            ``(serial_no, load, episode)`` of each episode, in key order, and
+            an array with shape ``(n_episodes, max_length, len(columns))``.
+        """
+        if codes is None:
+            codes = self.index.codes(serial_no=serial_no, load=load, episode=episode)
+        codes = np.asarray(codes, dtype=int)
+        lengths = self.index.stops[codes] - self.index.starts[codes]
+        max_length = int(lengths.max()) if codes.shape[0] > 0 else 0
+        tensor = np.full((codes.shape[0], max_length, len(columns)), np.nan)
+        keys = self.index.keys()
+        for i, code in enumerate(codes):
+            arrays = self._arrays_of(code, columns)
+            for j, name in enumerate(columns):
+                tensor[i, : lengths[i], j] = arrays[name]
+        return [keys[code] for code in codes], tensor
+
+    def segments(
+        self,
+        min_length: int = 0,
+        min_vel: float = 0,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+    ) -> pandas.DataFrame:
+        """Constant-velocity segments found at ingest time.
+
+        Parameters
+        ----------
+        min_length : int
+            Only return segments longer than this many samples.
+        min_vel : float
+            Only return segments whose target speed exceeds this (rad/s).
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+
+        Returns
+        -------
+        pandas.DataFrame :
+            Segment table with columns ``serial_no``, ``load``, ``episode``,
+            ``start``, ``stop``, ``direction``, and ``target_joint_vel``.
+            ``start`` and ``stop`` are sample indices within the episode, and
+            ``direction`` is ``"forward"``, ``"reverse"``, or
+            ``"stationary"``. The target velocity is constant within each
+            segment, so it is also the segment's mean.
+        """
+        table = self._select_segments(min_length, min_vel, serial_no, load, episode)
+        keys = self.episodes.loc[table["code"], INDEX_COLUMNS].reset_index(drop=True)
+        return pandas.concat([keys, table.drop(columns="code")], axis=1)
+
+    def iter_segments(
+        self,
+        columns: Optional[List[str]] = None,
+        min_length: int = 0,
+        min_vel: float = 0,
+        trim: int = 0,
+        serial_no: Any = None,
+        load: Any = None,
+        episode: Any = None,
+    ) -> Iterator[Tuple[Tuple[str, bool, int], str, Dict[str, np.ndarray]]]:
+        """Iterate over constant-velocity segments as NumPy arrays.
+
+        Only the samples of qualifying segments are read.
+
+        Parameters
+        ----------
+        columns : Optional[List[str]]
+            Numeric columns to read. Reads all of them if ``None``.
+        min_length : int
+            Only return segments longer than this many samples.
+        min_vel : float
+            Only return segments whose target speed exceeds this (rad/s).
+        trim : int
+            Number of samples to drop at each end of a segment.
+        serial_no : Any
+            Serial number filter.
+        load : Any
+            Load flag filter.
+        episode : Any
+            Episode number filter.
+
+        Yields
+        ------
+        Tuple[Tuple[str, bool, int], str, Dict[str, np.ndarray]] :
+            ``(serial_no, load, episode)``, segment direction, and the
+            segment's trimmed columns, in key order.
+        """
+        if columns is None:
+            columns = [name for name in self.columns if name not in KEY_COLUMNS]
+        table = self._select_segments(min_length, min_vel, serial_no, load, episode)
+        keys = self.index.keys()
+        for code, start, stop, direction in zip(
+            table["code"], table["start"], table["stop"], table["direction"]
+        ):
+            arrays = self._arrays_of(code, columns, start + trim, stop - trim)
+            yield keys[code], direction, arrays
+
+    def to_dataframe(self, columns: Optional[List[str]] = None) -> pandas.DataFrame:
+        """Read the whole dataset.
+
+        Parameters
+        ----------
+        columns : Optional[List[str]]
+            Columns to read. Reads all columns if ``None``.
+
+        Returns
+        -------
+        pandas.DataFrame :
+            Dataset dataframe, equivalent to the one that was written.
+        """
+        return self._read(np.arange(len(self.index)), columns)
+
+    def _arrays_of(
+        self,
+        code: int,
+        columns: List[str],
+        first: int = 0,
+        last: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Read samples ``first:last`` of one episode's numeric columns."""
+        start = self.index.starts[code] + first
+        if last is None:
+            stop = self.index.stops[code]
+        else:
+            stop = max(self.index.starts[code] + last, start)
+        arrays = {}
+        for name in columns:
+            if name in self._derived:
+                k = np.asarray(self.column("k")[start:stop])
+                arrays[name] = k * self.attrs["t_step"]
+            else:
+                arrays[name] = np.asarray(self.column(name)[start:stop])
+        return arrays
+
+    def _segment_table(self) -> pandas.DataFrame:
+        """Load the segment table, keyed by episode code."""
+        if self._segments is None:
+            segments_path = self.store_path.joinpath("segments")
+            self._segments = pandas.DataFrame(
+                {
+                    name: np.load(segments_path.joinpath(f"{name}.npy"))
+                    for name in ["code", "start", "stop", "target_joint_vel"]
+                }
+            )
+        return self._segments
+
+    def _select_segments(
+        self,
+        min_length: int,
+        min_vel: float,
+        serial_no: Any,
+        load: Any,
+        episode: Any,
+    ) -> pandas.DataFrame:
+        """Filter the segment table and label segment directions."""
+        table = self._segment_table()
+        codes = self.index.codes(serial_no=serial_no, load=load, episode=episode)
+        tvel = table["target_joint_vel"].to_numpy()
+        mask = (
+            np.isin(table["code"].to_numpy(), codes)
+            & (table["stop"].to_numpy() - table["start"].to_numpy() > min_length)
+            & (np.abs(tvel) > min_vel)
+        )
+        table = table.loc[mask].reset_index(drop=True)
+        tvel = tvel[mask]
+        table.insert(
+            3,
+            "direction",
+            np.where(tvel > 0, "forward", np.where(tvel < 0, "reverse", "stationary")),
+        )
+        return table
+
+    def _read(
+        self,
+        codes: np.ndarray,
+        columns: Optional[List[str]],
+    ) -> pandas.DataFrame:
+        """Read the rows of the given episode codes into a dataframe."""
+        if columns is None:
+            columns = self.columns
+        starts = self.index.starts[codes]
+        stops = self.index.stops[codes]
+        lengths = stops - starts
+        ranges = _merge_ranges(starts, stops)
+        data = {}
+        for name in columns:
+            if self.compact and name in CATEGORICAL_COLUMNS:
+                data[name] = pandas.Categorical.from_codes(
+                    np.repeat(self._category_codes[name][codes], lengths),
+                    categories=self._categories[name],
+                )
+            elif name in KEY_COLUMNS:
+                data[name] = np.repeat(self.episodes[name].to_numpy()[codes], lengths)
+            elif name in self._derived:
+                # Only ``t`` is derived, from ``k``
+                data[name] = _gather(self.column("k"), ranges) * self.attrs["t_step"]
+            else:
+                data[name] = _gather(self.column(name), ranges)
+        # Reproduce the per-episode ``RangeIndex`` of the original dataframe
+        index = np.arange(np.sum(lengths)) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        df = pandas.DataFrame(data, columns=columns, index=index)
+        df.attrs.update(self.attrs)
+        return df
+
+
+class PartitionedStore(DatasetStore):
+    """Read-only view of selected partitions of a partitioned store.
+
+    Episodes of all selected partitions are merged into one episode key
+    table, so the API matches :class:`DatasetStore`. Row ranges of
+    :attr:`index` are numbered as if the partitions were concatenated, and
+    column byte offsets are not available.
+
+    Attributes
+    ----------
+    partitions : List[Tuple[str, str]]
+        ``(batch, serial_no)`` of each selected partition.
+    """
+
+    def __init__(
+        self,
+        store_path: pathlib.Path,
+        batches: Optional[List[str]] = None,
+        serial_nos: Optional[List[str]] = None,
+    ) -> None:
+        """Open the selected partitions without reading any column data.
+
+        Parameters
+        ----------
+        store_path : pathlib.Path
+            Partitioned store directory.
+        batches : Optional[List[str]]
+            Batches to open. Opens all ingested batches if ``None``.
+        serial_nos : Optional[List[str]]
+            Units to open. Opens all units if ``None``.
+
+        Raises
+        ------
+        ValueError
+            If an episode key occurs in more than one selected partition.
+        """
+        self.store_path = store_path
+        if batches is None:
+            batches = sorted(
+                path.parent.name for path in store_path.glob(f"*/{PARTITIONS_FILE}")
+            )
+        self.partitions = []
+        self._stores = []
+        for batch in batches:
+            listing = json.loads(partitions_path(store_path, batch).read_text())
+            for serial_no in sorted(listing["partitions"]):
+                if serial_nos is not None and serial_no not in serial_nos:
+                    continue
+                self.partitions.append((batch, serial_no))
+                self._stores.append(DatasetStore(store_path.joinpath(batch, serial_no)))
+        # Merge episode key tables of all partitions
+        tables = []
+        for partition, store in enumerate(self._stores):
+            table = store.episodes.copy()
+            table["partition"] = partition
+            table["code"] = np.arange(len(store.index))
+            table["length"] = store.index.stops - store.index.starts
+            tables.append(table)
+        if tables:
+            table = pandas.concat(tables, ignore_index=True)
+        else:
+            table = pandas.DataFrame(
+                columns=KEY_COLUMNS + ["partition", "code", "length"]
+            )
+        table = table.sort_values(by=INDEX_COLUMNS, kind="stable").reset_index(
+            drop=True
+        )
+        if table.duplicated(subset=INDEX_COLUMNS).any():
+            raise ValueError("Episode keys must be unique across partitions.")
+        self._partition_of = table["partition"].to_numpy(dtype=int)
+        self._code_of = table["code"].to_numpy(dtype=int)
+        lengths = table["length"].to_numpy(dtype=int)
+        self.episodes = table[KEY_COLUMNS].copy()
+        self.index = EpisodeIndex(
+            self.episodes,
+            np.cumsum(lengths) - lengths,
+            lengths,
+            {},
+            {},
+        )
+        self._n_rows = int(np.sum(lengths))
+        self.attrs = {}
+        for store in self._stores:
+            self.attrs.update(store.attrs)
+        self.columns = self._stores[0].columns if self._stores else []
+        self.compact = bool(self._stores) and all(s.compact for s in self._stores)
+        self._derived = []
+        self._segments = None
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def column(self, name: str) -> np.ndarray:
+        """Numeric column gathered from all partitions.
+
+        Parameters
+        ----------
+        name : str
+            Column name.
+
+        Returns
+        -------
+        np.ndarray :
+            In-memory array covering every row, in merged episode order.
+        """
+        if not self._stores:
+            return np.empty(0)
+        # Gather each run of episodes in the same partition at once
+        firsts = np.flatnonzero(np.diff(self._partition_of, prepend=-1) != 0)
+        lasts = np.append(firsts[1:], self._partition_of.shape[0])
+        pieces = []
+        for first, last in zip(firsts, lasts):
+            store = self._stores[self._partition_of[first]]
+            codes = self._code_of[first:last]
+            ranges = _merge_ranges(store.index.starts[codes], store.index.stops[codes])
+            pieces.append(_gather(store.column(name), ranges))
+        return np.concatenate(pieces)
+
+    def _arrays_of(
+        self,
+        code: int,
+        columns: List[str],
+        first: int = 0,
+        last: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Read samples ``first:last`` of one episode's numeric columns."""
+        store = self._stores[self._partition_of[code]]
+        return store._arrays_of(self._code_of[code], columns, first, last)
+
+    def _segment_table(self) -> pandas.DataFrame:
+        """Merge the segment tables of all partitions."""
+        if self._segments is None:
+            tables = []
+            for partition, store in enumerate(self._stores):
+                # Map partition episode codes to merged episode codes
+                codes = np.flatnonzero(self._partition_of == partition)
+                lookup = np.empty(len(store.index), dtype=int)
+                lookup[self._code_of[codes]] = codes
+                table = store._segment_table().copy()
+                table["code"] = lookup[table["code"].to_numpy()]
+                tables.append(table)
+            if tables:
+                self._segments = (
+                    pandas.concat(tables, ignore_index=True)
+                    .sort_values(by="code", kind="stable")
+                    .reset_index(drop=True)
+                )
+            else:
+                self._segments = pandas.DataFrame(
+                    columns=["code", "start", "stop", "target_joint_vel"]
+                )
+        return self._segments
+
+    def _read(
+        self,
+        codes: np.ndarray,
+        columns: Optional[List[str]],
+    ) -> pandas.DataFrame:
+        """Read the rows of the given episode codes into a dataframe."""
+        if not self._stores:
+            return pandas.DataFrame(columns=self.columns if columns is None else columns)
+        codes = np.asarray(codes, dtype=int)
+        partitions = self._partition_of[codes]
+        # Read each run of codes in the same partition at once
+        firsts = np.flatnonzero(np.diff(partitions, prepend=-1) != 0)
+        lasts = np.append(firsts[1:], codes.shape[0])
+        frames = [
+            self._stores[partitions[first]]._read(self._code_of[codes[first:last]], columns)
+            for first, last in zip(firsts, lasts)
+        ]
+        if not frames:
+            frames = [self._stores[0]._read(codes, columns)]
+        df = pandas.concat(frames) if len(frames) > 1 else frames[0]
+        if self.compact:
+            # Categories differ between partitions
+            for name in CATEGORICAL_COLUMNS:
+                if name in df.columns:
+                    df[name] = df[name].astype("category")
+        df.attrs = dict(self.attrs)
+        return df
+
+
+def _merge_ranges(
+    starts: np.ndarray,
+    stops: np.ndarray,
+) -> List[Tuple[int, int]]:
+    """Merge adjacent ``[start, stop)`` row ranges."""
+    ranges = []
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _gather(array: np.ndarray, ranges: List[Tuple[int, int]]) -> np.ndarray:
+    """Copy row ranges of a (memory-mapped) column into memory."""
+    if len(ranges) == 1:
+        return np.array(array[ranges[0][0] : ranges[0][1]])
+    return np.concatenate([array[start:stop] for start, stop in ranges] + [array[:0]])
+
+
+def _sort_episodes(df: pandas.DataFrame) -> pandas.DataFrame:
+    """Sort contiguous episodes by key, moving whole episodes at a time."""
+    keys = df[["serial_no", "load", "episode"]].reset_index(drop=True)
+    new_episode = (keys != keys.shift()).any(axis=1).to_numpy()
+    starts = np.flatnonzero(new_episode)
+    stops = np.append(starts[1:], keys.shape[0])
+    episode_keys = list(keys.iloc[starts].itertuples(index=False, name=None))
+    order = sorted(range(starts.shape[0]), key=episode_keys.__getitem__)
+    rows = np.concatenate(
+        [np.arange(starts[i], stops[i]) for i in order] + [np.array([], dtype=int)]
+    )
+    return df.iloc[rows]
+
+
+def _save(path: pathlib.Path, array: np.ndarray) -> int:
+    """Save an array atomically, so existing memory maps keep the old data.
+
+    Returns the byte offset of the array data in the file.
+    """
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r").offset
@@ -4,44 +4,339 @@ Actions associated with tasks defined here can be found in ``actions.py``.
 """
 
 import pathlib
+import shutil
 
 import doit
 import numpy as np
 
 import actions
+import dataset_store
+import dtw_kmeans
+import raw_dataset
 
 # Directory containing ``dodo.py``
 WD = pathlib.Path(__file__).parent.resolve()
 K = 6
+# Numbers of clusters evaluated by ``doit sweep_clustering_k``
+K_SWEEP = list(range(2, 11))
 FEATURES_TO_CLUSTER = [['joint_vel', 'target_joint_vel']]
 CLUSTERING_NUM = len(FEATURES_TO_CLUSTER)
+# DTW k-means solver, either ``"pruned"`` (skips exact DTW distances using
+# lower bounds) or ``"tslearn"``, which give identical clusters if
+# ``DTW_BAND`` is empty (tslearn's barycenters ignore the band), or
+# ``"multires"`` (clusters downsampled episodes first), ``"minibatch"``
+# (updates centers from random batches of episodes), ``"kmedoids"``
+# (uses the cached pairwise DTW distances of ``compute_dtw_distances``), or
+# ``"embedding"`` (Euclidean k-means on velocity error features, no DTW).
+# The embedding is always that of ``joint_vel - target_joint_vel``, so with
+# ``"embedding"`` every entry of ``FEATURES_TO_CLUSTER`` gets the same clusters
+# and only the channels of its centers differ.
+CLUSTERING_SOLVER = "pruned"
+# Number of episodes per step of the ``"minibatch"`` solver
+MINIBATCH_SIZE = 64
+# Keep the clusters when new batches arrive and only assign their episodes
+# with ``assign_new_episodes``, instead of clustering everything again
+INCREMENTAL_CLUSTERING = False
+# Ratio of the RMS DTW distance of assigned episodes to their centers to that
+# of the clustered episodes above which a refit is recommended
+DRIFT_THRESHOLD = 1.5
+# Number of samples averaged into one by the ``"multires"`` solver
+PAA_FACTOR = 10
+# Global constraint on DTW warping paths, as ``metric_params`` of
+# ``tslearn.metrics.dtw``, e.g.,
+# ``{"global_constraint": "sakoe_chiba", "sakoe_chiba_radius": 200}`` or
+# ``{"global_constraint": "itakura", "itakura_max_slope": 2.0}``. Empty for
+# unconstrained DTW.
+DTW_BAND = {}
+# Number of samples a test episode is streamed for before its cluster can be
+# chosen (1 kHz sampling)
+STREAMING_MIN_SAMPLES = 2000
+# Phase estimator of ``compute_phase`` and ``compute_cluster_phase``, either
+# ``"grid"`` (best of 1000 trial phases) or ``"closed_form"`` (solves for the
+# optimal phase from two inner products, within half a grid step of ``"grid"``)
+PHASE_ESTIMATOR = "closed_form"
+# Estimate the frequency of the sine lifting function together with its phase
+# with ``compute_frequency`` and ``compute_cluster_frequency``, instead of
+# assuming the frequency of the 100:1 gear ratio. Cluster centers only use
+# their estimates with the ``"kmedoids"`` and ``"embedding"`` solvers.
+ESTIMATE_LIFTING_FREQUENCY = False
+# Number of worker processes for parallel actions (-1 uses all cores)
+N_JOBS = -1
+# Only parse raw episode files that changed since the last preprocessing run
+INCREMENTAL_PREPROCESSING = True
+# Store the dataset with compact dtypes (float32 where accurate enough)
+COMPACT_DATASET = False
+# Synthetic raw data batches to generate in ``dataset/raw/`` for scaling
+# benchmarks, keyed by batch name, with keyword arguments of
+# ``synthetic_dataset.generate_batch``, e.g.,
+# ``{"synthetic_100": {"n_units": 100, "n_episodes": 20, "n_samples": 4000}}``
+SYNTHETIC_BATCHES = {}
+# Raw data batches (directories in ``dataset/raw/``) read by downstream tasks
+DATASET_BATCHES = ["batch_b"]
 
 def task_preprocess_experiments():
-    """Preprocess raw data into pickle containing a dataframe."""
-    raw_dataset = WD.joinpath("dataset", "raw", "batch_b")
-    preprocessed_dataset = WD.joinpath("build", "dataset.pickle")
+    """Preprocess raw data batches into a partitioned dataset store."""
+    raw_path = WD.joinpath("dataset", "raw")
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    # Synthetic batches may not have been generated yet
+    batches = sorted(set(raw_dataset.find_batches(raw_path)) | set(SYNTHETIC_BATCHES))
+    for batch in batches:
+        raw_dataset_path = raw_path.joinpath(batch)
+        batch_dataset = preprocessed_dataset.joinpath(batch)
+        partitions = dataset_store.partitions_path(preprocessed_dataset, batch)
+        manifest = batch_dataset.joinpath("manifest.json")
+        yield {
+            "name": batch,
+            "actions": [
+                (
+                    actions.action_preprocess_experiments,
+                    (
+                        raw_dataset_path,
+                        batch_dataset,
+                        N_JOBS,
+                        INCREMENTAL_PREPROCESSING,
+                        COMPACT_DATASET,
+                    ),
+                )
+            ],
+            "targets": [partitions, manifest],
+            "uptodate": [
+                (
+                    raw_dataset.manifest_unchanged,
+                    (raw_dataset_path, manifest),
+                    {},
+                ),
+                doit.tools.config_changed({"compact": COMPACT_DATASET}),
+            ],
+            "clean": [(shutil.rmtree, (batch_dataset, True))],
+            "task_dep": (
+                [f"generate_synthetic_dataset:{batch}"]
+                if batch in SYNTHETIC_BATCHES
+                else []
+            ),
+        }
+
+
+def task_generate_synthetic_dataset():
+    """Generate synthetic raw data batches for scaling benchmarks."""
+    for batch, config in SYNTHETIC_BATCHES.items():
+        batch_path = WD.joinpath("dataset", "raw", batch)
+        synthetic = batch_path.joinpath("synthetic.json")
+        yield {
+            "name": batch,
+            "actions": [
+                (
+                    actions.action_generate_synthetic_dataset,
+                    (
+                        batch_path,
+                        synthetic,
+                        config,
+                    ),
+                )
+            ],
+            "targets": [synthetic],
+            "uptodate": [doit.tools.config_changed(config)],
+            "clean": [(shutil.rmtree, (batch_path, True))],
+        }
+
+def task_benchmark_csv_reader():
+    """Benchmark raw CSV parsing throughput."""
+    raw_dataset_path = WD.joinpath("dataset", "raw", DATASET_BATCHES[0])
+    benchmark = WD.joinpath("build", "csv_reader_benchmark.json")
+    return {
+        "actions": [
+            (
+                actions.action_benchmark_csv_reader,
+                (
+                    raw_dataset_path,
+                    benchmark,
+                ),
+            )
+        ],
+        "file_dep": [WD.joinpath("raw_dataset.py")],
+        "targets": [benchmark],
+        "clean": True,
+    }
+
+def task_compute_dtw_distances():
+    """Compute and cache pairwise DTW distances between all episodes."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    for features in FEATURES_TO_CLUSTER:
+        distances = dtw_kmeans.distances_path(
+            WD.joinpath("build", "dtw_distances"),
+            features,
+            DTW_BAND,
+            DATASET_BATCHES,
+        )
+        yield {
+            "name": "-".join(features),
+            "actions": [
+                (
+                    actions.action_compute_dtw_distances,
+                    (
+                        preprocessed_dataset,
+                        distances,
+                        features,
+                        DTW_BAND,
+                        N_JOBS,
+                        DATASET_BATCHES,
+                    ),
+                )
+            ],
+            "file_dep": preprocessed_dataset_partitions,
+            "targets": [distances, distances.with_suffix(".json")],
+            "clean": True,
+        }
+
+def task_benchmark_multiresolution_clustering():
+    """Benchmark multi-resolution against full-resolution DTW k-means."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    benchmark = WD.joinpath("build", "multiresolution_clustering_benchmark.json")
+    return {
+        "actions": [
+            (
+                actions.action_benchmark_multiresolution_clustering,
+                (
+                    preprocessed_dataset,
+                    benchmark,
+                    K,
+                    FEATURES_TO_CLUSTER,
+                    PAA_FACTOR,
+                    DTW_BAND,
+                    DATASET_BATCHES,
+                ),
+            )
+        ],
+        "file_dep": preprocessed_dataset_partitions,
+        "targets": [benchmark],
+        "uptodate": [
+            doit.tools.config_changed(
+                {"k": K, "paa_factor": PAA_FACTOR, "dtw_band": DTW_BAND}
+            )
+        ],
+        "clean": True,
+    }
+
+def task_benchmark_embedding_clustering():
+    """Benchmark embedding k-means against DTW k-means."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    benchmark = WD.joinpath("build", "embedding_clustering_benchmark.json")
+    return {
+        "actions": [
+            (
+                actions.action_benchmark_embedding_clustering,
+                (
+                    preprocessed_dataset,
+                    benchmark,
+                    K,
+                    FEATURES_TO_CLUSTER,
+                    DTW_BAND,
+                    DATASET_BATCHES,
+                ),
+            )
+        ],
+        "file_dep": preprocessed_dataset_partitions,
+        "targets": [benchmark],
+        "uptodate": [doit.tools.config_changed({"k": K, "dtw_band": DTW_BAND})],
+        "clean": True,
+    }
+
+def task_benchmark_minibatch_clustering():
+    """Benchmark mini-batch against full-batch DTW k-means."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    benchmark = WD.joinpath("build", "minibatch_clustering_benchmark.json")
     return {
         "actions": [
             (
-                actions.action_preprocess_experiments,
+                actions.action_benchmark_minibatch_clustering,
                 (
-                    raw_dataset,
                     preprocessed_dataset,
+                    benchmark,
+                    K,
+                    FEATURES_TO_CLUSTER,
+                    MINIBATCH_SIZE,
+                    DTW_BAND,
+                    DATASET_BATCHES,
+                ),
+            )
+        ],
+        "file_dep": preprocessed_dataset_partitions,
+        "targets": [benchmark],
+        "uptodate": [
+            doit.tools.config_changed(
+                {"k": K, "minibatch_size": MINIBATCH_SIZE, "dtw_band": DTW_BAND}
+            )
+        ],
+        "clean": True,
+    }
+
+def task_sweep_clustering_k():
+    """Evaluate clustering quality for each number of clusters in ``K_SWEEP``."""
+    distances_dir = WD.joinpath("build", "dtw_distances")
+    distances = [
+        dtw_kmeans.distances_path(distances_dir, features, DTW_BAND, DATASET_BATCHES)
+        for features in FEATURES_TO_CLUSTER
+    ]
+    # Barycenter-based solvers all sweep with exact DTW k-means
+    solver = "kmedoids" if CLUSTERING_SOLVER == "kmedoids" else "pruned"
+    sweep = WD.joinpath("build", "k_sweep.json")
+    return {
+        "actions": [
+            (
+                actions.action_sweep_clustering_k,
+                (
+                    WD.joinpath("build", "dataset"),
+                    distances_dir,
+                    sweep,
+                    K_SWEEP,
+                    FEATURES_TO_CLUSTER,
+                    solver,
+                    DTW_BAND,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "targets": [preprocessed_dataset],
-        "uptodate": [doit.tools.check_timestamp_unchanged(str(raw_dataset))],
+        "file_dep": distances,
+        "targets": [sweep],
+        "uptodate": [
+            doit.tools.config_changed({"k_sweep": K_SWEEP, "solver": solver})
+        ],
         "clean": True,
     }
 
 def task_one_step_clustering():
     """Task to perform time series clustering using DTW with K-means."""
     
-    preprocessed_dataset = WD.joinpath("build", "dataset.pickle")
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
     cluster_centers = WD.joinpath("build", "DTW_K_means_clusters.pickle")
     cluster_preds = WD.joinpath("build", "cluster_preds.pickle")
     cluster_split_info = WD.joinpath("build", "cluster_split_info.pickle")
+    clustering_report = WD.joinpath("build", "clustering_report.json")
+    distances_dir = WD.joinpath("build", "dtw_distances")
+    distances = [
+        dtw_kmeans.distances_path(distances_dir, features, DTW_BAND, DATASET_BATCHES)
+        for features in FEATURES_TO_CLUSTER
+    ]
     
     return {
         "actions": [
@@ -52,13 +347,93 @@ def task_one_step_clustering():
                     cluster_centers,
                     cluster_preds,
                     cluster_split_info,
+                    clustering_report,
                     K,
-                    FEATURES_TO_CLUSTER
+                    FEATURES_TO_CLUSTER,
+                    CLUSTERING_SOLVER,
+                    DTW_BAND,
+                    PAA_FACTOR,
+                    MINIBATCH_SIZE,
+                    distances_dir,
+                    N_JOBS,
+                    DATASET_BATCHES,
+                ),
+            )
+        ],
+        "file_dep": [
+            # New episodes are assigned by ``assign_new_episodes`` instead
+            *([] if INCREMENTAL_CLUSTERING else preprocessed_dataset_partitions),
+            # Only k-medoids needs the distance matrices
+            *(distances if CLUSTERING_SOLVER == "kmedoids" else []),
+        ],
+        # Without the file dependencies, preprocessing must still run first
+        "task_dep": (
+            [f"preprocess_experiments:{batch}" for batch in DATASET_BATCHES]
+            if INCREMENTAL_CLUSTERING
+            else []
+        ),
+        "targets": [
+            cluster_centers,
+            cluster_preds,
+            cluster_split_info,
+            clustering_report,
+        ],
+        "uptodate": [
+            doit.tools.config_changed(
+                {
+                    "solver": CLUSTERING_SOLVER,
+                    "dtw_band": DTW_BAND,
+                    "paa_factor": PAA_FACTOR,
+                    "minibatch_size": MINIBATCH_SIZE,
+                }
+            ),
+            # Refit if the clustered batches change, but not for new batches
+            *(
+                [dataset_store.partitions_unchanged(preprocessed_dataset, DATASET_BATCHES)]
+                if INCREMENTAL_CLUSTERING
+                else []
+            ),
+        ],
+        "clean": True,
+    }
+
+def task_assign_new_episodes():
+    """Assign episodes that arrived after clustering to the stored centers."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    cluster_centers = WD.joinpath("build", "DTW_K_means_clusters.pickle")
+    cluster_preds = WD.joinpath("build", "cluster_preds.pickle")
+    cluster_split_info = WD.joinpath("build", "cluster_split_info.pickle")
+    assignment_report = WD.joinpath("build", "cluster_assignment_report.json")
+    return {
+        "actions": [
+            (
+                actions.action_assign_new_episodes,
+                (
+                    preprocessed_dataset,
+                    cluster_centers,
+                    cluster_preds,
+                    cluster_split_info,
+                    assignment_report,
+                    FEATURES_TO_CLUSTER,
+                    DTW_BAND,
+                    DRIFT_THRESHOLD,
+                    N_JOBS,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [preprocessed_dataset],
-        "targets": [cluster_centers, cluster_preds, cluster_split_info],
+        # Predictions are updated in place, so they are not a dependency
+        "file_dep": [
+            *preprocessed_dataset_partitions,
+            cluster_centers,
+            cluster_split_info,
+        ],
+        "targets": [assignment_report],
+        "uptodate": [doit.tools.config_changed({"drift_threshold": DRIFT_THRESHOLD})],
         "clean": True,
     }
 
@@ -72,17 +447,23 @@ def task_compute_cluster_phase():
                 (
                     cluster_centers,
                     cluster_phase,
+                    PHASE_ESTIMATOR,
                 ),
             )
         ],
         "file_dep": [cluster_centers],
         "targets": [cluster_phase],
+        "uptodate": [doit.tools.config_changed({"method": PHASE_ESTIMATOR})],
         "clean": True,
     }
 
 def task_compute_phase():
     """Compute phase offset."""
-    preprocessed_dataset = WD.joinpath("build", "dataset.pickle")
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
     phase = WD.joinpath("build", "phase.pickle")
     return {
         "actions": [
@@ -91,17 +472,98 @@ def task_compute_phase():
                 (
                     preprocessed_dataset,
                     phase,
+                    "store",
+                    DATASET_BATCHES,
+                    PHASE_ESTIMATOR,
+                    N_JOBS,
                 ),
             )
         ],
-        "file_dep": [preprocessed_dataset],
+        "file_dep": preprocessed_dataset_partitions,
         "targets": [phase],
+        "uptodate": [doit.tools.config_changed({"method": PHASE_ESTIMATOR})],
+        "clean": True,
+    }
+
+def task_compute_cluster_frequency():
+    """Compute lifting function frequency and phase of each cluster center."""
+    cluster_centers = WD.joinpath("build", "DTW_K_means_clusters.pickle")
+    cluster_frequency = WD.joinpath("build", "cluster_frequency.pickle")
+    return {
+        "actions": [
+            (
+                actions.action_compute_cluster_frequency,
+                (
+                    cluster_centers,
+                    cluster_frequency,
+                ),
+            )
+        ],
+        "file_dep": [cluster_centers],
+        "targets": [cluster_frequency],
+        "clean": True,
+    }
+
+def task_compute_frequency():
+    """Compute lifting function frequency and phase of each unit."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    frequency = WD.joinpath("build", "frequency.pickle")
+    return {
+        "actions": [
+            (
+                actions.action_compute_frequency,
+                (
+                    preprocessed_dataset,
+                    frequency,
+                    "store",
+                    DATASET_BATCHES,
+                    N_JOBS,
+                ),
+            )
+        ],
+        "file_dep": preprocessed_dataset_partitions,
+        "targets": [frequency],
+        "clean": True,
+    }
+
+def task_benchmark_phase_estimation():
+    """Benchmark the closed-form phase estimator against the grid search."""
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
+    benchmark = WD.joinpath("build", "phase_estimation_benchmark.json")
+    return {
+        "actions": [
+            (
+                actions.action_benchmark_phase_estimation,
+                (
+                    preprocessed_dataset,
+                    benchmark,
+                    DATASET_BATCHES,
+                ),
+            )
+        ],
+        "file_dep": preprocessed_dataset_partitions,
+        "targets": [benchmark],
         "clean": True,
     }
 
 def task_cluster_id_models():
     cluster_centers = WD.joinpath("build", "DTW_K_means_clusters.pickle")
     cluster_phase = WD.joinpath("build", "cluster_phase.pickle")
+    cluster_frequency = WD.joinpath("build", "cluster_frequency.pickle")
+    # Barycenters average out the ripple, so only centers that are episodes
+    # get an estimated frequency
+    estimate_frequency = ESTIMATE_LIFTING_FREQUENCY and CLUSTERING_SOLVER in [
+        "kmedoids",
+        "embedding",
+    ]
     cluster_models_linear = WD.joinpath("build", "cluster_models_linear.pickle")
     yield {
         "name": "linear",
@@ -121,29 +583,53 @@ def task_cluster_id_models():
         "actions": [
             (
                 actions.action_cluster_id_models,
-                (cluster_centers, cluster_phase, cluster_models_koopman, "koopman"),
+                (
+                    cluster_centers,
+                    cluster_phase,
+                    cluster_models_koopman,
+                    "koopman",
+                    cluster_frequency if estimate_frequency else None,
+                ),
             )
         ],
-        "file_dep": [cluster_centers, cluster_phase],
+        "file_dep": [
+            cluster_centers,
+            cluster_phase,
+            *([cluster_frequency] if estimate_frequency else []),
+        ],
         "targets": [cluster_models_koopman],
+        "uptodate": [
+            doit.tools.config_changed({"estimate_lifting_frequency": estimate_frequency})
+        ],
         "clean": True,
     }
 
 
 def task_id_models():
     """Identify linear and Koopman models."""
-    preprocessed_dataset = WD.joinpath("build", "dataset.pickle")
+    preprocessed_dataset = WD.joinpath("build", "dataset")
+    preprocessed_dataset_partitions = [
+        dataset_store.partitions_path(preprocessed_dataset, batch)
+        for batch in DATASET_BATCHES
+    ]
     phase = WD.joinpath("build", "phase.pickle")
+    frequency = WD.joinpath("build", "frequency.pickle")
     models_linear = WD.joinpath("build", "models_linear.pickle")
     yield {
         "name": "linear",
         "actions": [
             (
                 actions.action_id_models,
-                (preprocessed_dataset, phase, models_linear, "linear"),
+                (
+                    preprocessed_dataset,
+                    phase,
+                    models_linear,
+                    "linear",
+                    DATASET_BATCHES,
+                ),
             )
         ],
-        "file_dep": [preprocessed_dataset, phase],
+        "file_dep": [*preprocessed_dataset_partitions, phase],
         "targets": [models_linear],
         "clean": True,
     }
@@ -153,11 +639,27 @@ def task_id_models():
         "actions": [
             (
                 actions.action_id_models,
-                (preprocessed_dataset, phase, models_koopman, "koopman"),
+                (
+                    preprocessed_dataset,
+                    phase,
+                    models_koopman,
+                    "koopman",
+                    DATASET_BATCHES,
+                    frequency if ESTIMATE_LIFTING_FREQUENCY else None,
+                ),
             )
         ],
-        "file_dep": [preprocessed_dataset, phase],
+        "file_dep": [
+            *preprocessed_dataset_partitions,
+            phase,
+            *([frequency] if ESTIMATE_LIFTING_FREQUENCY else []),
+        ],
         "targets": [models_koopman],
+        "uptodate": [
+            doit.tools.config_changed(
+                {"estimate_lifting_frequency": ESTIMATE_LIFTING_FREQUENCY}
+            )
+        ],
         "clean": True,
     }
 
@@ -669,7 +1171,10 @@ def task_combine_uncertainties_observer():
 def task_synthesize_cluster_observer_test_phase():
     
     
-    dataset = WD.joinpath("build", "dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     cluster_split_info = WD.joinpath("build", "cluster_split_info.pickle")
     cluster_centers = WD.joinpath("build", "DTW_K_means_clusters.pickle")
     cluster_models_linear = WD.joinpath("build", "cluster_models_linear.pickle")
@@ -696,10 +1201,13 @@ def task_synthesize_cluster_observer_test_phase():
                     FEATURES_TO_CLUSTER,
                     K,
                     "linear",
+                    DTW_BAND,
+                    STREAMING_MIN_SAMPLES,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset,
+        "file_dep": [*dataset_partitions,
                      cluster_split_info,
                      cluster_centers,
                      cluster_models_linear,
@@ -711,6 +1219,11 @@ def task_synthesize_cluster_observer_test_phase():
             cluster_err_plot_linear,
             cluster_fft_plot_linear,
         ],
+        "uptodate": [
+            doit.tools.config_changed(
+                {"dtw_band": DTW_BAND, "streaming_min_samples": STREAMING_MIN_SAMPLES}
+            )
+        ],
         "clean": True,
     }
     
@@ -738,10 +1251,13 @@ def task_synthesize_cluster_observer_test_phase():
                     FEATURES_TO_CLUSTER,
                     K,
                     "koopman",
+                    DTW_BAND,
+                    STREAMING_MIN_SAMPLES,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset,
+        "file_dep": [*dataset_partitions,
                      cluster_split_info,
                      cluster_centers,
                      cluster_models_koopman,
@@ -753,13 +1269,21 @@ def task_synthesize_cluster_observer_test_phase():
             cluster_err_plot_koopman,
             cluster_fft_plot_koopman,
         ],
+        "uptodate": [
+            doit.tools.config_changed(
+                {"dtw_band": DTW_BAND, "streaming_min_samples": STREAMING_MIN_SAMPLES}
+            )
+        ],
         "clean": True,
     }
 
 
 def task_synthesize_observer():
     """Synthesize observer."""
-    dataset = WD.joinpath("build", "dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     models_linear = WD.joinpath("build", "models_linear.pickle")
     uncertainty_linear = WD.joinpath("build", "uncertainty_linear_noload.pickle")
     observer_linear = WD.joinpath("build", "observer_linear.pickle")
@@ -782,10 +1306,11 @@ def task_synthesize_observer():
                     err_plot_linear,
                     fft_plot_linear,
                     "linear",
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset, models_linear, uncertainty_linear],
+        "file_dep": [*dataset_partitions, models_linear, uncertainty_linear],
         "targets": [
             observer_linear,
             weight_plot_linear,
@@ -817,10 +1342,11 @@ def task_synthesize_observer():
                     err_plot_koopman,
                     fft_plot_koopman,
                     "koopman",
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset, models_koopman, uncertainty_koopman],
+        "file_dep": [*dataset_partitions, models_koopman, uncertainty_koopman],
         "targets": [
             observer_koopman,
             weight_plot_koopman,
@@ -834,7 +1360,10 @@ def task_synthesize_observer():
 
 def task_plot_fft():
     """Plot error FFT."""
-    dataset = WD.joinpath("build", "dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     error_fft = WD.joinpath("figures", "error_fft.pdf")
     return {
         "actions": [
@@ -843,10 +1372,12 @@ def task_plot_fft():
                 (
                     dataset,
                     error_fft,
+                    "store",
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset],
+        "file_dep": dataset_partitions,
         "targets": [error_fft],
         "clean": True,
     }
@@ -854,7 +1385,10 @@ def task_plot_fft():
 
 def task_plot_model_predictions():
     """Plot model predictions."""
-    dataset = WD.joinpath("build", "dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     models_linear = WD.joinpath("build", "models_linear.pickle")
     models_koopman = WD.joinpath("build", "models_koopman.pickle")
     pred_ref = WD.joinpath("figures", "model_predictions_ref.pdf")
@@ -873,10 +1407,11 @@ def task_plot_model_predictions():
                     pred_traj,
                     pred_err,
                     pred_fft,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset, models_linear, models_koopman],
+        "file_dep": [*dataset_partitions, models_linear, models_koopman],
         "targets": [pred_ref, pred_traj, pred_err, pred_fft],
         "clean": True,
     }
@@ -884,7 +1419,10 @@ def task_plot_model_predictions():
 
 def task_plot_model_tfs():
     """Plot model transfer functions."""
-    dataset = WD.joinpath("build", "dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     models_linear = WD.joinpath("build", "models_linear.pickle")
     models_koopman = WD.joinpath("build", "models_koopman.pickle")
     tfs_msv_linear = WD.joinpath("figures", "model_tfs_msv_linear.pdf")
@@ -903,10 +1441,11 @@ def task_plot_model_tfs():
                     tfs_msv_koopman,
                     tfs_mimo_linear,
                     tfs_mimo_koopman,
+                    DATASET_BATCHES,
                 ),
             )
         ],
-        "file_dep": [dataset, models_linear, models_koopman],
+        "file_dep": [*dataset_partitions, models_linear, models_koopman],
         "targets": [
             tfs_msv_linear,
             tfs_msv_koopman,
@@ -919,7 +1458,10 @@ def task_plot_model_tfs():
 
 def task_plot_observer():
     """Plot observer."""
-    dataset = WD.joinpath("build/dataset.pickle")
+    dataset = WD.joinpath("build", "dataset")
+    dataset_partitions = [
+        dataset_store.partitions_path(dataset, batch) for batch in DATASET_BATCHES
+    ]
     uncertainty_linear = WD.joinpath("build", "uncertainty_linear_noload.pickle")
     uncertainty_koopman = WD.joinpath("build", "uncertainty_koopman_noload.pickle")
     models_linear = WD.joinpath("build", "models_linear.pickle")
@@ -964,11 +1506,12 @@ def task_plot_observer():
                     obs_offnom_noload_traj,
                     obs_offnom_noload_err,
                     obs_offnom_noload_psd,
+                    DATASET_BATCHES,
                 ),
             )
         ],
         "file_dep": [
-            dataset,
+            *dataset_partitions,
             uncertainty_linear,
             uncertainty_koopman,
             models_linear,
@@ -0,0 +1,1586 @@
+"""DTW k-means with banded DTW and lower-bound pruning of the assignment step.
+
+:class:`PrunedTimeSeriesKMeans` is a drop-in replacement for
+``tslearn.clustering.TimeSeriesKMeans(metric="dtw")``. The initialization and
+the k-means and barycenter iterations follow tslearn, but each series is only
+compared with the centers whose DTW lower bound can still beat the best
+distance found so far. Since the bounds never exceed the exact DTW distance,
+the labels, centers, and inertia are identical to those of the unpruned
+estimator for unconstrained DTW. With a band, the barycenters are averaged
+along banded warping paths, whereas tslearn's barycenters ignore
+``metric_params``, so the centers, and then the labels, differ.
+
+Two lower bounds are used, both valid for unconstrained DTW between series of
+different lengths, and therefore for banded DTW too:
+
+* LB_Kim: every warping path starts at the first and ends at the last samples
+  of both series.
+* LB_Keogh: every sample of one series is matched to at least one sample of
+  the other, so its cost is at least its distance to the other series'
+  envelope. The bound is evaluated in both directions.
+
+Distances follow ``tslearn.metrics.dtw``: squared Euclidean sample costs
+summed along the path, with the square root taken at the end. Paths can be
+restricted to a Sakoe-Chiba band or an Itakura parallelogram, given as
+tslearn's ``metric_params``, e.g., ``{"global_constraint": "sakoe_chiba",
+"sakoe_chiba_radius": 100}``. Unlike tslearn, which builds full
+``(sz1, sz2)`` masks and cost matrices, only the cells inside the band are
+stored, so memory is proportional to the band width rather than to the
+length of the second series.
+
+:class:`MultiResolutionKMeans` clusters downsampled series first and only
+revisits ambiguous series at full resolution. :class:`MiniBatchKMeans` updates
+the centers from random batches of series. :class:`StreamingClassifier`
+assigns a series to a center from its first samples, with open-end DTW. :class:`KMedoids` clusters
+from a distance matrix computed once by :func:`pairwise_dtw`, and its
+centers are real series, so no barycenters are needed.
+"""
+
+import hashlib
+import json
+import pathlib
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numba
+import numpy as np
+import scipy.interpolate
+import scipy.optimize
+from tslearn.clustering import TimeSeriesKMeans
+from tslearn.clustering.kmeans import _k_init_metric
+from tslearn.clustering.utils import _check_full_length, _check_no_empty_cluster
+from tslearn.utils import to_time_series_dataset
+
+# Global constraints accepted by ``global_constraint``
+GLOBAL_CONSTRAINTS = [None, "sakoe_chiba", "itakura"]
+
+
+class PrunedTimeSeriesKMeans(TimeSeriesKMeans):
+    """DTW k-means with a pruned assignment step.
+
+    Takes the same parameters as ``tslearn.clustering.TimeSeriesKMeans``.
+    Pruning and banded DTW are only used when ``metric="dtw"``.
+
+    Attributes
+    ----------
+    n_pairs_ : int
+        Number of series-center pairs compared by assignment steps since the
+        last call to ``fit``.
+    n_dtw_ : int
+        Number of those pairs for which exact DTW was computed.
+    """
+
+    def fit(self, X, y=None, distances=None):
+        self.n_pairs_ = 0
+        self.n_dtw_ = 0
+        # Pairwise DTW distances of ``X``, e.g., from :func:`pairwise_dtw`,
+        # replace DTW in the k-means++ seeding and the first assignment
+        self._distances = distances
+        self._seeds = None
+        try:
+            return super().fit(X, y)
+        finally:
+            self._distances = None
+            self._seeds = None
+
+    def _fit_one_init(self, X, x_squared_norms, rs):
+        if (
+            self.metric != "dtw"
+            or not isinstance(self.init, str)
+            or self.init != "k-means++"
+        ):
+            return super()._fit_one_init(X, x_squared_norms, rs)
+        # Seed the centers with banded DTW, then let tslearn iterate from them
+        init = self.init
+        if getattr(self, "_distances", None) is not None:
+            self._seeds = _k_init_distances(self._distances, self.n_clusters, rs)
+            self.init = X[self._seeds]
+        else:
+            self.init = _k_init_metric(
+                X,
+                self.n_clusters,
+                cdist_metric=lambda x, y: cdist_dtw(
+                    x, y, self._get_metric_params(), self.n_jobs
+                ),
+                random_state=rs,
+            )
+        try:
+            return super()._fit_one_init(X, x_squared_norms, rs)
+        finally:
+            self.init = init
+
+    def _transform(self, X):
+        if self.metric != "dtw":
+            return super()._transform(X)
+        return cdist_dtw(
+            X, self.cluster_centers_, self._get_metric_params(), self.n_jobs
+        )
+
+    def _assign(self, X, update_class_attributes=True):
+        if self.metric != "dtw":
+            return super()._assign(X, update_class_attributes)
+        # Start from the previous labels, since centers move little between
+        # iterations
+        hint = (
+            self.labels_
+            if update_class_attributes
+            and getattr(self, "labels_", None) is not None
+            and len(self.labels_) == X.shape[0]
+            else None
+        )
+        seeds = getattr(self, "_seeds", None)
+        if update_class_attributes and seeds is not None:
+            # The centers are still the seeds, whose distances are known
+            self._seeds = None
+            seed_dists = np.asarray(self._distances[:, seeds])
+            labels = np.argmin(seed_dists, axis=1)
+            dists = seed_dists[np.arange(X.shape[0]), labels]
+            n_dtw = 0
+        else:
+            labels, dists, n_dtw = pruned_assignment(
+                X,
+                self.cluster_centers_,
+                hint=hint,
+                metric_params=self._get_metric_params(),
+                n_jobs=self.n_jobs,
+            )
+        if update_class_attributes:
+            self.labels_ = labels
+            _check_no_empty_cluster(self.labels_, self.n_clusters)
+            self.inertia_ = np.sum(dists**2) / X.shape[0]
+            self.n_pairs_ = getattr(self, "n_pairs_", 0) + dists.size * self.n_clusters
+            self.n_dtw_ = getattr(self, "n_dtw_", 0) + n_dtw
+        return labels
+
+    def _update_centroids(self, X):
+        if self.metric != "dtw":
+            return super()._update_centroids(X)
+        for k in range(self.n_clusters):
+            self.cluster_centers_[k] = dtw_barycenter_averaging(
+                X[self.labels_ == k],
+                init_barycenter=self.cluster_centers_[k],
+                metric_params=self._get_metric_params(),
+                n_jobs=self.n_jobs,
+            )
+
+
+class MultiResolutionKMeans:
+    """DTW k-means on downsampled series, refined at full resolution.
+
+    The series are first clustered with :class:`PrunedTimeSeriesKMeans` after
+    piecewise aggregate approximation (PAA), which averages every
+    ``paa_factor`` samples. The coarse centers are upsampled and refined with
+    DBA at full resolution. Only the series whose two nearest coarse centers
+    are within ``margin`` of each other are reassigned at full resolution,
+    after which the centers of the clusters that changed are refined again.
+    If a cluster loses all its series, they keep their coarse labels.
+
+    Parameters
+    ----------
+    n_clusters : int
+        Number of clusters.
+    paa_factor : int
+        Number of samples averaged into one coarse sample.
+    margin : float
+        A series is ambiguous if its second nearest coarse center is less
+        than ``1 + margin`` times farther than its nearest one.
+    max_iter : int
+        Maximum number of coarse k-means iterations.
+    max_iter_barycenter : int
+        Maximum number of DBA iterations per full-resolution refinement.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint at full resolution, see :func:`dtw`. Sakoe-Chiba
+        radii are divided by ``paa_factor`` for the coarse clustering.
+    random_state : Optional[int]
+        Random seed of the coarse k-means++ initialization.
+    n_jobs : Optional[int]
+        Number of threads.
+    verbose : bool
+        Print the coarse k-means progress.
+
+    Attributes
+    ----------
+    cluster_centers_ : np.ndarray
+        Full-resolution centers.
+    labels_ : np.ndarray
+        Label of each series.
+    coarse_inertia_ : float
+        Inertia of the coarse clustering, in units of the downsampled series,
+        so it is not comparable with the inertia of full-resolution solvers.
+    n_iter_ : int
+        Number of coarse k-means iterations.
+    n_ambiguous_ : int
+        Number of series reassigned at full resolution.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        paa_factor: int = 10,
+        margin: float = 0.1,
+        max_iter: int = 50,
+        max_iter_barycenter: int = 10,
+        metric_params: Optional[Dict[str, Any]] = None,
+        random_state: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        verbose: bool = False,
+    ):
+        self.n_clusters = n_clusters
+        self.paa_factor = paa_factor
+        self.margin = margin
+        self.max_iter = max_iter
+        self.max_iter_barycenter = max_iter_barycenter
+        self.metric_params = metric_params
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def fit(self, X, y=None):
+        X = to_time_series_dataset(X)
+        metric_params = {} if self.metric_params is None else self.metric_params
+        X_paa = paa(X, self.paa_factor)
+        coarse = PrunedTimeSeriesKMeans(
+            n_clusters=self.n_clusters,
+            max_iter=self.max_iter,
+            metric="dtw",
+            metric_params=_scale_band(metric_params, self.paa_factor),
+            random_state=self.random_state,
+            n_jobs=self.n_jobs,
+            verbose=self.verbose,
+        ).fit(X_paa)
+        labels = coarse.labels_.copy()
+        dists = np.sort(coarse.transform(X_paa), axis=1)
+        ambiguous = np.zeros(X.shape[0], dtype=bool)
+        if self.n_clusters > 1:
+            ambiguous = dists[:, 1] < (1 + self.margin) * dists[:, 0]
+        centers = np.repeat(coarse.cluster_centers_, self.paa_factor, axis=1)
+        centers = centers[:, : X.shape[1]]
+        self._refine(X, labels, centers, range(self.n_clusters), metric_params)
+        if np.any(ambiguous):
+            old = labels[ambiguous]
+            new, _, _ = pruned_assignment(
+                X[ambiguous],
+                centers,
+                hint=old,
+                metric_params=metric_params,
+                n_jobs=self.n_jobs,
+            )
+            labels[ambiguous] = new
+            # Clusters emptied by the reassignment keep their coarse members
+            empty = np.setdiff1d(np.arange(self.n_clusters), labels)
+            while empty.size > 0:
+                new[np.isin(old, empty)] = old[np.isin(old, empty)]
+                labels[ambiguous] = new
+                empty = np.setdiff1d(np.arange(self.n_clusters), labels)
+            changed = np.union1d(old[old != new], new[old != new])
+            self._refine(X, labels, centers, changed, metric_params)
+        self.cluster_centers_ = centers
+        self.labels_ = labels
+        self.coarse_inertia_ = coarse.inertia_
+        self.n_iter_ = coarse.n_iter_
+        self.n_ambiguous_ = int(np.sum(ambiguous))
+        return self
+
+    def fit_predict(self, X, y=None):
+        return self.fit(X, y).labels_
+
+    def _refine(
+        self,
+        X: np.ndarray,
+        labels: np.ndarray,
+        centers: np.ndarray,
+        clusters,
+        metric_params: Dict[str, Any],
+    ):
+        """Refine the centers of some clusters in place with DBA."""
+        for k in clusters:
+            centers[k] = dtw_barycenter_averaging(
+                X[labels == k],
+                init_barycenter=centers[k],
+                max_iter=self.max_iter_barycenter,
+                metric_params=metric_params,
+                n_jobs=self.n_jobs,
+            )
+
+
+class MiniBatchKMeans:
+    """Mini-batch DTW k-means.
+
+    Centers are seeded with k-means++ on a random sample of ``init_size``
+    series. Each step then assigns a random batch of ``batch_size`` series
+    with :func:`pruned_assignment` and moves every center towards one DBA
+    update computed from its batch members. The learning rate of a center is
+    its number of batch members over the number of series assigned to it so
+    far, so the centers settle as they accumulate series. Every series is
+    assigned once more at the end, and the centers of clusters left empty are
+    moved to the series farthest from their centers.
+
+    Parameters
+    ----------
+    n_clusters : int
+        Number of clusters.
+    batch_size : int
+        Number of series per step.
+    max_iter : int
+        Maximum number of steps.
+    max_no_improvement : Optional[int]
+        Stop when the smoothed batch inertia has not improved for this many
+        steps. Disabled if ``None``.
+    tol : float
+        Stop when the mean squared change of the centers in one step, relative
+        to the mean square of the series, is below this.
+    init_size : Optional[int]
+        Number of series sampled for the k-means++ initialization, three times
+        ``batch_size`` by default.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    random_state : Optional[int]
+        Random seed of the initialization and the batches.
+    n_jobs : Optional[int]
+        Number of threads.
+    verbose : bool
+        Print the smoothed batch inertia of every step.
+
+    Attributes
+    ----------
+    cluster_centers_ : np.ndarray
+        Centers.
+    labels_ : np.ndarray
+        Label of each series.
+    inertia_ : float
+        Mean squared DTW distance of each series to its center.
+    n_iter_ : int
+        Number of steps.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        batch_size: int = 64,
+        max_iter: int = 100,
+        max_no_improvement: Optional[int] = 10,
+        tol: float = 1e-4,
+        init_size: Optional[int] = None,
+        metric_params: Optional[Dict[str, Any]] = None,
+        random_state: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        verbose: bool = False,
+    ):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.max_no_improvement = max_no_improvement
+        self.tol = tol
+        self.init_size = init_size
+        self.metric_params = metric_params
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def fit(self, X, y=None):
+        X = to_time_series_dataset(X)
+        metric_params = {} if self.metric_params is None else self.metric_params
+        rs = np.random.RandomState(self.random_state)
+        n_ts = X.shape[0]
+        if n_ts < self.n_clusters:
+            raise ValueError(
+                f"n_ts={n_ts} should be >= n_clusters={self.n_clusters}."
+            )
+        batch_size = min(self.batch_size, n_ts)
+        init_size = 3 * batch_size if self.init_size is None else self.init_size
+        sample = rs.choice(n_ts, min(init_size, n_ts), replace=False)
+        centers = _check_full_length(
+            _k_init_metric(
+                X[sample],
+                self.n_clusters,
+                cdist_metric=lambda x, y: cdist_dtw(x, y, metric_params, self.n_jobs),
+                random_state=rs,
+            )
+        )
+        counts = np.zeros(self.n_clusters)
+        scale = np.nanmean(X**2)
+        alpha = batch_size / n_ts
+        ewa_inertia = None
+        best_inertia = np.inf
+        no_improvement = 0
+        for it in range(self.max_iter):
+            batch = X[rs.choice(n_ts, batch_size, replace=False)]
+            labels, dists, _ = pruned_assignment(
+                batch, centers, metric_params=metric_params, n_jobs=self.n_jobs
+            )
+            old_centers = centers.copy()
+            for k in np.unique(labels):
+                members = batch[labels == k]
+                counts[k] += members.shape[0]
+                rate = members.shape[0] / counts[k]
+                update = dtw_barycenter_averaging(
+                    members,
+                    init_barycenter=centers[k],
+                    max_iter=1,
+                    metric_params=metric_params,
+                    n_jobs=self.n_jobs,
+                )
+                centers[k] = (1 - rate) * centers[k] + rate * update
+            # Smooth the batch inertia over roughly one pass through the data
+            inertia = np.mean(dists**2)
+            if ewa_inertia is None:
+                ewa_inertia = inertia
+            else:
+                ewa_inertia = (1 - alpha) * ewa_inertia + alpha * inertia
+            if self.verbose:
+                print("%.3f" % ewa_inertia, end=" --> ")
+            if np.mean((centers - old_centers) ** 2) < self.tol * scale:
+                break
+            if ewa_inertia < best_inertia:
+                best_inertia = ewa_inertia
+                no_improvement = 0
+            else:
+                no_improvement += 1
+            if (
+                self.max_no_improvement is not None
+                and no_improvement >= self.max_no_improvement
+            ):
+                break
+        if self.verbose:
+            print("")
+        labels, dists, _ = pruned_assignment(
+            X, centers, metric_params=metric_params, n_jobs=self.n_jobs
+        )
+        # Centers that no series is closest to are moved to the farthest
+        # series instead of stopping the fit
+        for k, i in relocate_empty_clusters(labels, dists, self.n_clusters):
+            centers[k] = _check_full_length(X[[i]])[0]
+        self.cluster_centers_ = centers
+        self.labels_ = labels
+        self.inertia_ = np.mean(dists**2)
+        self.n_iter_ = it + 1
+        return self
+
+    def fit_predict(self, X, y=None):
+        return self.fit(X, y).labels_
+
+
+class KMedoids:
+    """K-medoids clustering from a precomputed distance matrix.
+
+    Medoids are seeded with k-means++ and updated by alternating between
+    assigning every series to its nearest medoid and moving each medoid to
+    the member with the smallest sum of squared distances to the others.
+
+    Parameters
+    ----------
+    n_clusters : int
+        Number of clusters.
+    max_iter : int
+        Maximum number of iterations.
+    random_state : Optional[int]
+        Random seed of the initialization.
+
+    Attributes
+    ----------
+    medoid_indices_ : np.ndarray
+        Index of the medoid of each cluster.
+    labels_ : np.ndarray
+        Label of each series.
+    inertia_ : float
+        Mean squared distance of each series to its medoid.
+    n_iter_ : int
+        Number of iterations.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        max_iter: int = 300,
+        random_state: Optional[int] = None,
+    ):
+        self.n_clusters = n_clusters
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def fit(self, distances: np.ndarray, y=None):
+        distances = np.asarray(distances)
+        if distances.shape[0] < self.n_clusters:
+            raise ValueError(
+                f"n_ts={distances.shape[0]} should be >= n_clusters={self.n_clusters}."
+            )
+        rng = np.random.default_rng(self.random_state)
+        medoids = _kmedoids_init(distances, self.n_clusters, rng)
+        for it in range(self.max_iter):
+            labels = self._labels(distances, medoids)
+            new_medoids = medoids.copy()
+            for k in range(self.n_clusters):
+                members = np.flatnonzero(labels == k)
+                costs = np.sum(distances[np.ix_(members, members)] ** 2, axis=0)
+                new_medoids[k] = members[np.argmin(costs)]
+            if np.array_equal(new_medoids, medoids):
+                break
+            medoids = new_medoids
+        self.medoid_indices_ = medoids
+        self.labels_ = self._labels(distances, medoids)
+        self.inertia_ = np.mean(
+            distances[np.arange(len(self.labels_)), medoids[self.labels_]] ** 2
+        )
+        self.n_iter_ = it + 1
+        return self
+
+    def fit_predict(self, distances: np.ndarray, y=None):
+        return self.fit(distances, y).labels_
+
+    @staticmethod
+    def _labels(distances: np.ndarray, medoids: np.ndarray) -> np.ndarray:
+        """Assign every series to its nearest medoid."""
+        labels = np.argmin(distances[:, medoids], axis=1)
+        # Medoids belong to their own cluster, even if they have duplicates
+        labels[medoids] = np.arange(len(medoids))
+        return labels
+
+
+class StreamingClassifier:
+    """Assign a series to its nearest center while its samples arrive.
+
+    The series received so far is compared with every center using open-end
+    DTW, i.e., its DTW distance to the best-matching prefix of the center.
+    Each new sample only adds one row to the cumulative cost matrix of each
+    center, so updates take time proportional to the center length, or to
+    the band width with a Sakoe-Chiba band, whatever the number of samples
+    received. Open-end distances never decrease as samples arrive, so after
+    ``min_samples`` samples, a center is abandoned, and no longer updated,
+    once its distance exceeds ``abandon_ratio`` times that of the current
+    best center. With a band, samples received after the band has run off the
+    end of a center are not aligned with it, and the distance to that center
+    stays the last finite one.
+
+    Parameters
+    ----------
+    centers : List[np.ndarray]
+        Centers, as series of shape ``(sz_c, d)`` or a NaN-padded dataset.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`. Only Sakoe-Chiba
+        bands are supported, with the radius applied to sample indices, since
+        the length of the streamed series is not known in advance.
+    abandon_ratio : Optional[float]
+        Abandon centers farther than this many times the best one. Disabled
+        if ``None``.
+    min_samples : int
+        Number of samples before centers can be abandoned, so that a short
+        prefix, e.g., at standstill, does not decide.
+
+    Attributes
+    ----------
+    distances_ : np.ndarray
+        Open-end DTW distance of the samples so far to each center, or to
+        those within the band of the center, infinite for abandoned centers.
+    active_ : np.ndarray
+        Whether each center is still updated.
+    n_samples_ : int
+        Number of samples received.
+
+    Raises
+    ------
+    ValueError
+        If the global constraint is not supported.
+    """
+
+    def __init__(
+        self,
+        centers: List[np.ndarray],
+        metric_params: Optional[Dict[str, Any]] = None,
+        abandon_ratio: Optional[float] = 2.0,
+        min_samples: int = 0,
+    ):
+        metric_params = {} if metric_params is None else metric_params
+        constraint = metric_params.get("global_constraint")
+        if constraint not in [None, "sakoe_chiba"]:
+            raise ValueError(
+                f"Global constraint '{constraint}' is not supported by open-end DTW."
+            )
+        radius = metric_params.get("sakoe_chiba_radius")
+        self.centers = [_to_series(center) for center in centers]
+        self.metric_params = metric_params
+        self.abandon_ratio = abandon_ratio
+        self.min_samples = min_samples
+        self._radius = -1 if constraint is None or radius is None else int(radius)
+        self.reset()
+
+    @property
+    def label_(self) -> int:
+        """Nearest center so far."""
+        return int(np.argmin(self.distances_))
+
+    @property
+    def decided_(self) -> bool:
+        """Whether every center but one has been abandoned."""
+        return int(np.sum(self.active_)) == 1
+
+    def reset(self):
+        """Start a new series."""
+        self._rows = [np.full(center.shape[0], np.inf) for center in self.centers]
+        self.distances_ = np.zeros(len(self.centers))
+        self.active_ = np.ones(len(self.centers), dtype=bool)
+        self.n_samples_ = 0
+        return self
+
+    def update(self, samples: np.ndarray):
+        """Receive one sample of shape ``(d,)`` or several of shape ``(n, d)``."""
+        samples = np.asarray(samples, dtype=float)
+        if samples.ndim == 1:
+            samples = samples[np.newaxis]
+        if samples.shape[0] == 0:
+            return self
+        for k in np.flatnonzero(self.active_):
+            cost = _open_end_update(
+                self._rows[k], self.centers[k], samples, self.n_samples_, self._radius
+            )
+            self.distances_[k] = np.sqrt(cost)
+        self.n_samples_ += samples.shape[0]
+        if self.abandon_ratio is not None and self.n_samples_ >= self.min_samples:
+            abandon = self.distances_ > self.abandon_ratio * np.min(self.distances_)
+            self.active_[abandon] = False
+            self.distances_[abandon] = np.inf
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Classify whole series by streaming each of them.
+
+        Parameters
+        ----------
+        X : np.ndarray
+            NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+
+        Returns
+        -------
+        np.ndarray :
+            Label of each series.
+        """
+        lengths = ts_lengths(X)
+        return np.array(
+            [self.reset().update(x[:length]).label_ for x, length in zip(X, lengths)]
+        )
+
+
+def pruned_assignment(
+    X: np.ndarray,
+    centers: np.ndarray,
+    hint: Optional[np.ndarray] = None,
+    metric_params: Optional[Dict[str, Any]] = None,
+    n_jobs: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Assign each series to its nearest center in DTW distance.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    centers : np.ndarray
+        Centers with shape ``(n_clusters, sz_c, d)``.
+    hint : Optional[np.ndarray]
+        Likely label of each series, compared first.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    n_jobs : Optional[int]
+        Number of threads.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, int] :
+        Label of each series, DTW distance to its center, and number of exact
+        DTW distances computed. Ties are broken by the lowest center index,
+        as in ``argmin``.
+    """
+    metric_params = {} if metric_params is None else metric_params
+    lengths = ts_lengths(X)
+    bounds = lower_bounds(X, centers, lengths)
+    if hint is None:
+        hint = np.argmin(bounds, axis=1)
+    chunks = np.array_split(np.arange(X.shape[0]), joblib.effective_n_jobs(n_jobs))
+    results = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(_assign_chunk)(
+            [X[i, : lengths[i]] for i in chunk],
+            centers,
+            bounds[chunk],
+            hint[chunk],
+            metric_params,
+        )
+        for chunk in chunks
+        if len(chunk) > 0
+    )
+    labels = np.concatenate([r[0] for r in results])
+    dists = np.concatenate([r[1] for r in results])
+    n_dtw = sum(r[2] for r in results)
+    return labels, dists, n_dtw
+
+
+def dtw(
+    s1: np.ndarray,
+    s2: np.ndarray,
+    global_constraint: Optional[str] = None,
+    sakoe_chiba_radius: Optional[int] = None,
+    itakura_max_slope: Optional[float] = None,
+) -> float:
+    """Compute the DTW distance between two series.
+
+    Only two rows of the band are kept in memory.
+
+    Parameters
+    ----------
+    s1 : np.ndarray
+        Series with shape ``(sz1, d)`` or ``(sz1, )``. Trailing NaN samples
+        are ignored.
+    s2 : np.ndarray
+        Series with shape ``(sz2, d)`` or ``(sz2, )``.
+    global_constraint : Optional[str]
+        ``"sakoe_chiba"``, ``"itakura"``, or ``None``, see :func:`band`.
+    sakoe_chiba_radius : Optional[int]
+        Radius of the Sakoe-Chiba band.
+    itakura_max_slope : Optional[float]
+        Maximum slope of the Itakura parallelogram.
+
+    Returns
+    -------
+    float :
+        DTW distance, ``inf`` if no path satisfies the constraint.
+    """
+    s1 = _to_series(s1)
+    s2 = _to_series(s2)
+    lower, upper = band(
+        s1.shape[0],
+        s2.shape[0],
+        global_constraint,
+        sakoe_chiba_radius,
+        itakura_max_slope,
+    )
+    return np.sqrt(_band_cost(s1, s2, lower, upper))
+
+
+def dtw_path(
+    s1: np.ndarray,
+    s2: np.ndarray,
+    global_constraint: Optional[str] = None,
+    sakoe_chiba_radius: Optional[int] = None,
+    itakura_max_slope: Optional[float] = None,
+) -> Tuple[np.ndarray, float]:
+    """Compute the optimal DTW path between two series.
+
+    The accumulated cost of every cell in the band is kept in memory.
+
+    Parameters
+    ----------
+    s1 : np.ndarray
+        Series with shape ``(sz1, d)`` or ``(sz1, )``. Trailing NaN samples
+        are ignored.
+    s2 : np.ndarray
+        Series with shape ``(sz2, d)`` or ``(sz2, )``.
+    global_constraint : Optional[str]
+        ``"sakoe_chiba"``, ``"itakura"``, or ``None``, see :func:`band`.
+    sakoe_chiba_radius : Optional[int]
+        Radius of the Sakoe-Chiba band.
+    itakura_max_slope : Optional[float]
+        Maximum slope of the Itakura parallelogram.
+
+    Returns
+    -------
+    Tuple[np.ndarray, float] :
+        Path as pairs of indices into ``s1`` and ``s2`` with shape
+        ``(n_path, 2)``, and DTW distance. Ties are broken as in
+        ``tslearn.metrics.dtw_path``.
+    """
+    s1 = _to_series(s1)
+    s2 = _to_series(s2)
+    lower, upper = band(
+        s1.shape[0],
+        s2.shape[0],
+        global_constraint,
+        sakoe_chiba_radius,
+        itakura_max_slope,
+    )
+    path, cost = _band_path(s1, s2, lower, upper)
+    return path, np.sqrt(cost)
+
+
+def band(
+    sz1: int,
+    sz2: int,
+    global_constraint: Optional[str] = None,
+    sakoe_chiba_radius: Optional[int] = None,
+    itakura_max_slope: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the cells allowed by a global constraint, row by row.
+
+    The cells are the same as those of ``tslearn.metrics.compute_mask``.
+
+    Parameters
+    ----------
+    sz1 : int
+        Length of the first series.
+    sz2 : int
+        Length of the second series.
+    global_constraint : Optional[str]
+        ``"sakoe_chiba"``, ``"itakura"``, or ``None``. If ``None``, the
+        constraint is inferred from whichever of ``sakoe_chiba_radius`` or
+        ``itakura_max_slope`` is set.
+    sakoe_chiba_radius : Optional[int]
+        Radius of the Sakoe-Chiba band, 1 by default.
+    itakura_max_slope : Optional[float]
+        Maximum slope of the Itakura parallelogram, 2 by default.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray] :
+        First and last allowed index into the second series for every sample
+        of the first series.
+    """
+    if global_constraint not in GLOBAL_CONSTRAINTS:
+        raise ValueError(f"Unknown global constraint '{global_constraint}'.")
+    if global_constraint is None:
+        if sakoe_chiba_radius is not None and itakura_max_slope is not None:
+            raise ValueError(
+                "Set `global_constraint` to choose between "
+                "`sakoe_chiba_radius` and `itakura_max_slope`."
+            )
+        elif sakoe_chiba_radius is not None:
+            global_constraint = "sakoe_chiba"
+        elif itakura_max_slope is not None:
+            global_constraint = "itakura"
+    rows = np.arange(sz1)
+    if global_constraint == "sakoe_chiba":
+        radius = 1 if sakoe_chiba_radius is None else sakoe_chiba_radius
+        if sz1 > sz2:
+            lower = np.maximum(rows - (sz1 - sz2 + radius), 0)
+            upper = np.minimum(rows + radius, sz2 - 1)
+        else:
+            lower = np.maximum(rows - radius, 0)
+            upper = np.minimum(rows + (sz2 - sz1 + radius), sz2 - 1)
+    elif global_constraint == "itakura":
+        max_slope = 2.0 if itakura_max_slope is None else itakura_max_slope
+        # Rows allowed in each column, as in tslearn
+        min_slope = 1 / max_slope * sz1 / sz2
+        max_slope = max_slope * sz1 / sz2
+        cols = np.arange(sz2)
+        first_row = np.ceil(
+            np.maximum(
+                np.round(min_slope * cols, 2),
+                np.round(sz1 - 1 - max_slope * (sz2 - 1) + max_slope * cols, 2),
+            )
+        )
+        end_row = np.floor(
+            np.minimum(
+                np.round(max_slope * cols, 2),
+                np.round(sz1 - 1 - min_slope * (sz2 - 1) + min_slope * cols, 2),
+            )
+            + 1
+        )
+        # Both are nondecreasing, so the allowed columns of each row are
+        # contiguous
+        lower = np.searchsorted(end_row, rows, side="right")
+        upper = np.searchsorted(first_row, rows, side="right") - 1
+        if np.any(lower > upper) or np.any(first_row >= end_row):
+            raise ValueError(
+                "Itakura constraint has no admissible path for series of "
+                f"lengths {sz1} and {sz2}."
+            )
+    else:
+        lower = np.zeros(sz1, dtype=int)
+        upper = np.full(sz1, sz2 - 1)
+    return lower.astype(np.int64), upper.astype(np.int64)
+
+
+def cdist_dtw(
+    X1: np.ndarray,
+    X2: np.ndarray,
+    metric_params: Optional[Dict[str, Any]] = None,
+    n_jobs: Optional[int] = None,
+) -> np.ndarray:
+    """Compute DTW distances between every pair of series of two datasets.
+
+    Parameters
+    ----------
+    X1 : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts1, sz1, d)``.
+    X2 : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts2, sz2, d)``.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    n_jobs : Optional[int]
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray :
+        Distances with shape ``(n_ts1, n_ts2)``.
+    """
+    metric_params = {} if metric_params is None else metric_params
+    lengths1 = ts_lengths(X1)
+    lengths2 = ts_lengths(X2)
+    dists = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(dtw)(X1[i, : lengths1[i]], X2[j, : lengths2[j]], **metric_params)
+        for i in range(X1.shape[0])
+        for j in range(X2.shape[0])
+    )
+    return np.reshape(dists, (X1.shape[0], X2.shape[0]))
+
+
+def center_distances(
+    X: np.ndarray,
+    centers: np.ndarray,
+    labels: np.ndarray,
+    metric_params: Optional[Dict[str, Any]] = None,
+    n_jobs: Optional[int] = None,
+) -> np.ndarray:
+    """Compute the DTW distance between every series and its own center.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    centers : np.ndarray
+        NaN-padded centers with shape ``(n_clusters, sz_c, d)``.
+    labels : np.ndarray
+        Label of each series.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    n_jobs : Optional[int]
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray :
+        Distance of each series to ``centers[labels]``.
+    """
+    metric_params = {} if metric_params is None else metric_params
+    lengths = ts_lengths(X)
+    dists = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(dtw)(X[i, : lengths[i]], centers[labels[i]], **metric_params)
+        for i in range(X.shape[0])
+    )
+    return np.array(dists, dtype=float)
+
+
+def pairwise_dtw(
+    X: np.ndarray,
+    path: pathlib.Path,
+    metric_params: Optional[Dict[str, Any]] = None,
+    block_size: int = 32,
+    n_jobs: Optional[int] = None,
+) -> np.ndarray:
+    """Compute all pairwise DTW distances of a dataset into a ``.npy`` file.
+
+    The upper triangle is split into square blocks that are computed in
+    parallel and written straight into the memory-mapped file.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    path : pathlib.Path
+        Output ``.npy`` file.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    block_size : int
+        Number of series per block side.
+    n_jobs : Optional[int]
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray :
+        Read-only memory-mapped distance matrix with shape ``(n_ts, n_ts)``.
+    """
+    metric_params = {} if metric_params is None else metric_params
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n_ts = X.shape[0]
+    lengths = ts_lengths(X)
+    distances = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float64, shape=(n_ts, n_ts)
+    )
+    starts = range(0, n_ts, block_size)
+
+    def compute_block(i0: int, j0: int):
+        for i in range(i0, min(i0 + block_size, n_ts)):
+            for j in range(max(j0, i + 1), min(j0 + block_size, n_ts)):
+                d = dtw(X[i, : lengths[i]], X[j, : lengths[j]], **metric_params)
+                distances[i, j] = d
+                distances[j, i] = d
+
+    joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(compute_block)(i0, j0)
+        for i0 in starts
+        for j0 in starts
+        if j0 >= i0
+    )
+    np.fill_diagonal(distances, 0)
+    distances.flush()
+    del distances
+    return np.load(path, mmap_mode="r")
+
+
+def distances_path(
+    directory: pathlib.Path,
+    features: List[str],
+    metric_params: Optional[Dict[str, Any]] = None,
+    batches: Optional[List[str]] = None,
+) -> pathlib.Path:
+    """Find the cached distance matrix of a feature set and constraint.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        Directory containing the cached distance matrices.
+    features : List[str]
+        Columns used as channels.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    batches : Optional[List[str]]
+        Dataset batches the episodes were read from.
+
+    Returns
+    -------
+    pathlib.Path :
+        Path of the ``.npy`` file. The episode keys of its rows are stored
+        next to it, with a ``.json`` suffix.
+    """
+    settings = json.dumps(
+        {
+            "features": list(features),
+            "metric_params": {} if metric_params is None else metric_params,
+            "batches": batches,
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(settings.encode()).hexdigest()[:16]
+    return directory.joinpath(f"{'-'.join(features)}-{digest}.npy")
+
+
+def dtw_barycenter_averaging(
+    X: np.ndarray,
+    barycenter_size: Optional[int] = None,
+    init_barycenter: Optional[np.ndarray] = None,
+    max_iter: int = 30,
+    tol: float = 1e-5,
+    metric_params: Optional[Dict[str, Any]] = None,
+    n_jobs: Optional[int] = None,
+) -> np.ndarray:
+    """Compute the DTW barycenter of a set of series.
+
+    Follows ``tslearn.barycenters.dtw_barycenter_averaging_petitjean``, with
+    paths from :func:`dtw_path`.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Time series dataset, NaN-padded or as a list of series.
+    barycenter_size : Optional[int]
+        Length of the barycenter, the length of ``X`` by default. Ignored if
+        ``init_barycenter`` is given.
+    init_barycenter : Optional[np.ndarray]
+        Initial barycenter, the resampled mean of ``X`` by default.
+    max_iter : int
+        Maximum number of iterations.
+    tol : float
+        Stop when the mean squared DTW distance to the barycenter changes by
+        less than this.
+    metric_params : Optional[Dict[str, Any]]
+        Global constraint keyword arguments of :func:`dtw`.
+    n_jobs : Optional[int]
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray :
+        Barycenter with shape ``(barycenter_size, d)``.
+    """
+    metric_params = {} if metric_params is None else metric_params
+    X = to_time_series_dataset(X)
+    lengths = ts_lengths(X)
+    weights = np.ones(X.shape[0])
+    if init_barycenter is None:
+        if barycenter_size is None:
+            barycenter_size = X.shape[1]
+        barycenter = np.nanmean(X, axis=0)
+        if barycenter.shape[0] != barycenter_size:
+            barycenter = scipy.interpolate.interp1d(
+                np.linspace(0, 1, barycenter.shape[0]),
+                barycenter,
+                kind="linear",
+                axis=0,
+            )(np.linspace(0, 1, barycenter_size))
+    else:
+        barycenter = _to_series(init_barycenter)
+        barycenter_size = barycenter.shape[0]
+    cost_prev = np.inf
+    for it in range(max_iter):
+        results = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+            joblib.delayed(dtw_path)(X[i, : lengths[i]], barycenter, **metric_params)
+            for i in range(X.shape[0])
+        )
+        cost = sum(dist**2 * weights[i] for i, (_, dist) in enumerate(results))
+        cost /= weights.sum()
+        # Samples matched to each barycenter sample, in series then path order
+        series = np.concatenate(
+            [np.full(len(path), i) for i, (path, _) in enumerate(results)]
+        )
+        path = np.concatenate([path for path, _ in results])
+        order = np.argsort(path[:, 1], kind="stable")
+        splits = np.searchsorted(path[order, 1], np.arange(1, barycenter_size))
+        barycenter = np.zeros((barycenter_size, X.shape[-1]))
+        for t, matched in enumerate(np.split(order, splits)):
+            barycenter[t] = np.average(
+                X[series[matched], path[matched, 0]],
+                axis=0,
+                weights=weights[series[matched]],
+            )
+        if abs(cost_prev - cost) < tol:
+            break
+        elif cost_prev < cost:
+            warnings.warn("DBA cost increased, stopping early.", RuntimeWarning)
+            break
+        cost_prev = cost
+    return barycenter
+
+
+def paa(X: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample series by piecewise aggregate approximation.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    factor : int
+        Number of consecutive samples averaged into one.
+
+    Returns
+    -------
+    np.ndarray :
+        NaN-padded dataset with shape ``(n_ts, ceil(sz / factor), d)``. The
+        last sample of each series averages the remaining samples.
+    """
+    n_ts, sz, d = X.shape
+    n_windows = -(-sz // factor)
+    windows = np.full((n_ts, n_windows * factor, d), np.nan)
+    windows[:, :sz] = X
+    windows = windows.reshape(n_ts, n_windows, factor, d)
+    counts = np.sum(~np.isnan(windows), axis=2)
+    sums = np.nansum(windows, axis=2)
+    with np.errstate(invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def label_agreement(labels: np.ndarray, other_labels: np.ndarray) -> float:
+    """Compute the fraction of equal labels after matching cluster numbers.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Label of each series.
+    other_labels : np.ndarray
+        Label of each series from another clustering.
+
+    Returns
+    -------
+    float :
+        Largest fraction of series with the same label over all one-to-one
+        matchings of the cluster numbers.
+    """
+    _, labels = np.unique(labels, return_inverse=True)
+    _, other_labels = np.unique(other_labels, return_inverse=True)
+    contingency = np.zeros((labels.max() + 1, other_labels.max() + 1))
+    np.add.at(contingency, (labels, other_labels), 1)
+    rows, cols = scipy.optimize.linear_sum_assignment(-contingency)
+    return contingency[rows, cols].sum() / len(labels)
+
+
+def relocate_empty_clusters(
+    labels: np.ndarray,
+    dists: np.ndarray,
+    n_clusters: int,
+) -> List[Tuple[int, int]]:
+    """Give each empty cluster the series farthest from its center, in place.
+
+    Each empty cluster takes the series farthest from its center among the
+    clusters with more than one member, so no other cluster is emptied. The
+    labels and distances are updated, and the caller moves the centers.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Label of each series.
+    dists : np.ndarray
+        Distance of each series to its center.
+    n_clusters : int
+        Number of clusters, at most the number of series.
+
+    Returns
+    -------
+    List[Tuple[int, int]] :
+        Each empty cluster and the index of the series its center moves to.
+    """
+    moves = []
+    for k in np.setdiff1d(np.arange(n_clusters), labels):
+        counts = np.bincount(labels, minlength=n_clusters)
+        candidates = np.flatnonzero(counts[labels] > 1)
+        farthest = candidates[np.argmax(dists[candidates])]
+        labels[farthest] = k
+        dists[farthest] = 0
+        moves.append((int(k), int(farthest)))
+    return moves
+
+
+def lower_bounds(
+    X: np.ndarray,
+    centers: np.ndarray,
+    lengths: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Compute DTW lower bounds between every series and every center.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    centers : np.ndarray
+        NaN-padded centers with shape ``(n_clusters, sz_c, d)``.
+    lengths : Optional[np.ndarray]
+        Length of each series in ``X``, computed if not given.
+
+    Returns
+    -------
+    np.ndarray :
+        Largest of LB_Kim and LB_Keogh in both directions, with shape
+        ``(n_ts, n_clusters)``.
+    """
+    if lengths is None:
+        lengths = ts_lengths(X)
+    center_lengths = ts_lengths(centers)
+    kim = lb_kim(X, centers, lengths, center_lengths)
+    keogh = np.maximum(
+        lb_keogh(X, *envelope(centers)),
+        lb_keogh(centers, *envelope(X)).T,
+    )
+    return np.maximum(kim, keogh)
+
+
+def lb_kim(
+    X: np.ndarray,
+    centers: np.ndarray,
+    lengths: np.ndarray,
+    center_lengths: np.ndarray,
+) -> np.ndarray:
+    """Compute LB_Kim from the first and last samples of each pair.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    centers : np.ndarray
+        NaN-padded centers with shape ``(n_clusters, sz_c, d)``.
+    lengths : np.ndarray
+        Length of each series in ``X``.
+    center_lengths : np.ndarray
+        Length of each center.
+
+    Returns
+    -------
+    np.ndarray :
+        Lower bounds with shape ``(n_ts, n_clusters)``.
+    """
+    first = _sq_dist(X[:, 0], centers[:, 0])
+    last = _sq_dist(
+        X[np.arange(X.shape[0]), lengths - 1],
+        centers[np.arange(centers.shape[0]), center_lengths - 1],
+    )
+    # A path of one cell visits the first and last samples only once
+    single = (lengths[:, np.newaxis] == 1) & (center_lengths[np.newaxis, :] == 1)
+    return np.sqrt(np.where(single, first, first + last))
+
+
+def lb_keogh(
+    X: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+) -> np.ndarray:
+    """Compute LB_Keogh between series and envelopes.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+    lower : np.ndarray
+        Lower envelopes with shape ``(n_env, d)``.
+    upper : np.ndarray
+        Upper envelopes with shape ``(n_env, d)``.
+
+    Returns
+    -------
+    np.ndarray :
+        Lower bounds with shape ``(n_ts, n_env)``.
+    """
+    bounds = np.empty((X.shape[0], lower.shape[0]))
+    for j in range(lower.shape[0]):
+        excess = X - np.clip(X, lower[j], upper[j])
+        bounds[:, j] = np.nansum(excess**2, axis=(1, 2))
+    return np.sqrt(bounds)
+
+
+def envelope(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the envelope of each series over its whole length.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray] :
+        Lower and upper envelopes, each with shape ``(n_ts, d)``.
+    """
+    return np.nanmin(X, axis=1), np.nanmax(X, axis=1)
+
+
+def ts_lengths(X: np.ndarray) -> np.ndarray:
+    """Find the length of each series of a NaN-padded dataset.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        NaN-padded time series dataset with shape ``(n_ts, sz, d)``.
+
+    Returns
+    -------
+    np.ndarray :
+        Number of samples before the padding of each series.
+    """
+    padded = np.all(np.isnan(X), axis=2)
+    return np.where(padded.any(axis=1), padded.argmax(axis=1), X.shape[1])
+
+
+def _assign_chunk(
+    series: list,
+    centers: np.ndarray,
+    bounds: np.ndarray,
+    hint: np.ndarray,
+    metric_params: Dict[str, Any],
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Assign a chunk of series, see :func:`pruned_assignment`."""
+    labels = np.empty(len(series), dtype=int)
+    dists = np.empty(len(series))
+    n_dtw = 0
+    for i, x in enumerate(series):
+        # Compare the hinted center first, then in order of increasing bound
+        order = np.argsort(bounds[i], kind="stable")
+        order = np.concatenate([[hint[i]], order[order != hint[i]]])
+        best, best_j = np.inf, -1
+        for j in order:
+            if bounds[i, j] > best:
+                continue
+            d = dtw(x, centers[j], **metric_params)
+            n_dtw += 1
+            if d < best or (d == best and j < best_j):
+                best, best_j = d, j
+        labels[i] = best_j
+        dists[i] = best
+    return labels, dists, n_dtw
+
+
+def _k_init_distances(
+    distances: np.ndarray,
+    n_clusters: int,
+    random_state: np.random.RandomState,
+) -> np.ndarray:
+    """Seed centers with k-means++ from a distance matrix.
+
+    Follows tslearn's ``_k_init_metric`` and draws the same random numbers, so
+    the same series are chosen.
+    """
+    n_local_trials = 2 + int(np.log(n_clusters))
+    seeds = [random_state.randint(distances.shape[0])]
+    closest_dist_sq = np.asarray(distances[seeds[0]]) ** 2
+    current_pot = closest_dist_sq.sum()
+    for _ in range(1, n_clusters):
+        rand_vals = random_state.random_sample(n_local_trials) * current_pot
+        candidate_ids = np.searchsorted(
+            np.cumsum(closest_dist_sq, dtype=np.float64), rand_vals
+        )
+        np.clip(candidate_ids, None, closest_dist_sq.size - 1, out=candidate_ids)
+        candidate_dist_sq = np.minimum(
+            closest_dist_sq, np.asarray(distances[candidate_ids]) ** 2
+        )
+        candidates_pot = candidate_dist_sq.sum(axis=1)
+        best = np.argmin(candidates_pot)
+        current_pot = candidates_pot[best]
+        closest_dist_sq = candidate_dist_sq[best]
+        seeds.append(candidate_ids[best])
+    return np.array(seeds)
+
+
+def _kmedoids_init(
+    distances: np.ndarray,
+    n_clusters: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Seed medoids with k-means++ from a distance matrix."""
+    medoids = [rng.integers(distances.shape[0])]
+    closest = distances[medoids[0]] ** 2
+    for _ in range(1, n_clusters):
+        if closest.sum() > 0:
+            medoid = rng.choice(distances.shape[0], p=closest / closest.sum())
+        else:
+            medoid = rng.choice(np.setdiff1d(np.arange(distances.shape[0]), medoids))
+        medoids.append(medoid)
+        closest = np.minimum(closest, distances[medoid] ** 2)
+    return np.array(medoids)
+
+
+def _scale_band(metric_params: Dict[str, Any], factor: int) -> Dict[str, Any]:
+    """Scale a global constraint to series downsampled by ``factor``."""
+    metric_params = dict(metric_params)
+    if metric_params.get("sakoe_chiba_radius") is not None:
+        radius = metric_params["sakoe_chiba_radius"]
+        metric_params["sakoe_chiba_radius"] = -(-radius // factor)
+    return metric_params
+
+
+def _to_series(s: np.ndarray) -> np.ndarray:
+    """Convert to a float series of shape ``(sz, d)`` without NaN padding."""
+    s = np.asarray(s, dtype=float)
+    if s.ndim == 1:
+        s = s[:, np.newaxis]
+    return np.ascontiguousarray(s[: ts_lengths(s[np.newaxis])[0]])
+
+
+@numba.njit(nogil=True)
+def _band_cost(s1, s2, lower, upper):
+    """Compute the squared DTW distance, keeping two rows of the band."""
+    width = max(np.max(upper - lower) + 1, 1)
+    prev = np.full(width, np.inf)
+    cur = np.full(width, np.inf)
+    prev_lower, prev_upper = 0, -1
+    for i in range(s1.shape[0]):
+        for j in range(lower[i], upper[i] + 1):
+            dist = 0.0
+            for d in range(s1.shape[1]):
+                diff = s1[i, d] - s2[j, d]
+                dist += diff * diff
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = np.inf
+                if prev_lower <= j <= prev_upper:
+                    best = min(best, prev[j - prev_lower])
+                if prev_lower <= j - 1 <= prev_upper:
+                    best = min(best, prev[j - 1 - prev_lower])
+                if j - 1 >= lower[i]:
+                    best = min(best, cur[j - 1 - lower[i]])
+            cur[j - lower[i]] = dist + best
+        prev, cur = cur, prev
+        prev_lower, prev_upper = lower[i], upper[i]
+    j = s2.shape[0] - 1
+    if prev_lower <= j <= prev_upper:
+        return prev[j - prev_lower]
+    return np.inf
+
+
+@numba.njit(nogil=True)
+def _open_end_update(row, center, samples, first, radius):
+    """Add rows to an open-end DTW cost matrix and return its smallest cost.
+
+    ``row`` holds the cumulative costs of the last row received, and is
+    updated in place. ``first`` is the index of the first new sample, and a
+    negative ``radius`` disables the Sakoe-Chiba band. Once the band has run
+    off the end of the center, the row is left as it was, so the last finite
+    cost is returned.
+    """
+    m = center.shape[0]
+    for n in range(samples.shape[0]):
+        i = first + n
+        lo, hi = 0, m - 1
+        if radius >= 0:
+            lo, hi = max(0, i - radius), min(m - 1, i + radius)
+        if lo > hi:
+            # The band has left the center, so later samples cannot be aligned
+            break
+        # Cost of the previous row, one column to the left
+        diag = np.inf
+        if lo > 0:
+            diag = row[lo - 1]
+            row[lo - 1] = np.inf
+        left = np.inf
+        for j in range(lo, hi + 1):
+            dist = 0.0
+            for d in range(center.shape[1]):
+                diff = samples[n, d] - center[j, d]
+                dist += diff * diff
+            up = row[j]
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = min(up, diag, left)
+            row[j] = dist + best
+            diag = up
+            left = row[j]
+    return np.min(row)
+
+
+@numba.njit(nogil=True)
+def _band_path(s1, s2, lower, upper):
+    """Compute the squared DTW distance and path, keeping the whole band."""
+    offsets = np.zeros(s1.shape[0] + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.maximum(upper - lower + 1, 0))
+    acc = np.full(offsets[-1], np.inf)
+    for i in range(s1.shape[0]):
+        for j in range(lower[i], upper[i] + 1):
+            dist = 0.0
+            for d in range(s1.shape[1]):
+                diff = s1[i, d] - s2[j, d]
+                dist += diff * diff
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = np.inf
+                if i > 0 and lower[i - 1] <= j <= upper[i - 1]:
+                    best = min(best, acc[offsets[i - 1] + j - lower[i - 1]])
+                if i > 0 and lower[i - 1] <= j - 1 <= upper[i - 1]:
+                    best = min(best, acc[offsets[i - 1] + j - 1 - lower[i - 1]])
+                if j - 1 >= lower[i]:
+                    best = min(best, acc[offsets[i] + j - 1 - lower[i]])
+            acc[offsets[i] + j - lower[i]] = dist + best
+    # Backtrack, preferring diagonal, then vertical, then horizontal steps
+    i, j = s1.shape[0] - 1, s2.shape[0] - 1
+    cost = np.inf
+    if lower[i] <= j <= upper[i]:
+        cost = acc[offsets[i] + j - lower[i]]
+    path = np.empty((s1.shape[0] + s2.shape[0] - 1, 2), dtype=np.int64)
+    n = 0
+    path[n, 0] = i
+    path[n, 1] = j
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            diag = np.inf
+            up = np.inf
+            left = np.inf
+            if lower[i - 1] <= j - 1 <= upper[i - 1]:
+                diag = acc[offsets[i - 1] + j - 1 - lower[i - 1]]
+            if lower[i - 1] <= j <= upper[i - 1]:
+                up = acc[offsets[i - 1] + j - lower[i - 1]]
+            if lower[i] <= j - 1 <= upper[i]:
+                left = acc[offsets[i] + j - 1 - lower[i]]
+            if diag <= up and diag <= left:
+                i -= 1
+                j -= 1
+            elif up <= left:
+                i -= 1
+            else:
+                j -= 1
+        n += 1
+        path[n, 0] = i
+        path[n, 1] = j
+    return path[n::-1].copy(), cost
+
+
+def _sq_dist(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Compute squared Euclidean distances between rows of two arrays."""
+    return np.sum((a[:, np.newaxis, :] - b[np.newaxis, :, :]) ** 2, axis=2)
@@ -0,0 +1,283 @@
+"""Fixed-length embeddings of episodes for fast clustering.
+
+Each episode is summarized by its velocity tracking error
+``joint_vel - target_joint_vel``:
+
+* the mean and standard deviation of the error within forward and reverse
+  constant-velocity segments, and its RMS value over the whole episode, and
+* the log power of the error in logarithmically spaced frequency bands of its
+  Welch PSD.
+
+Embeddings are standardized and clustered with Euclidean k-means. Comparing
+two episodes then costs one vector difference instead of a DTW alignment, so
+whole fleets can be screened in seconds.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+import scipy.signal
+
+import dataset_store
+import dtw_kmeans
+
+
+def embed(
+    joint_vel: np.ndarray,
+    target_joint_vel: np.ndarray,
+    t_step: float,
+    n_bands: int = 8,
+    f_min: float = 1,
+    nperseg: int = 1024,
+    min_length: int = 600,
+    min_vel: float = 3,
+    trim: int = 100,
+) -> np.ndarray:
+    """Embed episodes into fixed-length feature vectors.
+
+    Parameters
+    ----------
+    joint_vel : np.ndarray
+        NaN-padded joint velocities with shape ``(n_episodes, max_length)``.
+    target_joint_vel : np.ndarray
+        NaN-padded target joint velocities with the same shape.
+    t_step : float
+        Sampling timestep (s).
+    n_bands : int
+        Number of PSD bands between ``f_min`` and the Nyquist frequency.
+    f_min : float
+        Lower edge of the first PSD band (Hz).
+    nperseg : int
+        Welch segment length.
+    min_length : int
+        Minimum length of a constant-velocity segment.
+    min_vel : float
+        Minimum target speed of a constant-velocity segment (rad/s).
+    trim : int
+        Samples dropped at both ends of each constant-velocity segment.
+
+    Returns
+    -------
+    np.ndarray :
+        Embeddings with shape ``(n_episodes, 5 + n_bands)``. Segment
+        statistics are NaN if an episode has no segment in that direction.
+    """
+    err = joint_vel - target_joint_vel
+    lengths = np.sum(~np.isnan(err), axis=1)
+    edges = np.geomspace(f_min, 0.5 / t_step, n_bands + 1)
+    embeddings = np.full((err.shape[0], 5 + n_bands), np.nan)
+    for i, length in enumerate(lengths):
+        e = err[i, :length]
+        tvel = target_joint_vel[i, :length]
+        # Error statistics within forward and reverse constant-velocity segments
+        means = {1: [], -1: []}
+        stds = {1: [], -1: []}
+        for start, stop in zip(*dataset_store.find_segments(tvel)):
+            if stop - start > min_length and np.abs(tvel[start]) > min_vel:
+                segment = e[start + trim : stop - trim]
+                means[np.sign(tvel[start])].append(np.mean(segment))
+                stds[np.sign(tvel[start])].append(np.std(segment))
+        for j, direction in enumerate([1, -1]):
+            if means[direction]:
+                embeddings[i, j] = np.mean(means[direction])
+                embeddings[i, 2 + j] = np.mean(stds[direction])
+        embeddings[i, 4] = np.sqrt(np.mean(e**2))
+        # Log band powers of the error PSD
+        f, psd = scipy.signal.welch(e, fs=1 / t_step, nperseg=min(nperseg, length))
+        band = np.digitize(f, edges) - 1
+        in_band = (band >= 0) & (band < n_bands)
+        power = np.bincount(
+            band[in_band], weights=psd[in_band] * (f[1] - f[0]), minlength=n_bands
+        )
+        embeddings[i, 5:] = np.log10(power + np.finfo(float).tiny)
+    return embeddings
+
+
+def standardization(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the mean and scale of every feature.
+
+    Missing features are ignored. Features missing from every embedding get a
+    zero mean, and constant features a unit scale.
+
+    Parameters
+    ----------
+    embeddings : np.ndarray
+        Embeddings with shape ``(n_episodes, n_features)``.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray] :
+        Mean and standard deviation of each feature.
+    """
+    mean = np.nanmean(embeddings, axis=0)
+    mean = np.where(np.isnan(mean), 0, mean)
+    std = np.nanstd(embeddings, axis=0)
+    std = np.where((std > 0) & ~np.isnan(std), std, 1)
+    return mean, std
+
+
+def standardize(
+    embeddings: np.ndarray,
+    mean: Optional[np.ndarray] = None,
+    std: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Scale every feature to zero mean and unit variance.
+
+    Missing features are replaced by the mean of the feature, and constant
+    features are only centered.
+
+    Parameters
+    ----------
+    embeddings : np.ndarray
+        Embeddings with shape ``(n_episodes, n_features)``.
+    mean : Optional[np.ndarray]
+        Mean of each feature, from :func:`standardization`. Computed from
+        ``embeddings`` if ``None``.
+    std : Optional[np.ndarray]
+        Standard deviation of each feature, given with ``mean``.
+
+    Returns
+    -------
+    np.ndarray :
+        Standardized embeddings.
+    """
+    if mean is None:
+        mean, std = standardization(embeddings)
+    embeddings = np.where(np.isnan(embeddings), mean, embeddings)
+    return (embeddings - mean) / std
+
+
+class KMeans:
+    """Euclidean k-means, vectorised with NumPy.
+
+    Centers are seeded with k-means++, and the best of ``n_init`` runs of
+    Lloyd's algorithm is kept. Empty clusters are moved to the samples
+    farthest from their centers, so every cluster has a member.
+
+    Parameters
+    ----------
+    n_clusters : int
+        Number of clusters.
+    n_init : int
+        Number of initializations.
+    max_iter : int
+        Maximum number of iterations per initialization.
+    tol : float
+        Stop when no center moves by more than this.
+    random_state : Optional[int]
+        Random seed.
+
+    Attributes
+    ----------
+    cluster_centers_ : np.ndarray
+        Centers.
+    labels_ : np.ndarray
+        Label of each sample.
+    inertia_ : float
+        Mean squared distance of each sample to its center.
+    n_iter_ : int
+        Number of iterations of the kept run.
+    representative_indices_ : np.ndarray
+        Member closest to each center.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        n_init: int = 10,
+        max_iter: int = 300,
+        tol: float = 1e-6,
+        random_state: Optional[int] = None,
+    ):
+        self.n_clusters = n_clusters
+        self.n_init = n_init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray, y=None):
+        X = np.asarray(X, dtype=float)
+        if X.shape[0] < self.n_clusters:
+            raise ValueError(
+                f"n_samples={X.shape[0]} should be >= n_clusters={self.n_clusters}."
+            )
+        rng = np.random.default_rng(self.random_state)
+        best = None
+        for _ in range(self.n_init):
+            run = self._fit_one_init(X, rng)
+            if best is None or run[2] < best[2]:
+                best = run
+        self.cluster_centers_, self.labels_, self.inertia_, self.n_iter_ = best
+        dists = _sq_dist(X, self.cluster_centers_)
+        member_dists = np.where(
+            self.labels_[:, np.newaxis] == np.arange(self.n_clusters),
+            dists,
+            np.inf,
+        )
+        self.representative_indices_ = np.argmin(member_dists, axis=0)
+        return self
+
+    def fit_predict(self, X: np.ndarray, y=None):
+        return self.fit(X, y).labels_
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return np.argmin(_sq_dist(np.asarray(X, dtype=float), self.cluster_centers_), axis=1)
+
+    def _fit_one_init(
+        self,
+        X: np.ndarray,
+        rng: np.random.Generator,
+    ) -> Tuple[np.ndarray, np.ndarray, float, int]:
+        """Run Lloyd's algorithm from one k-means++ seeding."""
+        centers = _kmeans_plusplus(X, self.n_clusters, rng)
+        for it in range(self.max_iter):
+            dists = _sq_dist(X, centers)
+            labels = np.argmin(dists, axis=1)
+            counts = np.bincount(labels, minlength=self.n_clusters)
+            new_centers = np.zeros_like(centers)
+            np.add.at(new_centers, labels, X)
+            new_centers /= np.maximum(counts, 1)[:, np.newaxis]
+            # Move empty clusters to the samples farthest from their centers
+            empty = np.flatnonzero(counts == 0)
+            if empty.size > 0:
+                farthest = np.argsort(dists[np.arange(X.shape[0]), labels])[::-1]
+                new_centers[empty] = X[farthest[: empty.size]]
+            shift = np.max(np.abs(new_centers - centers))
+            centers = new_centers
+            if shift <= self.tol:
+                break
+        dists = _sq_dist(X, centers)
+        labels = np.argmin(dists, axis=1)
+        dists = dists[np.arange(X.shape[0]), labels]
+        # Clusters left empty by the final assignment take a sample
+        for k, i in dtw_kmeans.relocate_empty_clusters(labels, dists, self.n_clusters):
+            centers[k] = X[i]
+        inertia = np.mean(dists)
+        return centers, labels, inertia, it + 1
+
+
+def _kmeans_plusplus(
+    X: np.ndarray,
+    n_clusters: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Seed centers with k-means++."""
+    centers = [X[rng.integers(X.shape[0])]]
+    closest = _sq_dist(X, np.array(centers))[:, 0]
+    for _ in range(1, n_clusters):
+        if closest.sum() > 0:
+            center = X[rng.choice(X.shape[0], p=closest / closest.sum())]
+        else:
+            center = X[rng.integers(X.shape[0])]
+        centers.append(center)
+        closest = np.minimum(closest, _sq_dist(X, center[np.newaxis])[:, 0])
+    return np.array(centers)
+
+
+def _sq_dist(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Compute squared Euclidean distances between rows of two arrays."""
+    return (
+        np.sum(a**2, axis=1)[:, np.newaxis]
+        - 2 * a @ b.T
+        + np.sum(b**2, axis=1)[np.newaxis, :]
+    ).clip(min=0)
@@ -0,0 +1,270 @@
+"""Estimation of the frequency and phase of the sine lifting function.
+
+Within a constant-velocity segment, the velocity tracking error contains a
+ripple ``sin(f * joint_pos + phi)``. The phase ``phi`` is chosen to maximize
+the normalized inner product::
+
+    g(p) = sum(e * sin(f * x + p)) / n
+         = (cos(p) * sum(e * sin(f * x)) + sin(p) * sum(e * cos(f * x))) / n
+
+of the error ``e`` and the shifted sine of the joint position ``x``. The grid
+search evaluates ``g`` for every trial phase, costing ``O(n_phases * n)``
+sines per segment. Since ``g`` only depends on the two sums, the closed-form
+estimator computes them once in ``O(n)`` and finds the maximum analytically.
+The curve ``g`` can then be evaluated for plotting from the two sums alone.
+
+The frequency ``f`` is set by the gear ratio. When it is not known, it is
+estimated together with the phase by :func:`estimate_frequency_and_phase`.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Lifting function frequency (rad/rad), matching the 100:1 gear ratio
+FREQUENCY = 100
+
+
+def sine_coefficients(
+    pos: np.ndarray,
+    err: np.ndarray,
+    f: float = FREQUENCY,
+) -> Tuple[float, float]:
+    """Project the error onto the sine and cosine of the joint position.
+
+    Parameters
+    ----------
+    pos : np.ndarray
+        Joint positions of one segment (rad).
+    err : np.ndarray
+        Normalized velocity errors of the segment.
+    f : float
+        Sinusoid frequency (rad/rad).
+
+    Returns
+    -------
+    Tuple[float, float] :
+        Mean of ``err * sin(f * pos)`` and mean of ``err * cos(f * pos)``.
+    """
+    theta = f * pos
+    n = err.shape[0]
+    return np.dot(err, np.sin(theta)) / n, np.dot(err, np.cos(theta)) / n
+
+
+def closed_form_phase(sin_coef: float, cos_coef: float) -> float:
+    """Find the phase maximizing the inner product curve.
+
+    Parameters
+    ----------
+    sin_coef : float
+        Mean of ``err * sin(f * pos)``.
+    cos_coef : float
+        Mean of ``err * cos(f * pos)``.
+
+    Returns
+    -------
+    float :
+        Optimal phase in ``[0, 2 * pi)`` (rad).
+    """
+    return float(np.mod(np.arctan2(cos_coef, sin_coef), 2 * np.pi))
+
+
+def phase_curve(
+    sin_coef: float,
+    cos_coef: float,
+    phases: np.ndarray,
+) -> np.ndarray:
+    """Evaluate the inner product curve from its coefficients.
+
+    Parameters
+    ----------
+    sin_coef : float
+        Mean of ``err * sin(f * pos)``.
+    cos_coef : float
+        Mean of ``err * cos(f * pos)``.
+    phases : np.ndarray
+        Phases at which to evaluate the curve (rad).
+
+    Returns
+    -------
+    np.ndarray :
+        Normalized inner products, equal to those of :func:`grid_inner_products`.
+    """
+    return sin_coef * np.cos(phases) + cos_coef * np.sin(phases)
+
+
+def grid_inner_products(
+    pos: np.ndarray,
+    err: np.ndarray,
+    phases: np.ndarray,
+    f: float = FREQUENCY,
+) -> np.ndarray:
+    """Evaluate the inner product curve by brute force.
+
+    Parameters
+    ----------
+    pos : np.ndarray
+        Joint positions of one segment (rad).
+    err : np.ndarray
+        Normalized velocity errors of the segment.
+    phases : np.ndarray
+        Trial phases (rad).
+    f : float
+        Sinusoid frequency (rad/rad).
+
+    Returns
+    -------
+    np.ndarray :
+        Normalized inner products, one per trial phase.
+    """
+    return np.array([np.sum(err * np.sin(f * pos + p)) for p in phases]) / err.shape[0]
+
+
+def estimate_phase(
+    pos: np.ndarray,
+    err: np.ndarray,
+    method: str = "closed_form",
+    n_phase_samples: int = 1000,
+    f: float = FREQUENCY,
+) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Estimate the phase of the ripple in one segment.
+
+    Parameters
+    ----------
+    pos : np.ndarray
+        Joint positions of one segment (rad).
+    err : np.ndarray
+        Normalized velocity errors of the segment.
+    method : str
+        ``"grid"`` to pick the best of ``n_phase_samples`` trial phases, or
+        ``"closed_form"`` to solve for the optimum directly.
+    n_phase_samples : int
+        Number of phases in ``[0, 2 * pi]`` at which the curve is returned.
+        The closed-form curve is evaluated from its two coefficients, so it
+        does not depend on the segment length.
+    f : float
+        Sinusoid frequency (rad/rad).
+
+    Returns
+    -------
+    Tuple[float, np.ndarray, np.ndarray] :
+        Optimal phase, trial phases, and inner products at the trial phases.
+    """
+    phases = np.linspace(0, 2 * np.pi, n_phase_samples)
+    if method == "grid":
+        inner_products = grid_inner_products(pos, err, phases, f)
+        # There are two phases that will work (+ve and -ve correlations)
+        optimal_phase = phases[np.argmax(inner_products)]
+    elif method == "closed_form":
+        sin_coef, cos_coef = sine_coefficients(pos, err, f)
+        optimal_phase = closed_form_phase(sin_coef, cos_coef)
+        inner_products = phase_curve(sin_coef, cos_coef, phases)
+    else:
+        raise ValueError(f"Unknown phase estimation method '{method}'.")
+    return optimal_phase, phases, inner_products
+
+
+def phase_difference(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Compute the absolute circular difference between phases.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        Phases (rad).
+    b : np.ndarray
+        Phases (rad).
+
+    Returns
+    -------
+    np.ndarray :
+        Differences in ``[0, pi]`` (rad).
+    """
+    return np.abs(np.angle(np.exp(1j * (np.asarray(a) - np.asarray(b)))))
+
+
+def estimate_frequency_and_phase(
+    positions: List[np.ndarray],
+    errs: List[np.ndarray],
+    f_min: float = 10,
+    f_max: Optional[float] = None,
+    oversampling: int = 8,
+    n_refine: int = 5,
+) -> Tuple[float, float]:
+    """Estimate the frequency and phase of the ripple of one unit.
+
+    The frequency maximizes the power of the ripple summed over segments,
+    ``sum_j |mean(e_j * exp(1j * f * x_j))|^2``. Each segment is recorded at a
+    constant velocity, so its FFT is its spectrum in position, scaled by the
+    distance travelled per sample. The peak of the summed spectra is refined
+    with Newton steps on all segments at once. The phase of each segment is
+    then found in closed form at that frequency, and the circular mean is
+    returned.
+
+    Parameters
+    ----------
+    positions : List[np.ndarray]
+        Joint positions of each constant-velocity segment (rad).
+    errs : List[np.ndarray]
+        Normalized velocity errors of each segment.
+    f_min : float
+        Lowest frequency considered (rad/rad).
+    f_max : Optional[float]
+        Highest frequency considered (rad/rad). Defaults to the lowest Nyquist
+        frequency of the segments.
+    oversampling : int
+        Zero-padding factor of the FFTs.
+    n_refine : int
+        Number of Newton steps.
+
+    Returns
+    -------
+    Tuple[float, float] :
+        Frequency (rad/rad) and phase in ``[0, 2 * pi)`` (rad).
+    """
+    steps = np.array(
+        [np.abs(pos[-1] - pos[0]) / (pos.shape[0] - 1) for pos in positions]
+    )
+    if f_max is None:
+        f_max = np.min(np.pi / steps)
+    # Sum the power spectra of all segments on a common frequency grid
+    n_ffts = [
+        2 ** int(np.ceil(np.log2(oversampling * err.shape[0]))) for err in errs
+    ]
+    f_step = np.min(2 * np.pi / (np.array(n_ffts) * steps))
+    f_grid = np.arange(f_min, f_max, f_step)
+    power = np.zeros_like(f_grid)
+    for err, step, n_fft in zip(errs, steps, n_ffts):
+        spectrum = np.abs(np.fft.rfft(err - np.mean(err), n_fft)) ** 2
+        f_bins = 2 * np.pi * np.arange(spectrum.shape[0]) / (n_fft * step)
+        power += np.interp(f_grid, f_bins, spectrum) / err.shape[0] ** 2
+    f = f_grid[np.argmax(power)]
+    # Refine the peak with Newton steps, with positions centered in each
+    # segment to keep the derivatives well scaled
+    ids = np.concatenate([np.full(err.shape[0], j) for j, err in enumerate(errs)])
+    x = np.concatenate([pos - np.mean(pos) for pos in positions])
+    we = np.concatenate([(err - np.mean(err)) / err.shape[0] for err in errs])
+    for _ in range(n_refine):
+        cos = we * np.cos(f * x)
+        sin = we * np.sin(f * x)
+        re = np.bincount(ids, cos)
+        im = np.bincount(ids, sin)
+        d_re = -np.bincount(ids, x * sin)
+        d_im = np.bincount(ids, x * cos)
+        dd_re = -np.bincount(ids, x**2 * cos)
+        dd_im = -np.bincount(ids, x**2 * sin)
+        grad = 2 * np.sum(re * d_re + im * d_im)
+        curv = 2 * np.sum(d_re**2 + d_im**2 + re * dd_re + im * dd_im)
+        if curv < 0:
+            step = np.clip(-grad / curv, -f_step, f_step)
+        else:
+            step = np.sign(grad) * f_step / 2
+        f = float(np.clip(f + step, f_min, f_max))
+    # Circular mean of the phases of the segments
+    phases = np.array(
+        [
+            closed_form_phase(*sine_coefficients(pos, err, f))
+            for pos, err in zip(positions, errs)
+        ]
+    )
+    phi = np.mod(np.angle(np.mean(np.exp(1j * phases))), 2 * np.pi)
+    return f, float(phi)
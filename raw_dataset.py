@@ -0,0 +1,451 @@
+"""Parse raw motor drive recordings into dataframes."""
+
+import hashlib
+import itertools
+import json
+import pathlib
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas
+
+# Gearbox ratio between motor and joint
+GEAR_RATIO = 1 / 100
+# Degrees to radians
+RAD_PER_DEG = 2 * np.pi / 360
+# Sampling timestep (s)
+T_STEP = 1e-3
+# Raw CSV columns used by preprocessing: joint position (deg), joint velocity
+# (deg/s), joint torque (%), target joint position (deg), and target joint
+# velocity (deg/s), all on the motor side of the gearbox
+RAW_COLUMNS = [1, 2, 3, 4, 5]
+# Recording directory name (e.g., 20221220T101041_001002_noload)
+RECORDING_PATTERN = re.compile(r"^(\d\d\d\d\d\d\d\dT\d\d\d\d\d\d)_(\d\d\d\d\d\d)_(.*)$")
+
+
+def find_batches(raw_path: pathlib.Path) -> List[str]:
+    """Find all batch directories of a raw dataset.
+
+    Parameters
+    ----------
+    raw_path : pathlib.Path
+        Raw dataset directory, e.g., ``dataset/raw/``.
+
+    Returns
+    -------
+    List[str] :
+        Sorted names of the directories containing ``population/`` or
+        ``outliers/``. Empty if ``raw_path`` does not exist.
+    """
+    if not raw_path.is_dir():
+        return []
+    return sorted(
+        path.name
+        for path in raw_path.iterdir()
+        if path.joinpath("population").is_dir() or path.joinpath("outliers").is_dir()
+    )
+
+
+def find_episodes(
+    raw_dataset_path: pathlib.Path,
+) -> List[Tuple[str, bool, int, str, pathlib.Path]]:
+    """Find all episode files in a raw dataset batch.
+
+    Parameters
+    ----------
+    raw_dataset_path : pathlib.Path
+        Batch directory containing ``population/`` and ``outliers/``.
+
+    Returns
+    -------
+    List[Tuple[str, bool, int, str, pathlib.Path]] :
+        Serial number, load flag, episode number, timestamp, and CSV path of
+        each episode, sorted by ``(serial_no, load, episode)``.
+    """
+    episodes = []
+    for path in itertools.chain.from_iterable(
+        raw_dataset_path.joinpath(group).iterdir()
+        for group in ["population", "outliers"]
+        if raw_dataset_path.joinpath(group).is_dir()
+    ):
+        # Skip path that's not a directory
+        if not path.is_dir():
+            continue
+        match = RECORDING_PATTERN.match(path.stem)
+        # Skip if no match
+        if match is None:
+            continue
+        # Get metadata
+        timestamp = match[1]
+        serial_no = match[2]
+        load = match[3] == "load"
+        for file in sorted(path.glob("*.csv")):
+            # Get episode
+            ep = int(str(file)[-7:-4])
+            episodes.append((serial_no, load, ep, timestamp, file))
+    episodes.sort(key=lambda ep: ep[:3])
+    return episodes
+
+
+def read_raw(
+    file: pathlib.Path,
+    engine: str = "loadtxt",
+) -> np.ndarray:
+    """Read the used columns of a raw episode CSV.
+
+    Parameters
+    ----------
+    file : pathlib.Path
+        Raw episode CSV.
+    engine : str
+        ``"loadtxt"`` for the C parser of :func:`numpy.loadtxt` (NumPy 1.23
+        and later) or ``"pandas"`` for the C parser of
+        :func:`pandas.read_csv`. Both only convert the columns in
+        ``RAW_COLUMNS``. ``"pandas"`` may differ from ``"loadtxt"`` by one
+        unit in the last place. Run the ``benchmark_csv_reader`` task to
+        compare their throughput.
+
+    Returns
+    -------
+    np.ndarray :
+        Array with one row per sample and one column per ``RAW_COLUMNS``
+        entry.
+    """
+    if engine == "loadtxt":
+        return np.loadtxt(
+            file,
+            delimiter=",",
+            skiprows=1,
+            usecols=RAW_COLUMNS,
+        )
+    elif engine == "pandas":
+        return pandas.read_csv(
+            file,
+            header=None,
+            skiprows=1,
+            usecols=RAW_COLUMNS,
+            dtype=np.float64,
+            engine="c",
+            na_filter=False,
+        ).to_numpy()
+    else:
+        raise ValueError(f"Unknown CSV engine '{engine}'.")
+
+
+def parse_episode(
+    file: pathlib.Path,
+    t_step: float = T_STEP,
+    engine: str = "loadtxt",
+) -> Dict[str, np.ndarray]:
+    """Load and calibrate the signals of one raw episode.
+
+    Parameters
+    ----------
+    file : pathlib.Path
+        Raw episode CSV.
+    t_step : float
+        Sampling timestep (s).
+    engine : str
+        CSV engine passed to :func:`read_raw`.
+
+    Returns
+    -------
+    Dict[str, np.ndarray] :
+        Calibrated signals, keyed by column name.
+    """
+    array = read_raw(file, engine=engine)
+    # Select and shift columns to align them in time, due to bug in data
+    # acquisition software. Scaling is applied in place on views of
+    # ``array``, in the same order as an out-of-place expression.
+    joint_posvel = array[:-1, 0:2]
+    joint_posvel *= GEAR_RATIO
+    joint_posvel *= RAD_PER_DEG
+    joint_trq = array[:-1, 2]
+    joint_trq /= 100  # Percent to normalized
+    target_joint_posvel = array[1:, 3:5]
+    target_joint_posvel *= GEAR_RATIO
+    target_joint_posvel *= RAD_PER_DEG
+    # Calibrate for initial position offset due to bug in data acquisition
+    # software. The error is made row-major so the mean adds up samples in the
+    # same order regardless of the layout of ``array``.
+    error_raw = np.ascontiguousarray(
+        target_joint_posvel[500:1000, :] - joint_posvel[500:1000, :]
+    )
+    error_offset = np.mean(error_raw, axis=0)
+    # Apply offset and remove first second of recording where velocity is zero
+    joint_posvel = joint_posvel[1000:, :]
+    joint_posvel += error_offset
+    joint_trq = joint_trq[1000:]
+    target_joint_posvel = target_joint_posvel[1000:, :]
+    return {
+        "k": np.arange(target_joint_posvel.shape[0]),
+        "t": np.arange(target_joint_posvel.shape[0]) * t_step,
+        "joint_pos": joint_posvel[:, 0],
+        "joint_vel": joint_posvel[:, 1],
+        "joint_trq": joint_trq,
+        "target_joint_pos": target_joint_posvel[:, 0],
+        "target_joint_vel": target_joint_posvel[:, 1],
+    }
+
+
+def load_episode(
+    serial_no: str,
+    load: bool,
+    episode: int,
+    timestamp: str,
+    file: pathlib.Path,
+    t_step: float = T_STEP,
+) -> pandas.DataFrame:
+    """Load and calibrate one raw episode.
+
+    Parameters
+    ----------
+    serial_no : str
+        Serial number of the unit.
+    load : bool
+        True if the episode was recorded with a load.
+    episode : int
+        Episode number.
+    timestamp : str
+        Recording timestamp.
+    file : pathlib.Path
+        Raw episode CSV.
+    t_step : float
+        Sampling timestep (s).
+
+    Returns
+    -------
+    pandas.DataFrame :
+        Episode dataframe with one row per sample.
+    """
+    df = pandas.DataFrame(parse_episode(file, t_step=t_step))
+    df["serial_no"] = serial_no
+    df["load"] = load
+    df["episode"] = episode
+    df["timestamp"] = timestamp
+    return df
+
+
+def load_episodes(
+    episodes: List[Tuple[str, bool, int, str, pathlib.Path]],
+    t_step: float = T_STEP,
+    n_jobs: int = 1,
+) -> List[pandas.DataFrame]:
+    """Load many raw episodes, optionally in a process pool.
+
+    Parameters
+    ----------
+    episodes : List[Tuple[str, bool, int, str, pathlib.Path]]
+        Episodes to load, as returned by :func:`find_episodes`.
+    t_step : float
+        Sampling timestep (s).
+    n_jobs : int
+        Number of worker processes. ``1`` parses serially in this process and
+        ``-1`` uses all cores.
+
+    Returns
+    -------
+    List[pandas.DataFrame] :
+        Episode dataframes, in the same order as ``episodes``.
+    """
+    if n_jobs == 1:
+        return [load_episode(*ep, t_step=t_step) for ep in episodes]
+    # ``joblib`` returns results in submission order, so the merge order does
+    # not depend on which worker finishes first
+    return joblib.Parallel(n_jobs=n_jobs, backend="loky")(
+        joblib.delayed(load_episode)(*ep, t_step=t_step) for ep in episodes
+    )
+
+
+def iter_episodes(
+    raw_dataset_path: pathlib.Path,
+    columns: Optional[List[str]] = None,
+    t_step: float = T_STEP,
+    serial_no: Any = None,
+    load: Any = None,
+    episode: Any = None,
+) -> Iterator[Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]]]:
+    """Parse raw episodes one at a time.
+
+    Only one episode is held in memory at a time, so arbitrarily large
+    batches can be processed without building the merged dataframe. Yields
+    the same keys and arrays as :meth:`dataset_store.DatasetStore.iter_episodes`.
+
+    Parameters
+    ----------
+    raw_dataset_path : pathlib.Path
+        Batch directory containing ``population/`` and ``outliers/``.
+    columns : Optional[List[str]]
+        Signals to return. Returns all signals if ``None``.
+    t_step : float
+        Sampling timestep (s).
+    serial_no : Any
+        Serial number filter. A scalar, a list of accepted values, or ``None``
+        to accept everything.
+    load : Any
+        Load flag filter.
+    episode : Any
+        Episode number filter.
+
+    Yields
+    ------
+    Tuple[Tuple[str, bool, int], Dict[str, np.ndarray]] :
+        ``(serial_no, load, episode)`` and the episode's signals, in key
+        order.
+    """
+    for sn, ld, ep, _, file in find_episodes(raw_dataset_path):
+        if not (
+            _accepts(sn, serial_no) and _accepts(ld, load) and _accepts(ep, episode)
+        ):
+            continue
+        arrays = parse_episode(file, t_step=t_step)
+        if columns is not None:
+            arrays = {name: arrays[name] for name in columns}
+        yield (sn, ld, ep), arrays
+
+
+def diff_manifest(
+    raw_dataset_path: pathlib.Path,
+    episodes: List[Tuple[str, bool, int, str, pathlib.Path]],
+    manifest: Dict[str, Dict[str, Any]],
+) -> Tuple[
+    List[Tuple[str, bool, int, str, pathlib.Path]],
+    List[Tuple[str, bool, int]],
+    Dict[str, Dict[str, Any]],
+]:
+    """Find episode files that are new or changed since the last ingest.
+
+    A file is unchanged if its size and modification time match the manifest.
+    Otherwise, its content hash is compared, so touched but identical files
+    are not parsed again.
+
+    Parameters
+    ----------
+    raw_dataset_path : pathlib.Path
+        Batch directory. Manifest entries are relative to it.
+    episodes : List[Tuple[str, bool, int, str, pathlib.Path]]
+        Episodes currently on disk, as returned by :func:`find_episodes`.
+    manifest : Dict[str, Dict[str, Any]]
+        Manifest of previously ingested files. Empty if nothing has been
+        ingested yet.
+
+    Returns
+    -------
+    Tuple[List[Tuple[str, bool, int, str, pathlib.Path]], List[Tuple[str, bool, int]], Dict[str, Dict[str, Any]]] :
+        Episodes to parse, keys of episodes whose files were removed, and the
+        updated manifest.
+    """
+    to_parse = []
+    new_manifest = {}
+    for ep in episodes:
+        serial_no, load, episode, timestamp, file = ep
+        name = file.relative_to(raw_dataset_path).as_posix()
+        stat = file.stat()
+        entry = {
+            "serial_no": serial_no,
+            "load": load,
+            "episode": episode,
+            "timestamp": timestamp,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        old_entry = manifest.get(name)
+        same_key = old_entry is not None and all(
+            old_entry[k] == entry[k] for k in ["serial_no", "load", "episode", "timestamp"]
+        )
+        if (
+            same_key
+            and old_entry["size"] == entry["size"]
+            and old_entry["mtime_ns"] == entry["mtime_ns"]
+        ):
+            entry["sha256"] = old_entry["sha256"]
+        else:
+            entry["sha256"] = _sha256(file)
+            if not same_key or old_entry["sha256"] != entry["sha256"]:
+                to_parse.append(ep)
+        new_manifest[name] = entry
+    removed = [
+        (entry["serial_no"], entry["load"], entry["episode"])
+        for name, entry in manifest.items()
+        if name not in new_manifest
+    ]
+    return to_parse, removed, new_manifest
+
+
+def manifest_unchanged(
+    raw_dataset_path: pathlib.Path,
+    manifest_path: pathlib.Path,
+) -> bool:
+    """Check if a raw dataset matches its manifest, using file stats only.
+
+    Meant to be used as a ``doit`` ``uptodate`` check.
+
+    Parameters
+    ----------
+    raw_dataset_path : pathlib.Path
+        Batch directory.
+    manifest_path : pathlib.Path
+        Manifest written by the last ingest.
+
+    Returns
+    -------
+    bool :
+        True if no episode file was added, removed, or modified.
+    """
+    if not manifest_path.exists():
+        return False
+    manifest = json.loads(manifest_path.read_text())
+    episodes = find_episodes(raw_dataset_path)
+    if len(episodes) != len(manifest):
+        return False
+    for *_, file in episodes:
+        entry = manifest.get(file.relative_to(raw_dataset_path).as_posix())
+        if entry is None:
+            return False
+        stat = file.stat()
+        if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            return False
+    return True
+
+
+def partition_digests(manifest: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Summarize the contents of each unit's episode files.
+
+    Parameters
+    ----------
+    manifest : Dict[str, Dict[str, Any]]
+        Manifest of a batch, as returned by :func:`diff_manifest`.
+
+    Returns
+    -------
+    Dict[str, str] :
+        SHA-256 digest over the names and content hashes of each serial
+        number's files. It changes if and only if one of them does.
+    """
+    files = {}
+    for name, entry in sorted(manifest.items()):
+        files.setdefault(entry["serial_no"], []).append([name, entry["sha256"]])
+    return {
+        serial_no: hashlib.sha256(json.dumps(sn_files).encode()).hexdigest()
+        for serial_no, sn_files in files.items()
+    }
+
+
+def _sha256(file: pathlib.Path) -> str:
+    """Compute the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with file.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _accepts(value: Any, accepted: Any) -> bool:
+    """Check a key value against a scalar, list, or ``None`` filter."""
+    if accepted is None:
+        return True
+    if np.ndim(accepted) == 0:
+        return value == accepted
+    return value in list(accepted)
@@ -0,0 +1,220 @@
+"""Generate synthetic raw datasets for scaling benchmarks.
+
+Batches are written in the same layout as the recorded data::
+
+    <batch>/population/<timestamp>_<serial_no>_<load|noload>/episode_NNN.csv
+    <batch>/outliers/<timestamp>_<serial_no>_<load|noload>/episode_NNN.csv
+
+Each unit is a perturbed copy of a nominal closed-loop joint model: a linear
+velocity and position loop tracking a piecewise-constant target velocity,
+plus the position-dependent ``sin(100 * theta + phi)`` ripple that the
+Koopman lifting function captures. Outliers are drawn with larger
+perturbations. The raw files reproduce the quirks that preprocessing corrects
+for: motor-side units, torque in percent, an initial position offset, and
+target columns lagging the measured columns by one sample.
+"""
+
+import datetime
+import pathlib
+from typing import Any, Dict
+
+import numpy as np
+
+import raw_dataset
+
+# Header of the synthetic CSV files (skipped when loading)
+HEADER = "k,joint_pos,joint_vel,joint_trq,target_joint_pos,target_joint_vel"
+# Nominal unit parameters, with relative spread of each parameter for
+# population and outlier units
+NOMINAL_PARAMETERS = {
+    # Velocity loop gain per sample
+    "vel_gain": (0.2, 0.05, 0.3),
+    # Position loop gain per sample
+    "pos_gain": (0.02, 0.05, 0.3),
+    # Velocity ripple amplitude (rad/s)
+    "ripple": (0.02, 0.2, 2),
+    # Inertia (normalized torque s^2/rad)
+    "inertia": (2e-4, 0.1, 0.5),
+    # Viscous friction (normalized torque s/rad)
+    "viscous": (0.01, 0.1, 0.5),
+    # Coulomb friction (normalized torque)
+    "coulomb": (0.05, 0.1, 0.5),
+}
+# Joint target speeds (rad/s)
+SPEED_RANGE = (3.5, 5.5)
+# Constant-velocity segment lengths (samples)
+SEGMENT_RANGE = (700, 1500)
+# Samples at zero velocity at the start of every episode, used by
+# preprocessing to calibrate the position offset
+N_IDLE = 1000
+
+
+def unit_parameters(
+    rng: np.random.Generator,
+    outlier: bool = False,
+) -> Dict[str, float]:
+    """Draw the parameters of one unit.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Random number generator.
+    outlier : bool
+        Use the larger outlier spread.
+
+    Returns
+    -------
+    Dict[str, float] :
+        Model parameters, plus the ripple phase ``phase``.
+    """
+    params = {}
+    for name, (nominal, spread, outlier_spread) in NOMINAL_PARAMETERS.items():
+        sigma = outlier_spread if outlier else spread
+        params[name] = nominal * np.exp(rng.normal(0, sigma))
+    params["phase"] = rng.uniform(0, 2 * np.pi)
+    return params
+
+
+def simulate_episodes(
+    params: Dict[str, float],
+    n_episodes: int,
+    n_samples: int,
+    load: bool,
+    rng: np.random.Generator,
+    t_step: float = raw_dataset.T_STEP,
+) -> np.ndarray:
+    """Simulate raw recordings of several episodes of one unit.
+
+    All episodes are simulated at once, one sample at a time.
+
+    Parameters
+    ----------
+    params : Dict[str, float]
+        Unit parameters from :func:`unit_parameters`.
+    n_episodes : int
+        Number of episodes.
+    n_samples : int
+        Number of samples per episode, including ``N_IDLE`` idle samples.
+    load : bool
+        Simulate a load, which slows the velocity loop, amplifies the
+        ripple, and adds a position-dependent torque.
+    rng : np.random.Generator
+        Random number generator.
+    t_step : float
+        Sampling timestep (s).
+
+    Returns
+    -------
+    np.ndarray :
+        Raw recordings with shape ``(n_episodes, n_samples, 6)``, with columns
+        in raw file order.
+    """
+    vel_gain = params["vel_gain"] * (0.8 if load else 1)
+    ripple = params["ripple"] * (1.5 if load else 1)
+    load_trq = 0.1 if load else 0
+    # Piecewise-constant target velocity after the idle period
+    tvel = np.zeros((n_episodes, n_samples))
+    for i in range(n_episodes):
+        k = N_IDLE
+        direction = rng.choice([-1, 1])
+        while k < n_samples:
+            length = rng.integers(*SEGMENT_RANGE, endpoint=True)
+            tvel[i, k : k + length] = direction * rng.uniform(*SPEED_RANGE)
+            direction *= -1
+            k += length
+    tpos = np.cumsum(tvel, axis=1) * t_step
+    # Closed-loop response
+    pos = np.zeros((n_episodes, n_samples))
+    vel = np.zeros((n_episodes, n_samples))
+    for k in range(1, n_samples):
+        vel[:, k] = (
+            vel[:, k - 1]
+            + vel_gain * (tvel[:, k - 1] - vel[:, k - 1])
+            + params["pos_gain"] * (tpos[:, k - 1] - pos[:, k - 1]) / t_step
+            + ripple * np.sin(100 * pos[:, k - 1] + params["phase"])
+        )
+        pos[:, k] = pos[:, k - 1] + vel[:, k] * t_step
+    acc = np.diff(vel, axis=1, prepend=0) / t_step
+    trq = (
+        params["inertia"] * acc
+        + params["viscous"] * vel
+        + params["coulomb"] * np.tanh(vel / 0.1)
+        + load_trq * np.sin(pos)
+        + rng.normal(0, 0.005, vel.shape)
+    )
+    vel_meas = vel + rng.normal(0, 0.005, vel.shape)
+    # Position offset, corrected by preprocessing
+    pos_meas = pos + rng.uniform(-0.01, 0.01, (n_episodes, 1))
+    # Convert joint-side SI units to motor-side raw units
+    scale = 1 / (raw_dataset.GEAR_RATIO * raw_dataset.RAD_PER_DEG)
+    raw = np.empty((n_episodes, n_samples, 6))
+    raw[:, :, 0] = np.arange(n_samples)
+    raw[:, :, 1] = pos_meas * scale
+    raw[:, :, 2] = vel_meas * scale
+    raw[:, :, 3] = trq * 100
+    # Target columns lag by one sample
+    raw[:, 1:, 4] = tpos[:, :-1] * scale
+    raw[:, 1:, 5] = tvel[:, :-1] * scale
+    raw[:, 0, 4:6] = 0
+    return raw
+
+
+def generate_batch(
+    batch_path: pathlib.Path,
+    n_units: int = 10,
+    n_outliers: int = 1,
+    n_episodes: int = 20,
+    n_samples: int = 4000,
+    seed: int = 0,
+    t_step: float = raw_dataset.T_STEP,
+) -> Dict[str, Any]:
+    """Write a synthetic raw data batch.
+
+    Parameters
+    ----------
+    batch_path : pathlib.Path
+        Batch directory to create.
+    n_units : int
+        Number of population units.
+    n_outliers : int
+        Number of outlier units.
+    n_episodes : int
+        Number of episodes per unit and load condition.
+    n_samples : int
+        Number of samples per episode.
+    seed : int
+        Random seed.
+    t_step : float
+        Sampling timestep (s).
+
+    Returns
+    -------
+    Dict[str, Any] :
+        Parameters of each unit, keyed by serial number.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2023, 1, 1)
+    units = {}
+    for i in range(n_units + n_outliers):
+        outlier = i >= n_units
+        serial_no = f"{i + 1:06d}"
+        params = unit_parameters(rng, outlier=outlier)
+        units[serial_no] = dict(params, outlier=outlier)
+        timestamp = (start + datetime.timedelta(hours=i)).strftime("%Y%m%dT%H%M%S")
+        for load in [False, True]:
+            recording_path = batch_path.joinpath(
+                "outliers" if outlier else "population",
+                f"{timestamp}_{serial_no}_{'load' if load else 'noload'}",
+            )
+            recording_path.mkdir(parents=True, exist_ok=True)
+            raw = simulate_episodes(params, n_episodes, n_samples, load, rng, t_step)
+            for ep in range(n_episodes):
+                np.savetxt(
+                    recording_path.joinpath(f"episode_{ep:03d}.csv"),
+                    raw[ep],
+                    fmt="%.10g",
+                    delimiter=",",
+                    header=HEADER,
+                    comments="",
+                )
+    return units